@@ -1,4 +1,6 @@
-import os
+from tools.lazy import defer_imports
+from tools.output import write_template
+defer_imports()
 
 from troposphere import Parameter, Ref, Template, Output
 import troposphere.appstream as appstr
@@ -12,10 +14,8 @@ from troposphere.ec2 import (
     VPCEndpoint,
 )
 
-from troposphere.s3 import Bucket, Private
-
 t = Template()
-t.add_version('2010-09-09')
+t.set_version('2010-09-09')
 
 ## -- Parameters
 VpcName = t.add_parameter(
@@ -59,7 +59,7 @@ InstanceType = t.add_parameter(
     )
 )
 
-AppStreamStackName = t.add_parameteR(
+AppStreamStackName = t.add_parameter(
     Parameter(
         "AppStreamStackName",
         Description="Name of the AppStream Stack",
@@ -164,7 +164,6 @@ AppStreamFleet = t.add_resource(
             SecurityGroupIds=[Ref("AppStreamSG")],
             SubnetIds=[Ref("SubnetId")],
         ),
-        DependsOn="AppStreamSG",
     )
 )
 
@@ -183,7 +182,6 @@ AppStreamStack = t.add_resource(
             ResourceIdentifier=Ref(AppStreamSettingsGroup),
         )],
         Tags=Tags(Name="App Stream Stack"),
-        DependsOn=["AppStreamFleet"],
     )
 )
 
@@ -192,7 +190,6 @@ AppStreamAssociation = t.add_resource(
         "AppStreamAssociation",
         FleetName=Ref("AppStreamFleet"),
         StackName=Ref("AppStreamStack"),
-        DependsOn=[ "AppStreamFleet", "AppStreamStack" ],
     )
 )
 
@@ -213,11 +210,9 @@ AppStreamUserAssoc = t.add_resource(
         SendEmailNotification='true',
         StackName=Ref("AppStreamStack"),
         UserName=Ref(AppStreamUserEmail),
-        DependsOn=["AppStreamUser", "AppStreamStack"]
+        DependsOn=["AppStreamUser"]
     )
 )
 
 ## -- Print Template
-f1 = open('./' + (os.path.splitext(os.path.basename(__file__))[0]) + '.json', 'w+')
-print(t.to_json(), file=f1)
-print(t.to_json())
+write_template(t, __file__)
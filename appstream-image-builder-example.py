@@ -1,4 +1,6 @@
-import os
+from tools.lazy import defer_imports
+from tools.output import write_template
+defer_imports()
 
 from troposphere import GetAtt, Output, Parameter, Ref, Template
 import troposphere.appstream as appstr
@@ -12,7 +14,7 @@ from troposphere.ec2 import (
 )
 
 t = Template()
-t.add_version('2010-09-09')
+t.set_version('2010-09-09')
 
 ## -- Parameters
 VpcId = t.add_parameter(
@@ -102,7 +104,6 @@ AppStreamImageBuilder = t.add_resource(
             SecurityGroupIds=[Ref("AppStreamSG")],
             SubnetIds=[Ref("SubnetId")],
         ),
-        DependsOn="AppStreamSG",
     )
 )
 
@@ -116,6 +117,4 @@ oStreamingURL = t.add_output(
 )
 
 ## -- Print Template
-f1 = open('./' + (os.path.splitext(os.path.basename(__file__))[0]) + '.json', 'w+')
-print(t.to_json(), file=f1)
-print(t.to_json())
+write_template(t, __file__)
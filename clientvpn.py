@@ -0,0 +1,434 @@
+"""Client VPN template engine shared by the split and full tunnel examples.
+
+``build_template`` creates the SimpleAD directory (with a generated admin
+password), the ACM certificate and the Client VPN endpoint, then one target
+network association per subnet, one authorization rule per entry in
+``auth_rules`` and one route per subnet and destination in ``routes``. Each
+route DependsOn the association of its subnet, since routes can only target
+associated subnets.
+
+Subnets and rule targets are either literal values (``subnet-...`` ids and
+CIDRs) or the names of template parameters to create. Associations are
+``AssociateVPNEndpoint<N>`` in subnet order; append subnets to keep their ids
+stable. Rules and routes are named after their target or destination, so
+adding or removing one never renames the others: ``ClientVPNAuthRule<target>``
+and ``ClientVpnRoute<destination>Subnet<N>``, with the CIDR written as
+``10x1x0x0n16`` for 10.1.0.0/16.
+"""
+import argparse
+import ipaddress
+import os
+import re
+
+# Certificate Manager is a custom Troposphere Plugin. Install it through pip:
+# https://pypi.org/project/troposphere-dns-certificate/
+import troposphere_dns_certificate.certificatemanager as certmgr
+
+from troposphere import Parameter, Ref, Template, GetAtt
+from troposphere.awslambda import Function
+from troposphere.cloudformation import AWSCustomObject
+from troposphere.directoryservice import (
+    VpcSettings,
+    SimpleAD,
+)
+from troposphere.ec2 import (
+    ClientVpnEndpoint,
+    ClientVpnRoute,
+    ClientVpnTargetNetworkAssociation,
+    ClientVpnAuthorizationRule,
+    ClientAuthenticationRequest,
+    ConnectionLogOptions,
+    DirectoryServiceAuthenticationRequest,
+    Tags,
+    TagSpecifications,
+)
+from troposphere.iam import Role
+from troposphere.logs import LogGroup, LogStream
+from troposphere.ssm import (
+    Parameter as SSMParameter,
+)
+
+from clientvpn_routes import CLIENT_CIDR, ROUTE_QUOTA, RULE_QUOTA, plan_routes, read_destinations
+from tools.package import lambda_code
+
+PASSWORD_HANDLER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lambda", "password", "index.py")
+INTERNET = "0.0.0.0/0"
+VPC_RULE = ("TargetCidrRange", "Access to Private VPC Network")
+INTERNET_RULE = (INTERNET, "Access to the Internet")
+INTERNET_ROUTE = (INTERNET, "Access to the Internet")
+
+# The directory and certificate are slow to create and rarely change; the
+# endpoint, associations and rules change often. Resources that are not listed
+# join the first layer that uses them (see tools/layers.py).
+LAYERS = [
+    ("identity", ["LambdaPassword", "ADDomain", "OutputPassword"]),
+    ("certificate", ["TestCertificate"]),
+    ("network", ["TestClientVpnEndpoint"]),
+]
+
+
+## -- Custom Resource
+class CustomPassword(AWSCustomObject):
+    resource_type = "Custom::Password"
+
+    props = {
+        'ServiceToken': (str, True),
+        'Length': (int, True)
+    }
+
+
+def _is_cidr(value):
+    try:
+        ipaddress.ip_network(value)
+    except ValueError:
+        return False
+    return True
+
+
+def _logical_id(prefix, value, suffix=""):
+    """Return ``prefix`` + ``value`` (a CIDR or parameter name) as a logical id."""
+    name = re.sub(r"[./:]", lambda m: {".": "x", "/": "n", ":": "c"}[m.group()], str(value))
+    return f"{prefix}{name}{suffix}"
+
+
+def _value(t, value, description, is_literal):
+    """Return ``value`` itself, or a Ref to a parameter of that name (created once)."""
+    if is_literal(value):
+        return value
+    if value not in t.parameters:
+        if description is None:
+            t.add_parameter(Parameter(value, Type="String"))
+        else:
+            t.add_parameter(Parameter(value, Description=description, Type="String"))
+    return Ref(value)
+
+
+def build_template(subnets, auth_rules=(VPC_RULE,), routes=(), split_tunnel=True,
+                   client_cidr=CLIENT_CIDR, log_retention_days=None):
+    """Return the Client VPN template.
+
+    ``subnets`` are the subnets to associate, or (subnet, parameter description)
+    pairs where None leaves the description out. ``auth_rules`` are (target,
+    description) pairs and ``routes`` (destination CIDR, description) pairs added
+    for every subnet; see clientvpn_routes.plan_routes for aggregating the routes.
+    ``client_cidr`` is the default of the ClientCidr parameter. With
+    ``log_retention_days`` connection logs go to a new CloudWatch log group
+    kept that many days (see clientvpn_logs.py for analyzing them).
+    """
+    if not subnets:
+        raise ValueError("at least one subnet must be associated")
+    for destination, _ in routes:
+        ipaddress.ip_network(destination)
+
+    ## -- Start the Template
+    t = Template()
+    t.set_version('2010-09-09')
+
+    ## -- Parameters
+    ClientCidr = t.add_parameter(
+        Parameter(
+            "ClientCidr",
+            Description="CIDR Range of the VPN",
+            Default=client_cidr,
+            Type="String",
+        )
+    )
+
+    VpcName = t.add_parameter(
+        Parameter(
+            "VpcName",
+            Description="ID of the VPC",
+            Type="String",
+        )
+    )
+
+    t.add_parameter(
+        Parameter(
+            "TargetCidrRange",
+            Description="IP Range within the VPC that you want access to over the VPN",
+            Type="String",
+            Default="172.18.0.0/16"
+        )
+    )
+
+    PublicSubnetIds = t.add_parameter(
+        Parameter(
+            "PublicSubnetIds",
+            Description="Comma Delimited List of Subnet IDs",
+            Type="CommaDelimitedList",
+        )
+    )
+
+    SimpleADSize = t.add_parameter(
+        Parameter(
+            "SimpleADSize",
+            Description="Select the size for the SimpleAD Instance",
+            Default="Small",
+            AllowedValues=['Small', 'Large'],
+            Type="String"
+        )
+    )
+
+    SimpleADDescription = t.add_parameter(
+        Parameter(
+            "SimpleADDescription",
+            Description="Add a Description for the SimpleAD Instance",
+            Type="String"
+        )
+    )
+
+    SimpleADName = t.add_parameter(
+        Parameter(
+            "SimpleADName",
+            Description="Enter a name for the SimpleAD Instance (ex: corp.example.com)",
+            Type="String",
+        )
+    )
+
+    DNSHostName = t.add_parameter(
+        Parameter(
+            "DNSHostName",
+            Type="String",
+            Description="Hostname of the Certificate to be Created",
+        )
+    )
+
+    HostedZone = t.add_parameter(
+        Parameter(
+            "HostedZone",
+            Type="String",
+            Description="Id of the Hosted Zone the DNS records need to be created in"
+        )
+    )
+
+    ## -- Resources
+    t.add_resource(
+        Role(
+            "LambdaExecutionRole",
+            AssumeRolePolicyDocument={
+                'Statement': [{
+                    'Effect': 'Allow',
+                    'Principal': {'Service': ['lambda.amazonaws.com']},
+                    'Action': ["sts:AssumeRole"]
+                }]
+            },
+        )
+    )
+
+    t.add_resource(
+        Function(
+            "LambdaFunction",
+            Code=lambda_code(PASSWORD_HANDLER),
+            Handler="index.lambda_handler",
+            Role=GetAtt("LambdaExecutionRole", "Arn"),
+            Timeout=30,
+            Runtime="python3.6"
+        )
+    )
+
+    LambdaPassword = t.add_resource(
+        CustomPassword(
+            "LambdaPassword",
+            Length=22,
+            ServiceToken=GetAtt("LambdaFunction", "Arn")
+        )
+    )
+
+    t.add_resource(
+        SimpleAD(
+            "ADDomain",
+            Description=Ref(SimpleADDescription),
+            Name=Ref(SimpleADName),
+            Password=Ref(LambdaPassword),
+            Size=Ref(SimpleADSize),
+            VpcSettings=VpcSettings(
+                SubnetIds=Ref(PublicSubnetIds),
+                VpcId=Ref(VpcName)
+            )
+        )
+    )
+
+    t.add_resource(certmgr.Certificate(
+        'TestCertificate',
+        ValidationMethod='DNS',
+        DomainName=Ref(DNSHostName),
+        DomainValidationOptions=[
+            certmgr.DomainValidationOption(
+                DomainName=Ref(DNSHostName),
+                HostedZoneId=Ref(HostedZone),
+            )
+        ],
+        Tags=[{
+            'Key': 'Name',
+            'Value': 'Test Cert'
+        }]
+    ))
+
+    log_options = ConnectionLogOptions(Enabled=False)
+    if log_retention_days:
+        log_group = t.add_resource(
+            LogGroup(
+                "ClientVpnLogGroup",
+                RetentionInDays=log_retention_days,
+            )
+        )
+        log_stream = t.add_resource(
+            LogStream(
+                "ClientVpnLogStream",
+                LogGroupName=Ref(log_group),
+            )
+        )
+        log_options = ConnectionLogOptions(
+            Enabled=True,
+            CloudwatchLogGroup=Ref(log_group),
+            CloudwatchLogStream=Ref(log_stream),
+        )
+
+    TestClientVpnEndpoint = t.add_resource(
+        ClientVpnEndpoint(
+            "TestClientVpnEndpoint",
+            AuthenticationOptions=[
+                ClientAuthenticationRequest(
+                    Type="directory-service-authentication",
+                    ActiveDirectory=DirectoryServiceAuthenticationRequest(
+                        DirectoryId=Ref("ADDomain")
+                    ),
+                )
+            ],
+            ClientCidrBlock=Ref(ClientCidr),
+            ConnectionLogOptions=log_options,
+            Description="Test Client VPN Endpoint",
+            DnsServers=GetAtt("ADDomain", "DnsIpAddresses"),
+            ServerCertificateArn=Ref("TestCertificate"),
+            TagSpecifications=[
+                TagSpecifications(
+                    ResourceType="client-vpn-endpoint",
+                    Tags=Tags(Purpose="Production"),
+                )
+            ],
+            TransportProtocol="udp",
+            SplitTunnel=split_tunnel,
+        )
+    )
+
+    ## -- Associations, authorization rules and routes
+    targets = []
+    for i, subnet in enumerate(subnets, 1):
+        subnet, description = subnet if isinstance(subnet, tuple) else \
+            (subnet, f"Subnet {i} to associate with the Client VPN endpoint")
+        target = _value(t, subnet, description, lambda value: value.startswith("subnet-"))
+        association = t.add_resource(
+            ClientVpnTargetNetworkAssociation(
+                f"AssociateVPNEndpoint{i}",
+                ClientVpnEndpointId=Ref(TestClientVpnEndpoint),
+                SubnetId=target,
+            )
+        )
+        targets.append((target, association))
+
+    for network, description in auth_rules:
+        target = str(ipaddress.ip_network(network)) if _is_cidr(network) else network
+        title = _logical_id("ClientVPNAuthRule", target)
+        if title in t.resources:
+            raise ValueError(f"more than one authorization rule for {network}")
+        t.add_resource(
+            ClientVpnAuthorizationRule(
+                title,
+                ClientVpnEndpointId=Ref(TestClientVpnEndpoint),
+                AuthorizeAllGroups=True,
+                TargetNetworkCidr=_value(t, network, description, _is_cidr),
+                Description=description
+            )
+        )
+
+    for destination, description in routes:
+        for i, (target, association) in enumerate(targets, 1):
+            t.add_resource(
+                ClientVpnRoute(
+                    _logical_id("ClientVpnRoute", ipaddress.ip_network(destination), f"Subnet{i}"),
+                    ClientVpnEndpointId=Ref(TestClientVpnEndpoint),
+                    TargetVpcSubnetId=target,
+                    DestinationCidrBlock=destination,
+                    Description=description,
+                    DependsOn=[association.title],
+                )
+            )
+
+    ## -- Output
+    t.add_resource(
+        SSMParameter(
+            "OutputPassword",
+            Name="/AD/ADAdminPassword",
+            Type="String",
+            Value=Ref(LambdaPassword),
+            Description="AD Admin Password"
+        )
+    )
+
+    t.add_resource(
+        SSMParameter(
+            "OutputVPNEndpoint",
+            Name="/VPN/OutputVPNEndpoint",
+            Type="String",
+            Value=Ref(TestClientVpnEndpoint),
+            Description="Id of the AWS Client VPN"
+        )
+    )
+
+    return t
+
+
+def _pair(text):
+    value, _, description = text.partition("=")
+    return value, description or f"Access to {value}"
+
+
+def _route(text):
+    destination, description = _pair(text)
+    if not _is_cidr(destination):
+        raise argparse.ArgumentTypeError(f"{destination} is not a CIDR")
+    return destination, description
+
+
+def parse_args(subnets, auth_rules, routes, split_tunnel, description):
+    """Parse the shared command line; the arguments are the script's defaults."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--subnet", action="append", dest="subnets",
+                        help="subnet id or parameter name to associate (repeatable)")
+    parser.add_argument("--authorize", action="append", type=_pair, dest="auth_rules",
+                        metavar="CIDR[=DESCRIPTION]",
+                        help="authorization rule target, CIDR or parameter name (repeatable)")
+    parser.add_argument("--route", action="append", type=_route, dest="routes",
+                        metavar="CIDR[=DESCRIPTION]", help="route added for every subnet (repeatable)")
+    parser.add_argument("--routes-file", metavar="CSV",
+                        help="more route destinations, from the Cidr and Description columns")
+    parser.add_argument("--client-cidr", default=CLIENT_CIDR, help="CIDR range assigned to clients")
+    parser.add_argument("--route-quota", type=int, default=ROUTE_QUOTA, help="routes per endpoint")
+    parser.add_argument("--rule-quota", type=int, default=RULE_QUOTA,
+                        help="authorization rules per endpoint")
+    tunnel = parser.add_mutually_exclusive_group()
+    tunnel.add_argument("--split-tunnel", action="store_true", dest="split_tunnel", default=split_tunnel,
+                        help="only send traffic for the routes over the VPN")
+    tunnel.add_argument("--full-tunnel", action="store_false", dest="split_tunnel",
+                        help="send all traffic over the VPN")
+    parser.add_argument("--connection-logs", nargs="?", type=int, const=30, metavar="DAYS",
+                        dest="log_retention_days",
+                        help="log connections to a new CloudWatch log group (kept 30 days by default)")
+    parser.add_argument("--layered", action="store_true",
+                        help="write one template per layer, deployed in order")
+    args = parser.parse_args()
+    args.subnets = args.subnets or list(subnets)
+    args.auth_rules = args.auth_rules or list(auth_rules)
+    args.routes = args.routes or list(routes)
+    if args.routes_file:
+        args.routes += [(str(network), text) for network, text in read_destinations(args.routes_file)]
+
+    # Collapse the destinations and authorize the ones no rule covers yet.
+    try:
+        plan = plan_routes(args.routes, args.auth_rules, len(args.subnets), args.client_cidr,
+                           args.route_quota, args.rule_quota)
+    except ValueError as e:
+        parser.error(str(e))
+    args.routes = plan.routes
+    args.auth_rules += plan.rules
+    return args
@@ -0,0 +1,269 @@
+"""Analyze exported Client VPN connection logs offline.
+
+Reads the connection log events that the ``--connection-logs`` option of the
+Client VPN scripts sends to CloudWatch Logs, one event per line: the bare
+JSON event, an S3 export line (``<timestamp> <event>``) or a
+``filter-log-events`` event (``{"logStreamName": ..., "message": "<event>"}``,
+e.g. from ``jq -c '.events[]'``). Files may be gzipped; each is streamed in
+its own worker process and reduced to one record per connection.
+
+Reports the peak number of concurrent sessions, sessions and bytes per
+association, sessions per hour and how many subnet associations the endpoint
+needs for the peak. Connections are grouped by the ``--association NAME=CIDR``
+range their client IP is in, otherwise by log stream.
+
+    python clientvpn_logs.py logs/*.gz [--association a=10.0.0.0/23 ...] [--headroom 1.5]
+"""
+import argparse
+import gzip
+import ipaddress
+import json
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import accumulate
+
+from clientvpn_routes import PrefixIndex
+
+HOUR = 3600
+# Concurrent connections per endpoint by number of associated subnets.
+CONNECTION_CAPACITY = {1: 7000, 2: 36500, 3: 66500, 4: 96500, 5: 126000}
+# One association per Availability Zone keeps the endpoint up when a zone fails.
+MIN_ASSOCIATIONS = 2
+HEADROOM = 1.5
+UNKNOWN = "(unknown)"
+
+
+## -- Streaming logs
+_epochs = {}
+
+
+def _epoch(text):
+    value = _epochs.get(text)
+    if value is None:
+        value = _epochs[text] = int(datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp())
+    return value
+
+
+def parse_line(line):
+    """Return (log stream or None, event dict) for one exported log line, or None."""
+    start = line.find("{")
+    if start < 0:
+        return None
+    try:
+        event = json.loads(line[start:])
+    except ValueError:
+        return None
+    if "message" in event:
+        try:
+            return event.get("logStreamName"), json.loads(event["message"])
+        except ValueError:
+            return None
+    return None, event
+
+
+_associations = None
+
+
+def _init(associations):
+    global _associations
+    _associations = associations
+
+
+def _group(stream, event):
+    if _associations is not None:
+        try:
+            match = _associations.lookup(ipaddress.IPv4Network(event.get("client-ip", "")))
+        except ValueError:
+            match = None
+        return match[1] if match else UNKNOWN
+    return stream or event.get("client-vpn-endpoint-id", UNKNOWN)
+
+
+def read_file(path):
+    """Return ({connection id: [start, end, bytes, group]}, failed attempts, unparsed lines)."""
+    connections = {}
+    failed = set()
+    unparsed = 0
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="replace") as log:
+        for line in log:
+            parsed = parse_line(line)
+            if parsed is None or "connection-id" not in parsed[1]:
+                unparsed += line.strip() != ""
+                continue
+            stream, event = parsed
+            connection = event["connection-id"]
+            if event.get("connection-attempt-status") == "failed":
+                failed.add(connection)
+                continue
+            try:
+                start = _epoch(event["connection-start-time"])
+                end_text = event.get("connection-end-time", "NA")
+                # Sessions still open when the log ends last until their last update.
+                end = _epoch(event["connection-last-update-time"] if end_text == "NA" else end_text)
+                total = int(event.get("ingress-bytes", 0)) + int(event.get("egress-bytes", 0))
+            except (KeyError, ValueError):
+                unparsed += 1
+                continue
+            record = connections.get(connection)
+            if record is None:
+                connections[connection] = [start, end, total, _group(stream, event)]
+            else:
+                # Byte counters are cumulative per connection.
+                record[0] = min(record[0], start)
+                record[1] = max(record[1], end)
+                record[2] = max(record[2], total)
+    return connections, failed, unparsed
+
+
+def read_logs(paths, associations=None, workers=None):
+    """Merge the per-file records of ``paths``; see read_file."""
+    connections = {}
+    failed = set()
+    unparsed = 0
+
+    def merge(results):
+        nonlocal unparsed
+        for file_connections, file_failed, file_unparsed in results:
+            for connection, record in file_connections.items():
+                known = connections.get(connection)
+                if known is None:
+                    connections[connection] = record
+                else:
+                    known[0] = min(known[0], record[0])
+                    known[1] = max(known[1], record[1])
+                    known[2] = max(known[2], record[2])
+            failed.update(file_failed)
+            unparsed += file_unparsed
+
+    if len(paths) < 2 or workers == 1:
+        _init(associations)
+        merge(map(read_file, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init,
+                                 initargs=(associations,)) as pool:
+            merge(pool.map(read_file, paths))
+    return connections, failed - connections.keys(), unparsed
+
+
+## -- Aggregation
+def summarize(connections):
+    """Aggregate the connection records.
+
+    Starts and ends are packed into flat arrays; the peak comes from a merge of
+    the sorted starts and ends. ``hourly`` is (sessions connected at some point
+    in the hour, sessions started) per hour, from a running sum over a
+    difference array.
+    """
+    starts = array("q", sorted(record[0] for record in connections.values()))
+    ends = array("q", sorted(record[1] for record in connections.values()))
+    peak = peak_time = active = 0
+    i = j = 0
+    while i < len(starts):
+        # A session ending at the second another starts has already left.
+        if j < len(ends) and ends[j] <= starts[i]:
+            active -= 1
+            j += 1
+        else:
+            active += 1
+            if active > peak:
+                peak, peak_time = active, starts[i]
+            i += 1
+
+    groups = {}
+    for start, end, total, group in connections.values():
+        entry = groups.setdefault(group, [0, 0])
+        entry[0] += 1
+        entry[1] += total
+
+    first = starts[0] // HOUR if starts else 0
+    hours = (ends[-1] // HOUR - first + 1) if starts else 0
+    delta = array("q", bytes(8 * (hours + 1)))
+    started = array("q", bytes(8 * hours))
+    for start, end, _, _ in connections.values():
+        delta[start // HOUR - first] += 1
+        delta[end // HOUR - first + 1] -= 1
+        started[start // HOUR - first] += 1
+    hourly = list(zip(accumulate(delta[:hours]), started))
+    return {
+        "sessions": len(connections),
+        "peak": peak,
+        "peak_time": peak_time,
+        "groups": groups,
+        "first_hour": first * HOUR,
+        "hourly": hourly,
+    }
+
+
+def recommend(peak, headroom=HEADROOM):
+    """Return the number of subnet associations for ``peak`` concurrent sessions, or None."""
+    needed = peak * headroom
+    for count, capacity in sorted(CONNECTION_CAPACITY.items()):
+        if count >= MIN_ASSOCIATIONS and capacity >= needed:
+            return count
+    return None
+
+
+def _time(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M")
+
+
+def _association(text):
+    name, _, cidr = text.partition("=")
+    try:
+        return ipaddress.IPv4Network(cidr), name
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected NAME=CIDR, got {text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze exported Client VPN connection logs")
+    parser.add_argument("logs", nargs="+", help="exported connection log files (.gz allowed)")
+    parser.add_argument("--association", action="append", type=_association, default=[],
+                        metavar="NAME=CIDR", help="group client IPs in CIDR as NAME (repeatable)")
+    parser.add_argument("--headroom", type=float, default=HEADROOM,
+                        help="capacity to plan per concurrent session at the peak")
+    parser.add_argument("--workers", type=int, help="processes used for log files")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    associations = PrefixIndex(args.association) if args.association else None
+    connections, failed, unparsed = read_logs(args.logs, associations, args.workers)
+    summary = summarize(connections)
+    count = recommend(summary["peak"], args.headroom)
+
+    if args.json:
+        json.dump(dict(summary, failed=len(failed), unparsed=unparsed, associations=count),
+                  sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{summary['sessions']} sessions, {len(failed)} failed connection attempts, "
+          f"{unparsed} unparsed lines")
+    if not connections:
+        return
+    print(f"Peak concurrent sessions: {summary['peak']} at {_time(summary['peak_time'])} UTC")
+    total = sum(b for _, b in summary["groups"].values()) or 1
+    print("Per association:")
+    for group, (sessions, size) in sorted(summary["groups"].items(), key=lambda item: -item[1][1]):
+        print(f"  {group:<40}{sessions:>8} sessions{size:>16,} bytes{size / total:>7.0%}")
+    print("Sessions per hour (UTC):")
+    width = max(active for active, _ in summary["hourly"]) or 1
+    for i, (active, started) in enumerate(summary["hourly"]):
+        bar = "#" * -(-active * 50 // width)
+        print(f"  {_time(summary['first_hour'] + i * HOUR)}  {bar:<50} {active} connected, {started} started")
+    if count is None:
+        print(f"Recommended subnet associations: more than {max(CONNECTION_CAPACITY)}; "
+              f"{summary['peak']} sessions x {args.headroom} headroom need several endpoints")
+    else:
+        print(f"Recommended subnet associations: {count} ({CONNECTION_CAPACITY[count]:,} concurrent "
+              f"connections for a peak of {summary['peak']} x {args.headroom} headroom)")
+    counts = {group: sessions for group, (sessions, _) in summary["groups"].items()}
+    if len(counts) > 1 and max(counts.values()) > 2 * min(counts.values()):
+        print("  Sessions are unevenly spread across associations.")
+
+
+if __name__ == "__main__":
+    main()
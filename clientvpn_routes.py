@@ -0,0 +1,164 @@
+"""Route planning for Client VPN endpoints.
+
+``plan_routes`` turns (destination CIDR, description) pairs into the routes
+and authorization rules that ``clientvpn.build_template`` creates:
+
+1. duplicate, nested and adjacent destinations are collapsed into supernets
+   covering exactly the same addresses, so nothing becomes reachable that was
+   not listed;
+2. destinations overlapping the client CIDR are rejected (the default route
+   excepted, which full tunnel endpoints need);
+3. every listed destination is looked up in a longest-prefix-match index of
+   the planned routes and must resolve to a route covering all of it;
+4. destinations already covered by a literal authorization rule get no rule
+   of their own;
+5. routes (one per destination and associated subnet) and rules are checked
+   against the per-endpoint quotas.
+
+    python clientvpn_routes.py destinations.csv [--client-cidr 10.0.0.0/22] [--subnets 2]
+"""
+import argparse
+import csv
+import ipaddress
+import sys
+from collections import namedtuple
+
+CLIENT_CIDR = "10.0.0.0/22"
+# Default Client VPN quotas per endpoint; both can be raised on request.
+ROUTE_QUOTA = 10
+RULE_QUOTA = 50
+DESCRIPTION_LIMIT = 255
+
+RoutePlan = namedtuple("RoutePlan", ["routes", "rules", "listed"])
+
+
+def read_destinations(path, column="Cidr", description="Description"):
+    """Yield (ip_network, description) for every row of a destinations CSV."""
+    with open(path, mode='r', newline='') as csv_file:
+        csv_reader = csv.DictReader(csv_file)
+        for row in csv_reader:
+            value = (row.get(column) or "").strip()
+            try:
+                network = ipaddress.ip_network(value, strict=False)
+            except ValueError as e:
+                raise ValueError(
+                    f"{path}:{csv_reader.line_num}: invalid {column} {value!r}"
+                ) from e
+            yield network, (row.get(description) or "").strip() or f"Access to {network}"
+
+
+class PrefixIndex:
+    """Longest-prefix-match lookup over IPv4 networks.
+
+    One dict per prefix length maps the network address to a value; a lookup
+    probes the lengths present from the longest down.
+    """
+
+    def __init__(self, entries=()):
+        self.tables = {}
+        self.lengths = []
+        for network, value in entries:
+            self.add(network, value)
+
+    def add(self, network, value):
+        self.tables.setdefault(network.prefixlen, {})[int(network.network_address)] = value
+        self.lengths = sorted(self.tables, reverse=True)
+
+    def lookup(self, network):
+        """Return (network, value) of the longest entry containing all of ``network``, or None."""
+        address = int(network.network_address)
+        for length in self.lengths:
+            if length > network.prefixlen:
+                continue
+            key = address >> (32 - length) << (32 - length)
+            if key in self.tables[length]:
+                return ipaddress.IPv4Network((key, length)), self.tables[length][key]
+        return None
+
+
+def _describe(descriptions):
+    text = "; ".join(dict.fromkeys(descriptions))
+    return text if len(text) <= DESCRIPTION_LIMIT else text[:DESCRIPTION_LIMIT - 3] + "..."
+
+
+def _is_ipv4(value):
+    try:
+        return ipaddress.ip_network(value).version == 4
+    except ValueError:
+        return False
+
+
+def plan_routes(destinations, auth_rules=(), subnets=1, client_cidr=CLIENT_CIDR,
+                route_quota=ROUTE_QUOTA, rule_quota=RULE_QUOTA):
+    """Return a RoutePlan for ``destinations`` = [(CIDR, description)].
+
+    ``routes`` are the aggregated (CIDR, description) pairs, ``rules`` the
+    authorization rules to add to ``auth_rules`` and ``listed`` the number of
+    destinations given. Raises ValueError when a destination overlaps the
+    client CIDR or the plan does not fit the quotas.
+    """
+    listed = [(ipaddress.ip_network(cidr, strict=False), description)
+              for cidr, description in destinations]
+    for network, _ in listed:
+        if network.version != 4:
+            raise ValueError(f"{network}: Client VPN routes must be IPv4")
+
+    routes = list(ipaddress.collapse_addresses(network for network, _ in listed))
+    index = PrefixIndex((route, []) for route in routes)
+
+    client = ipaddress.ip_network(client_cidr)
+    overlapping = [str(route) for route in routes if route.prefixlen and route.overlaps(client)]
+    if overlapping:
+        raise ValueError(f"destinations {', '.join(overlapping)} overlap the client CIDR {client}")
+
+    for network, description in listed:
+        match = index.lookup(network)
+        if match is None:
+            raise ValueError(f"{network} is not reachable through any planned route")
+        match[1].append(description)
+
+    authorized = PrefixIndex((ipaddress.ip_network(target), None)
+                             for target, _ in auth_rules if _is_ipv4(target))
+    planned = []
+    rules = []
+    for route in routes:
+        _, descriptions = index.lookup(route)
+        pair = (str(route), _describe(descriptions))
+        planned.append(pair)
+        if authorized.lookup(route) is None:
+            rules.append(pair)
+
+    if len(planned) * subnets > route_quota:
+        raise ValueError(f"{len(planned)} destinations x {subnets} subnets need "
+                         f"{len(planned) * subnets} routes, over the quota of {route_quota}")
+    if len(auth_rules) + len(rules) > rule_quota:
+        raise ValueError(f"{len(auth_rules) + len(rules)} authorization rules exceed "
+                         f"the quota of {rule_quota}")
+    return RoutePlan(planned, rules, len(listed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan Client VPN routes and authorization rules")
+    parser.add_argument("destinations", help="CSV file with Cidr and Description columns")
+    parser.add_argument("--client-cidr", default=CLIENT_CIDR, help="CIDR range assigned to clients")
+    parser.add_argument("--subnets", type=int, default=1, help="associated subnets (one route each)")
+    parser.add_argument("--route-quota", type=int, default=ROUTE_QUOTA, help="routes per endpoint")
+    parser.add_argument("--rule-quota", type=int, default=RULE_QUOTA,
+                        help="authorization rules per endpoint")
+    args = parser.parse_args()
+
+    destinations = [(str(network), description)
+                    for network, description in read_destinations(args.destinations)]
+    try:
+        plan = plan_routes(destinations, (), args.subnets, args.client_cidr,
+                           args.route_quota, args.rule_quota)
+    except ValueError as e:
+        sys.exit(str(e))
+    for cidr, description in plan.routes:
+        print(f"{cidr:<20}{description}")
+    print(f"{plan.listed} destinations planned as {len(plan.routes)} route(s) x {args.subnets} "
+          f"subnet(s) and {len(plan.rules)} authorization rule(s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
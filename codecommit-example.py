@@ -1,4 +1,6 @@
-import os
+from tools.lazy import defer_imports
+from tools.output import write_template
+defer_imports()
 
 from troposphere import Parameter, Ref, Template
 from troposphere.codecommit import Repository
@@ -33,6 +35,4 @@ Repo = t.add_resource(
 )
 
 ### -- Print Template
-f1 = open('./' + (os.path.splitext(os.path.basename(__file__))[0]) + '.json', 'w+')
-print(t.to_json(), file=f1)
-print(t.to_json())
+write_template(t, __file__)
@@ -1,11 +1,12 @@
-import os
+from tools.lazy import defer_imports
+from tools.output import write_template
+defer_imports()
 
 from troposphere import Parameter, Ref, Template, Join, AWS_ACCOUNT_ID
 from troposphere import Output, AWS_REGION
 from troposphere.ecr import Repository
 from awacs.aws import Allow, Policy, AWSPrincipal, Statement
 import awacs.ecr as ecr
-import awacs.iam as iam
 
 t = Template()
 t.set_version('2010-09-09')
@@ -76,6 +77,4 @@ t.add_output(
 )
 
 ### -- Print Template
-f1 = open('./' + (os.path.splitext(os.path.basename(__file__))[0]) + '.json', 'w+')
-print(t.to_json(), file=f1)
-print(t.to_json())
+write_template(t, __file__)
@@ -1,9 +1,29 @@
-import os
+import argparse
+import json
+import sys
+
+from tools.lazy import defer_imports
+from tools.output import write_template
+defer_imports()
 
 from troposphere import GetAtt, Output, Parameter, Ref, Template
-from troposphere.iam import AccessKey, Group, LoginProfile, PolicyType
+from troposphere.iam import AccessKey, Group, LoginProfile
 from troposphere.iam import User, UserToGroupAddition
 
+from iam_actions import compress_actions
+from iam_policy import add_policies
+
+parser = argparse.ArgumentParser(description="Generate the region restricted IAM group template")
+parser.add_argument("--actions-file",
+                    help="JSON list of actions to use instead of the list below (see iam_cloudtrail.py)")
+parser.add_argument("--compress-actions", action="store_true",
+                    help="rewrite the action list into the fewest equivalent wildcards")
+parser.add_argument("--widen-actions", action="store_true",
+                    help="with --compress-actions, also add wildcards the list did not have")
+parser.add_argument("--managed-policies", action="store_true",
+                    help="always use managed policies (they are used anyway when the inline limit is exceeded)")
+args = parser.parse_args()
+
 t = Template()
 
 t.set_description("Template to Create New Groups / Roles")
@@ -33,6 +53,73 @@ RegionParam = t.add_parameter(
     )
 )
 
+### -- Policy
+PolicyActions = [
+    "ec2:*",
+    "s3:*",
+    "rds:*",
+    "elasticsearch:*",
+    "sqs:*",
+    "elasticache:*",
+    "events:DescribeRule",
+    "events:ListRuleNamesByTarget",
+    "events:ListRules",
+    "events:ListTargetsByRule",
+    "events:TestEventPattern",
+    "events:DescribeEventBus",
+    "kms:ListAliases",
+    "kms:DescribeKey",
+    "application-autoscaling:DescribeScalableTargets",
+    "application-autoscaling:DescribeScalingActivities",
+    "application-autoscaling:DescribeScalingPolicies",
+    "cloudwatch:DescribeAlarmHistory",
+    "cloudwatch:DescribeAlarms",
+    "cloudwatch:DescribeAlarmsForMetric",
+    "cloudwatch:GetMetricStatistics",
+    "cloudwatch:ListMetrics",
+    "datapipeline:DescribeObjects",
+    "datapipeline:DescribePipelines",
+    "datapipeline:GetPipelineDefinition",
+    "datapipeline:ListPipelines",
+    "datapipeline:QueryObjects",
+    "dynamodb:BatchGetItem",
+    "dynamodb:Describe*",
+    "dynamodb:List*",
+    "dynamodb:GetItem",
+    "dynamodb:Query",
+    "dynamodb:Scan",
+    "dax:Describe*",
+    "dax:List*",
+    "dax:GetItem",
+    "dax:BatchGetItem",
+    "dax:Query",
+    "dax:Scan",
+    "iam:GetRole",
+    "iam:ListRoles",
+    "sns:ListSubscriptionsByTopic",
+    "sns:ListTopics",
+    "lambda:ListFunctions",
+    "lambda:ListEventSourceMappings",
+    "lambda:GetFunctionConfiguration",
+    "resource-groups:ListGroups",
+    "resource-groups:ListGroupResources",
+    "resource-groups:GetGroup",
+    "resource-groups:GetGroupQuery",
+    "tag:GetResources",
+]
+
+if args.actions_file:
+    with open(args.actions_file) as f1:
+        PolicyActions = json.load(f1)
+    if not PolicyActions:
+        parser.error(f"{args.actions_file} has no actions")
+
+if args.compress_actions:
+    PolicyActions, report = compress_actions(PolicyActions, widen=args.widen_actions)
+    print(f"Actions compressed from {report['before']} to {report['after']} bytes", file=sys.stderr)
+    for pattern in report["widened"]:
+        print(f"Warning: {pattern} also grants actions missing from the catalog", file=sys.stderr)
+
 ### -- Resources
 IAMGroup = t.add_resource(
     Group(
@@ -41,81 +128,27 @@ IAMGroup = t.add_resource(
     )
 )
 
-IAMPolicies = t.add_resource(
-    PolicyType(
-        "IAMPolicies",
-        PolicyName=Ref(RoleParam),
-        Groups=[Ref(GroupParam)],
-        PolicyDocument={
-            "Version": "2012-10-17",
-            "Statement": [{
-                "Effect": "Allow",
-                "Action": [
-                    "ec2:*",
-                    "s3:*",
-                    "rds:*",
-                    "elasticsearch:*",
-                    "sqs:*",
-                    "elasticache:*",
-                    "events:DescribeRule",
-                    "events:ListRuleNamesByTarget",
-                    "events:ListRules",
-                    "events:ListTargetsByRule",
-                    "events:TestEventPattern",
-                    "events:DescribeEventBus",
-                    "kms:ListAliases",
-                    "kms:DescribeKey",
-                    "application-autoscaling:DescribeScalableTargets",
-                    "application-autoscaling:DescribeScalingActivities",
-                    "application-autoscaling:DescribeScalingPolicies",
-                    "cloudwatch:DescribeAlarmHistory",
-                    "cloudwatch:DescribeAlarms",
-                    "cloudwatch:DescribeAlarmsForMetric",
-                    "cloudwatch:GetMetricStatistics",
-                    "cloudwatch:ListMetrics",
-                    "datapipeline:DescribeObjects",
-                    "datapipeline:DescribePipelines",
-                    "datapipeline:GetPipelineDefinition",
-                    "datapipeline:ListPipelines",
-                    "datapipeline:QueryObjects",
-                    "dynamodb:BatchGetItem",
-                    "dynamodb:Describe*",
-                    "dynamodb:List*",
-                    "dynamodb:GetItem",
-                    "dynamodb:Query",
-                    "dynamodb:Scan",
-                    "dax:Describe*",
-                    "dax:List*",
-                    "dax:GetItem",
-                    "dax:BatchGetItem",
-                    "dax:Query",
-                    "dax:Scan",
-                    "iam:GetRole",
-                    "iam:ListRoles",
-                    "sns:ListSubscriptionsByTopic",
-                    "sns:ListTopics",
-                    "lambda:ListFunctions",
-                    "lambda:ListEventSourceMappings",
-                    "lambda:GetFunctionConfiguration",
-                    "resource-groups:ListGroups",
-                    "resource-groups:ListGroupResources",
-                    "resource-groups:GetGroup",
-                    "resource-groups:GetGroupQuery",
-                    "tag:GetResources"
-                ],
-                "Resource": "*",
-                "Condition": {
-                    "StringEquals": {
-                        "aws:RequestedRegion": Ref(RegionParam)
-                    }
+IAMPolicies = add_policies(
+    t,
+    "IAMPolicies",
+    {
+        "Version": "2012-10-17",
+        "Statement": [{
+            "Effect": "Allow",
+            "Action": PolicyActions,
+            "Resource": "*",
+            "Condition": {
+                "StringEquals": {
+                    "aws:RequestedRegion": Ref(RegionParam)
                 }
-            }],
-        },
-        DependsOn=IAMGroup
-    )
+            }
+        }],
+    },
+    policy_name=Ref(RoleParam),
+    managed=args.managed_policies,
+    Groups=[Ref(GroupParam)],
+    DependsOn=IAMGroup
 )
 
 ### -- Print Template
-f1 = open('./' + (os.path.splitext(os.path.basename(__file__))[0]) + '.json', 'w+')
-print(t.to_json(), file=f1)
-print(t.to_json())
+write_template(t, __file__)
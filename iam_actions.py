@@ -0,0 +1,311 @@
+"""Compress IAM action lists into exactly equivalent wildcards.
+
+The action catalog is the one awacs ships (one module per service, generated
+from the IAM service reference), or a JSON file mapping service prefixes to
+action names. Each service's actions are indexed in a case-insensitive prefix
+trie whose cut points are the word boundaries of the action names
+(``Describe|Alarm|History``).
+
+``compress_actions`` expands every entry of an action list against the
+catalog, then walks the trie and emits ``<prefix>*`` for the topmost subtrees
+whose actions are all granted and exact names for the rest. Since subtrees
+are either nested or disjoint, one pattern per maximal granted subtree is the
+fewest patterns cut at word boundaries. The result is proven equal by
+expanding it again with the same glob matching IAM uses and comparing action
+sets. Entries for services or actions missing from the catalog are kept as
+they are.
+
+Equivalence is only proven for the catalog's actions, and a new wildcard
+would also grant actions missing from the catalog or added to the service
+later. So by default a wildcard is only emitted inside one the input already
+had (``dynamodb:Describe*`` may stay, ``DescribeAlarms`` and
+``DescribeAlarmHistory`` are not turned into ``DescribeAlarm*``). With
+``widen=True`` any wildcard is allowed and the new ones are reported.
+
+    python iam_actions.py build/iam-role-policy-region-restriction-example.json \\
+        [--catalog actions.json] [--widen]
+"""
+import argparse
+import json
+import re
+import sys
+from functools import lru_cache
+
+WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z][a-z0-9]*|[a-z0-9]+|.")
+
+_catalogs = {}
+
+
+def load_catalog(path=None):
+    """Return {service prefix: {lowercase action: action}} from ``path`` or awacs."""
+    if path in _catalogs:
+        return _catalogs[path]
+    services = {}
+    if path:
+        with open(path) as f1:
+            data = json.load(f1)
+        for prefix, actions in data.items():
+            services[prefix.lower()] = {action.lower(): action for action in sorted(actions)}
+    else:
+        # Imported here: walking every awacs service module is only needed
+        # when a catalog is used.
+        import importlib
+        import pkgutil
+        import awacs
+        from awacs.aws import Action
+
+        for module in pkgutil.iter_modules(awacs.__path__):
+            for value in vars(importlib.import_module(f"awacs.{module.name}")).values():
+                if isinstance(value, Action) and value.action:
+                    names = services.setdefault(value.prefix.lower(), {})
+                    names.setdefault(value.action.lower(), value.action)
+    _catalogs[path] = services
+    return services
+
+
+@lru_cache(maxsize=None)
+def glob(pattern):
+    """Compile an IAM ``*`` / ``?`` pattern into a case-insensitive matcher."""
+    text = "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern)
+    return re.compile(text, re.IGNORECASE).fullmatch
+
+
+def split_action(entry):
+    service, _, name = entry.partition(":")
+    return service.lower(), name
+
+
+def expand(entries, catalog):
+    """Return ({service: set of lowercase actions}, [entries the catalog cannot resolve])."""
+    granted = {}
+    unknown = []
+    for entry in entries:
+        if not isinstance(entry, str) or ":" not in entry:
+            unknown.append(entry)
+            continue
+        service, name = split_action(entry)
+        actions = catalog.get(service)
+        if actions is None:
+            unknown.append(entry)
+            continue
+        if "*" in name or "?" in name:
+            match = glob(name)
+            found = {action for action in actions if match(action)}
+        else:
+            found = {name.lower()} if name.lower() in actions else set()
+        if not found:
+            unknown.append(entry)
+        granted.setdefault(service, set()).update(found)
+    return granted, unknown
+
+
+## -- Prefix trie
+class _Node:
+    __slots__ = ("children", "action", "boundary", "total", "granted", "sample")
+
+    def __init__(self, sample):
+        self.children = {}
+        self.action = None
+        self.boundary = False
+        self.total = self.granted = 0
+        self.sample = sample
+
+
+class ActionTrie:
+    """Character prefix trie over one service's actions.
+
+    Nodes where a word of some action name ends are boundaries; patterns are
+    only cut there, so they read like ``Describe*`` rather than ``Desc*``.
+    """
+
+    def __init__(self, actions):
+        self.root = _Node("")
+        self.root.boundary = True
+        for action in actions.values():
+            ends = set()
+            for word in WORD.finditer(action):
+                ends.add(word.end())
+            node = self.root
+            for depth, char in enumerate(action.lower(), 1):
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _Node(action[:depth])
+                node = child
+                node.boundary = node.boundary or depth in ends
+            node.action = action
+
+    def cover(self, granted, allowed=None):
+        """Return the fewest patterns matching exactly the ``granted`` lowercase actions.
+
+        ``allowed(prefix)`` says whether ``<prefix>*`` may be emitted; it must
+        hold for every extension of a prefix it holds for.
+        """
+        nodes = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.children.values())
+        for node in reversed(nodes):
+            node.total = (node.action is not None) + sum(c.total for c in node.children.values())
+            node.granted = (node.action is not None and node.action.lower() in granted) \
+                + sum(c.granted for c in node.children.values())
+
+        # Subtrees are nested or disjoint, so one pattern per topmost fully
+        # granted boundary node is the fewest patterns cut at boundaries.
+        patterns = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not node.granted:
+                continue
+            if node.granted == node.total and node.boundary:
+                if node.total == 1:
+                    patterns.append(self._only(node))
+                    continue
+                if allowed is None or allowed(node.sample):
+                    patterns.append(node.sample + "*")
+                    continue
+            if node.action is not None and node.action.lower() in granted:
+                patterns.append(node.action)
+            stack.extend(node.children.values())
+        return sorted(patterns, key=str.lower)
+
+    @staticmethod
+    def _only(node):
+        while node.action is None:
+            node = next(c for c in node.children.values() if c.total)
+        return node.action
+
+
+_tries = {}
+
+
+def _trie(catalog, service):
+    key = (id(catalog), service)
+    if key not in _tries:
+        _tries[key] = ActionTrie(catalog[service])
+    return _tries[key]
+
+
+def _size(value):
+    return len(json.dumps(value, separators=(",", ":")))
+
+
+def _within(entries, service):
+    """Return allowed(prefix): is ``<prefix>*`` inside a trailing wildcard of ``entries``?"""
+    prefixes = []
+    for entry in entries:
+        entry_service, name = split_action(entry)
+        if entry_service == service and name.endswith("*") and not any(c in name[:-1] for c in "*?"):
+            prefixes.append(name[:-1].lower())
+    return lambda prefix: any(prefix.lower().startswith(p) for p in prefixes)
+
+
+def compress_actions(entries, catalog=None, widen=False):
+    """Return (compressed entries, report) for an action list.
+
+    ``report`` holds the services rewritten, the entries kept as they are, the
+    actions granted, the bytes before and after and the wildcards ``widened``
+    beyond the input's own (always empty unless ``widen``). Raises ValueError
+    if the result does not grant exactly the same actions.
+    """
+    catalog = catalog if catalog is not None else load_catalog()
+    entries = [entries] if isinstance(entries, str) else list(entries)
+    if "*" in entries:
+        return ["*"], {"services": {}, "kept": ["*"], "actions": None,
+                       "before": _size(entries), "after": _size(["*"]), "widened": []}
+    granted, unknown = expand(entries, catalog)
+
+    result = []
+    services = {}
+    widened = []
+    for entry in entries:
+        if entry in unknown:
+            if entry not in result:
+                result.append(entry)
+            continue
+        service, _ = split_action(entry)
+        if service in services:
+            continue
+        within = _within([e for e in entries if isinstance(e, str) and ":" in e], service)
+        patterns = _trie(catalog, service).cover(granted[service], None if widen else within)
+        widened.extend(f"{service}:{p}" for p in patterns if p.endswith("*") and not within(p[:-1]))
+        services[service] = patterns
+        result.extend(f"{service}:{pattern}" for pattern in patterns)
+
+    # Proof: expanding the result grants exactly what the input granted.
+    proven, _ = expand([entry for entry in result if entry not in unknown], catalog)
+    if proven != granted:
+        raise ValueError("compressed actions differ from the original")
+    return result, {
+        "services": services,
+        "kept": unknown,
+        "actions": sum(map(len, granted.values())),
+        "before": _size(entries),
+        "after": _size(result),
+        "widened": widened,
+    }
+
+
+def compress_policy(document, catalog=None, widen=False):
+    """Return (document, [report per statement]) with every Action list compressed."""
+    document = dict(document)
+    statements = document.get("Statement", [])
+    single = isinstance(statements, dict)
+    compressed = []
+    reports = []
+    for statement in [statements] if single else statements:
+        statement = dict(statement)
+        if "Action" in statement:
+            statement["Action"], report = compress_actions(statement["Action"], catalog, widen)
+            reports.append(report)
+        compressed.append(statement)
+    document["Statement"] = compressed[0] if single else compressed
+    return document, reports
+
+
+def policies(value, path=""):
+    """Yield (path, policy document) for every document with a Statement in a template."""
+    if isinstance(value, dict):
+        if "Statement" in value and "Version" in value:
+            yield path, value
+            return
+        for key, item in value.items():
+            yield from policies(item, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield from policies(item, f"{path}[{i}]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress the IAM action lists of a template")
+    parser.add_argument("template", help="template or policy JSON file")
+    parser.add_argument("--catalog", help="JSON file of {service prefix: [actions]} (default: awacs)")
+    parser.add_argument("--widen", action="store_true",
+                        help="allow new wildcards, which also grant actions missing from the catalog")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        data = json.load(f1)
+    catalog = load_catalog(args.catalog)
+    before = after = 0
+    for path, document in policies(data):
+        _, reports = compress_policy(document, catalog, args.widen)
+        for i, report in enumerate(reports):
+            before += report["before"]
+            after += report["after"]
+            print(f"{path} statement {i + 1}: {report['before']} -> {report['after']} bytes, "
+                  f"{report['actions'] if report['actions'] is not None else 'all'} actions")
+            for service, patterns in sorted(report["services"].items()):
+                print(f"  {service}: {', '.join(patterns)}")
+            for entry in report["kept"]:
+                print(f"  kept {entry} (not in the catalog)")
+            for pattern in report["widened"]:
+                print(f"  warning: {pattern} is a new wildcard and also grants actions "
+                      f"missing from the catalog", file=sys.stderr)
+    print(f"Action lists {before} -> {after} bytes ({before - after} saved)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Tighten an IAM action list to the actions CloudTrail shows in use.
+
+Streams local CloudTrail archives: the ``{"Records": [...]}`` files CloudTrail
+delivers to S3 (``.json`` or ``.json.gz``, directories are walked) or JSON
+lines with one event each. Records are decoded one at a time from a buffer,
+so file size does not bound memory, and files are spread across worker
+processes. Every successful call is counted as ``<service>:<eventName>`` per
+principal (user ARN, or the role ARN of an assumed role) and region; calls
+that failed with an authorization error are reported but do not count.
+
+The tightened list is the used actions the template's current policies
+grant, plus ``--keep`` patterns. It is printed as a diff against the current
+action list, and ``--output`` writes it as JSON for the ``--actions-file``
+option of ``iam-role-policy-region-restriction-example.py``, which builds the
+same policy (region condition included) from it. CloudTrail does not log
+every action (S3 object calls are data events, logged only when enabled), so
+check the diff before deploying it.
+
+    python iam_cloudtrail.py build/iam-role-policy-region-restriction-example.json logs/ \\
+        [--principal 'arn:aws:iam::*:user/dev-*'] [--region us-east-1] [--output actions.json]
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from iam_actions import glob, policies
+
+BUFFER = 1 << 20
+RECORDS = re.compile(r'\s*\{\s*"Records"\s*:\s*\[')
+SEPARATORS = re.compile(r"[\s,]*")
+# A record that does not decode once this much follows it is malformed, not
+# cut short by the buffer; decoding resumes at the next record.
+MAX_RECORD = 16 << 20
+RECORD_START = '{"eventVersion"'
+# eventSource prefixes whose IAM service prefix differs.
+EVENT_SOURCES = {
+    "monitoring": "cloudwatch",
+    "tagging": "tag",
+}
+# Lambda event names carry the API version (ListFunctions20150331, GetPolicy20150331v2).
+API_VERSION = re.compile(r"\d{8}(v\d+)?$")
+AUTHORIZATION_ERRORS = {"AccessDenied", "AccessDeniedException", "UnauthorizedOperation",
+                        "Client.UnauthorizedOperation", "UnauthorizedAccess"}
+
+
+## -- Streaming CloudTrail
+def iter_records(stream):
+    """Yield the events of a CloudTrail file or JSON lines stream, one at a time.
+
+    A line or record that cannot be decoded yields None and reading goes on.
+    """
+    decoder = json.JSONDecoder()
+    buffer = stream.read(BUFFER)
+    match = RECORDS.match(buffer)
+    if match is None:
+        for line in _lines(buffer, stream):
+            if line.strip():
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                yield from event.get("Records", [event]) if isinstance(event, dict) else [None]
+        return
+
+    position = match.end()
+    eof = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            event, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof or len(buffer) - position > MAX_RECORD:
+                yield None
+                found = buffer.find(RECORD_START, position + 1)
+                while found < 0 and not eof:
+                    chunk = stream.read(BUFFER)
+                    eof = not chunk
+                    buffer = buffer[-len(RECORD_START):] + chunk
+                    found = buffer.find(RECORD_START)
+                if found < 0:
+                    return
+                position = found
+                continue
+            # The record continues past the buffer: keep the tail and read on.
+            chunk = stream.read(BUFFER)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield event
+        position = end
+        if position > BUFFER:
+            buffer = buffer[position:]
+            position = 0
+
+
+def _lines(head, stream):
+    rest = ""
+    for chunk in chain([head], iter(lambda: stream.read(BUFFER), "")):
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        yield from lines
+    yield rest
+
+
+def event_action(event):
+    """Return the IAM action of a CloudTrail event, e.g. ``ec2:DescribeInstances``."""
+    source = event["eventSource"].split(".", 1)[0]
+    return f"{EVENT_SOURCES.get(source, source)}:{API_VERSION.sub('', event['eventName'])}"
+
+
+def event_principal(event):
+    """Return the principal ARN of an event, or None for AWS service calls."""
+    identity = event.get("userIdentity", {})
+    if identity.get("type") == "AssumedRole":
+        return identity.get("sessionContext", {}).get("sessionIssuer", {}).get("arn", identity.get("arn"))
+    return identity.get("arn")
+
+
+def read_file(path):
+    """Return ({(principal, region): Counter of actions}, denied Counter, unparsed records)."""
+    used = {}
+    denied = Counter()
+    unparsed = 0
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as log:
+        for event in iter_records(log):
+            try:
+                action = event_action(event)
+            except (KeyError, AttributeError, TypeError):
+                unparsed += 1
+                continue
+            principal = event_principal(event)
+            if principal is None:
+                continue
+            if event.get("errorCode") in AUTHORIZATION_ERRORS:
+                denied[action] += 1
+                continue
+            key = (principal, event.get("awsRegion"))
+            used.setdefault(key, Counter())[action] += 1
+    return used, denied, unparsed
+
+
+def log_files(paths):
+    """Return the CloudTrail files in ``paths``, walking directories."""
+    files = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for root, _, names in os.walk(path):
+            files.extend(os.path.join(root, name) for name in sorted(names)
+                         if name.endswith((".json", ".json.gz", ".jsonl", ".jsonl.gz")))
+    return files
+
+
+def read_logs(paths, workers=None):
+    """Merge read_file over ``paths``."""
+    used = {}
+    denied = Counter()
+    unparsed = 0
+
+    def merge(results):
+        nonlocal unparsed
+        for file_used, file_denied, file_unparsed in results:
+            for key, actions in file_used.items():
+                used.setdefault(key, Counter()).update(actions)
+            denied.update(file_denied)
+            unparsed += file_unparsed
+
+    if len(paths) < 2 or workers == 1:
+        merge(map(read_file, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            merge(pool.map(read_file, paths, chunksize=16))
+    return used, denied, unparsed
+
+
+## -- Tightening
+def current_actions(template):
+    """Return the Action entries of the Allow statements in a template, in order."""
+    actions = []
+    for _, document in policies(template):
+        statements = document["Statement"]
+        for statement in [statements] if isinstance(statements, dict) else statements:
+            if statement.get("Effect") == "Allow":
+                entries = statement.get("Action", [])
+                for entry in [entries] if isinstance(entries, str) else entries:
+                    if entry not in actions:
+                        actions.append(entry)
+    return actions
+
+
+def tighten(current, used, keep=()):
+    """Return (tightened actions, [(sign, entry)] diff, used actions not granted).
+
+    ``used`` is a set of actions; the result keeps the used actions that some
+    ``current`` entry grants, and every entry matching a ``keep`` pattern.
+    """
+    kept = [entry for entry in current if any(glob(pattern)(entry) for pattern in keep)]
+    granted = {}
+    covered = set()
+    for action in sorted(used, key=str.lower):
+        # An exact entry wins over a wildcard that also grants the action.
+        entry = action if action in current else next((e for e in current if glob(e)(action)), None)
+        if entry is not None:
+            granted.setdefault(entry, []).append(action)
+            covered.add(action)
+    diff = []
+    result = []
+    for entry in current:
+        actions = granted.get(entry, [])
+        if entry in kept or actions == [entry]:
+            diff.append((" ", entry))
+            result.append(entry)
+            continue
+        diff.append(("-", entry))
+        for action in actions:
+            diff.append(("+", action))
+            result.append(action)
+    result = list(dict.fromkeys(result))
+    missing = sorted(used - covered, key=str.lower)
+    return result, diff, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tighten an IAM action list to the actions in CloudTrail")
+    parser.add_argument("template", help="generated template JSON whose policy is tightened")
+    parser.add_argument("logs", nargs="+", help="CloudTrail files or directories (.gz allowed)")
+    parser.add_argument("--principal", action="append", default=[],
+                        help="only count principals whose ARN matches this pattern (repeatable)")
+    parser.add_argument("--region", action="append", default=[], help="only count this region (repeatable)")
+    parser.add_argument("--keep", action="append", default=[],
+                        help="keep current entries matching this pattern even if unused (repeatable)")
+    parser.add_argument("--output", help="write the tightened action list to this JSON file")
+    parser.add_argument("--workers", type=int, help="processes used for log files")
+    parser.add_argument("--json", action="store_true", help="print the usage per principal and region as JSON")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        current = current_actions(json.load(f1))
+    files = log_files(args.logs)
+    used, denied, unparsed = read_logs(files, args.workers)
+    selected = {(principal, region): actions for (principal, region), actions in used.items()
+                if (not args.principal or any(glob(p)(principal) for p in args.principal))
+                and (not args.region or region in args.region)}
+
+    if args.json:
+        json.dump([{"principal": principal, "region": region, "actions": dict(actions)}
+                   for (principal, region), actions in sorted(selected.items())], sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{len(files)} files, {sum(sum(a.values()) for a in used.values())} calls by "
+          f"{len({p for p, _ in used})} principals, {sum(denied.values())} denied calls, "
+          f"{unparsed} unparsed")
+    for (principal, region), actions in sorted(selected.items()):
+        print(f"  {principal} {region}: {len(actions)} actions, {sum(actions.values())} calls")
+    result, diff, missing = tighten(current, {a for actions in selected.values() for a in actions}, args.keep)
+    for sign, entry in diff:
+        print(f"{sign} {entry}")
+    for action in missing:
+        print(f"  not granted by the current policy: {action}")
+    for action, count in denied.most_common(10):
+        print(f"  denied {count} times: {action}")
+    print(f"{len(current)} entries -> {len(result)} actions", file=sys.stderr)
+    if args.output and not result:
+        sys.exit("no used action is granted by the current policy; not writing an empty Action list")
+    if args.output:
+        with open(args.output, "w") as f1:
+            json.dump(result, f1, indent=4)
+            f1.write("\n")
+
+
+if __name__ == "__main__":
+    main()
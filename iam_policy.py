@@ -0,0 +1,170 @@
+"""Size IAM policies the way IAM does and split the ones that do not fit.
+
+IAM ignores whitespace when it checks a policy against its size limit, so
+``policy_size`` measures the compact JSON. Intrinsic functions such as
+``Ref`` are counted as written, which is larger than the region names or ids
+they usually resolve to.
+
+``pack_policy`` bin-packs the statements of a document into as few documents
+under a limit as it can (first fit, largest statement first). A statement too
+big for one document is split by its Action list, and each fragment keeps
+the statement's Effect, Resource and Condition. NotAction statements cannot
+be split without granting more, so they must fit whole.
+
+``add_policies`` adds a policy to a template. When it fits the inline limit
+it adds one ``AWS::IAM::Policy``. Otherwise it adds one ``AWS::IAM::ManagedPolicy``
+per fragment, attached to the same groups, roles and users. Splitting inline
+policies would not help, because the inline limit covers all inline policies
+of a group, role or user together.
+
+    python iam_policy.py build/iam-role-policy-region-restriction-example.json
+"""
+import argparse
+import json
+import math
+
+# Characters, excluding whitespace. Inline limits are per group / role / user,
+# summed over all of its inline policies.
+GROUP_INLINE_LIMIT = 5120
+ROLE_INLINE_LIMIT = 10240
+USER_INLINE_LIMIT = 2048
+MANAGED_LIMIT = 6144
+# Managed policies attached to one group, role or user (default quota).
+MANAGED_PER_ENTITY = 10
+
+
+def _plain(value):
+    return value.to_dict() if hasattr(value, "to_dict") else value.JSONrepr()
+
+
+def policy_size(value):
+    """Return the size IAM counts for a policy document or part of one."""
+    return len(json.dumps(value, separators=(",", ":"), default=_plain))
+
+
+def _statements(document):
+    statements = document.get("Statement", [])
+    return [statements] if isinstance(statements, dict) else list(statements)
+
+
+def inline_limit(groups=None, roles=None, users=None):
+    """Return the smallest inline limit of the entities a policy is attached to."""
+    limits = [limit for entities, limit in ((groups, GROUP_INLINE_LIMIT), (roles, ROLE_INLINE_LIMIT),
+                                             (users, USER_INLINE_LIMIT)) if entities]
+    return min(limits, default=GROUP_INLINE_LIMIT)
+
+
+def pack_policy(document, limit=MANAGED_LIMIT):
+    """Return [documents] of at most ``limit`` characters granting what ``document`` does."""
+    shell = {key: value for key, value in document.items() if key != "Statement"}
+    # The empty document's "[]" is where the statements go.
+    capacity = limit - policy_size(dict(shell, Statement=[]))
+    bins = []  # [used, [(original index, statement)]]
+
+    def fits(used, size, count):
+        return used + size + (1 if count else 0) <= capacity
+
+    def put(bin_, index, statement, size):
+        bin_[0] += size + (1 if bin_[1] else 0)
+        bin_[1].append((index, statement))
+
+    sized = [(policy_size(statement), index, statement)
+             for index, statement in enumerate(_statements(document))]
+    for size, index, statement in sorted(sized, key=lambda item: (-item[0], item[1])):
+        target = next((b for b in bins if fits(b[0], size, len(b[1]))), None)
+        if target is None and size <= capacity:
+            target = [0, []]
+            bins.append(target)
+        if target is not None:
+            put(target, index, statement, size)
+            continue
+
+        actions = statement.get("Action")
+        if not isinstance(actions, list) or len(actions) < 2:
+            kind = "NotAction" if "NotAction" in statement else "Action"
+            raise ValueError(f"statement {index + 1} is {size} characters and its {kind} "
+                             f"cannot be split to fit {limit}")
+        base = policy_size(dict(statement, Action=[]))
+        remaining = list(actions)
+        # Fill the space left in existing documents first, then new ones.
+        targets = sorted(bins, key=lambda b: b[0])
+        while remaining:
+            if targets:
+                target = targets.pop(0)
+            else:
+                target = [0, []]
+                bins.append(target)
+            chunk = []
+            used = base
+            while remaining:
+                cost = policy_size(remaining[0]) + (1 if chunk else 0)
+                if not fits(target[0], used + cost, len(target[1])):
+                    break
+                used += cost
+                chunk.append(remaining.pop(0))
+            if chunk:
+                put(target, index, dict(statement, Action=chunk), used)
+            elif not target[1]:
+                raise ValueError(f"action {remaining[0]} does not fit in {limit} characters")
+
+    return [dict(shell, Statement=[statement for _, statement in sorted(b[1], key=lambda s: s[0])])
+            for b in bins]
+
+
+def add_policies(t, title, document, policy_name, managed=False, **kwargs):
+    """Add ``document`` to ``t`` as one inline policy, or as managed policy fragments.
+
+    ``kwargs`` (Groups, Roles, Users, DependsOn) go on every resource. Managed
+    fragments are named ``<title><N>`` / ``<policy_name>-<N>``. Returns the
+    resources added.
+    """
+    from troposphere import Join
+    from troposphere.iam import ManagedPolicy, PolicyType
+
+    limit = inline_limit(kwargs.get("Groups"), kwargs.get("Roles"), kwargs.get("Users"))
+    if not managed and policy_size(document) <= limit:
+        return [t.add_resource(PolicyType(title, PolicyName=policy_name,
+                                          PolicyDocument=document, **kwargs))]
+    fragments = pack_policy(document, MANAGED_LIMIT)
+    if len(fragments) > MANAGED_PER_ENTITY:
+        raise ValueError(f"{title} needs {len(fragments)} managed policies, over the "
+                         f"{MANAGED_PER_ENTITY} that can be attached to one group, role or user")
+    return [
+        t.add_resource(ManagedPolicy(
+            f"{title}{i}",
+            ManagedPolicyName=Join("-", [policy_name, str(i)]),
+            PolicyDocument=fragment,
+            **kwargs
+        ))
+        for i, fragment in enumerate(fragments, 1)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check IAM policy sizes in a template")
+    parser.add_argument("template", help="template JSON file")
+    parser.add_argument("--limit", type=int, default=MANAGED_LIMIT, help="characters per packed policy")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        resources = json.load(f1).get("Resources", {})
+    for name, resource in sorted(resources.items()):
+        properties = resource.get("Properties", {})
+        document = properties.get("PolicyDocument")
+        if not isinstance(document, dict):
+            continue
+        size = policy_size(document)
+        if resource["Type"] == "AWS::IAM::Policy":
+            limit = inline_limit(properties.get("Groups"), properties.get("Roles"), properties.get("Users"))
+        else:
+            limit = MANAGED_LIMIT
+        print(f"{name:<40}{resource['Type']:<28}{size:>7} of {limit} characters")
+        if size > limit:
+            fragments = pack_policy(document, args.limit)
+            sizes = ", ".join(str(policy_size(f)) for f in fragments)
+            print(f"  packs into {len(fragments)} policies of at most {args.limit} ({sizes}); "
+                  f"at least {math.ceil(size / args.limit)} needed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,510 @@
+"""Evaluate IAM policies from generated templates offline.
+
+Loads the identity policies (``AWS::IAM::Policy`` / ``ManagedPolicy`` and
+the inline ``Policies`` of groups, roles and users) and the resource policies
+(ECR repository and S3 bucket policies) of one or more template JSON files.
+Intrinsic functions are resolved with ``--parameter`` values. Every statement
+is compiled once: Action / Resource wildcards become cached matchers, the
+Condition block becomes one test per key, and statements are indexed by
+service prefix so a request only looks at statements that can name it.
+
+Requests are JSON lines::
+
+    {"principal": "arn:aws:iam::123456789012:user/alice", "groups": ["Devs"],
+     "action": "ec2:DescribeInstances", "resource": "*",
+     "context": {"aws:RequestedRegion": "us-east-1"}, "expect": "Allow"}
+
+The request file is cut into byte ranges evaluated by worker processes. The
+decision follows IAM's order for same-account access: an explicit Deny wins,
+then any Allow from an identity or resource policy, else the implicit deny.
+A resource policy Allow for the principal's account (or its root) rather than
+the principal itself only delegates to identity policies, so it needs an
+identity Allow as well. The report counts decisions per matching statement
+and ``--decisions`` writes one decision per request line. Requests with
+``expect`` are checked, and mismatches make the exit status non-zero.
+
+    python iam_simulate.py build/iam-role-policy-region-restriction-example.json \\
+        requests.jsonl --parameter GroupParam=Devs --parameter RegionParam=us-east-1 [--workers 8]
+"""
+import argparse
+import ipaddress
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from iam_actions import glob as action_glob
+
+ALLOW = "Allow"
+DENY = "Deny"
+IMPLICIT = "(implicit deny)"
+ACCOUNT = "account"
+CHUNK_BYTES = 4 << 20
+MEMO_LIMIT = 1 << 20
+MISMATCH_LIMIT = 100
+
+# Resource policies: resource type -> (policy property, ARN of the resource(s) it guards).
+RESOURCE_POLICIES = {
+    "AWS::ECR::Repository": ("RepositoryPolicyText",
+                             "arn:aws:ecr:{AWS::Region}:{AWS::AccountId}:repository/{RepositoryName}"),
+    "AWS::S3::BucketPolicy": ("PolicyDocument", "arn:aws:s3:::{Bucket}*"),
+}
+# Identity resources with inline Policies, and the property naming the entity.
+ENTITIES = {
+    "AWS::IAM::Group": ("group", "GroupName"),
+    "AWS::IAM::Role": ("role", "RoleName"),
+    "AWS::IAM::User": ("user", "UserName"),
+}
+PSEUDO_PARAMETERS = {"AWS::Partition": "aws", "AWS::URLSuffix": "amazonaws.com"}
+
+
+## -- Resolving templates
+def resolve(value, parameters):
+    """Replace Ref / Fn::Join / Fn::Sub / Fn::Select / Fn::Split with concrete values."""
+    if isinstance(value, list):
+        return [resolve(item, parameters) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        key, item = next(iter(value.items()))
+        if key == "Ref":
+            if item not in parameters:
+                raise ValueError(f"no value for {item}; pass --parameter {item}=...")
+            return parameters[item]
+        if key == "Fn::Join":
+            return item[0].join(str(part) for part in resolve(item[1], parameters))
+        if key == "Fn::Sub":
+            text, variables = (item[0], item[1]) if isinstance(item, list) else (item, {})
+            values = dict(parameters, **resolve(variables, parameters))
+
+            def substitute(match):
+                if match.group(1) not in values:
+                    raise ValueError(f"no value for {match.group(1)}; pass --parameter")
+                return str(values[match.group(1)])
+
+            return re.sub(r"\$\{([^!}][^}]*)\}", substitute, text)
+        if key == "Fn::Select":
+            return resolve(item[1], parameters)[int(resolve(item[0], parameters))]
+        if key == "Fn::Split":
+            return resolve(item[1], parameters).split(item[0])
+        if key.startswith("Fn::"):
+            raise ValueError(f"{key} cannot be resolved offline")
+    return {key: resolve(item, parameters) for key, item in value.items()}
+
+
+def _listed(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def load_policies(templates, parameters):
+    """Return (identity, resource) policy lists from template dicts.
+
+    ``identity`` is [(label, {kind: set of names}, document)], ``resource`` is
+    [(label, resource ARN pattern, document)].
+    """
+    identity = []
+    resource = []
+    for data in templates:
+        values = dict(PSEUDO_PARAMETERS, **{name: spec["Default"] for name, spec
+                                             in data.get("Parameters", {}).items() if "Default" in spec})
+        values.update(parameters)
+        for name, body in data.get("Resources", {}).items():
+            kind = body["Type"]
+            properties = body.get("Properties", {})
+            if kind in ("AWS::IAM::Policy", "AWS::IAM::ManagedPolicy"):
+                attached = {
+                    "group": set(resolve(_listed(properties.get("Groups")), values)),
+                    "role": set(resolve(_listed(properties.get("Roles")), values)),
+                    "user": set(resolve(_listed(properties.get("Users")), values)),
+                }
+                identity.append((name, attached, resolve(properties["PolicyDocument"], values)))
+            elif kind in ENTITIES:
+                entity, name_property = ENTITIES[kind]
+                entity_name = resolve(properties.get(name_property, name), values)
+                for i, policy in enumerate(properties.get("Policies", []), 1):
+                    attached = {"group": set(), "role": set(), "user": set()}
+                    attached[entity].add(entity_name)
+                    identity.append((f"{name}.Policies[{i}]", attached,
+                                     resolve(policy["PolicyDocument"], values)))
+            elif kind in RESOURCE_POLICIES and RESOURCE_POLICIES[kind][0] in properties:
+                policy_property, arn = RESOURCE_POLICIES[kind]
+                fields = dict(values, **resolve(properties, values))
+                try:
+                    target = re.sub(r"\{([^}]+)\}", lambda m: str(fields[m.group(1)]), arn)
+                except KeyError as e:
+                    raise ValueError(f"{name}: no value for {e.args[0]}; pass --parameter") from None
+                resource.append((name, target, resolve(properties[policy_property], values)))
+    return identity, resource
+
+
+## -- Compiling statements
+@lru_cache(maxsize=None)
+def resource_glob(pattern):
+    """Compile a case-sensitive Resource / ARN pattern."""
+    text = "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern)
+    return re.compile(text, re.DOTALL).fullmatch
+
+
+VARIABLE = re.compile(r"\$\{([^}]+)\}")
+
+
+def _patterns(values, compile_):
+    """Return a matcher for a list of patterns; policy variables come from the context."""
+    fixed = [compile_(v) for v in values if "${" not in v]
+    variable = [v for v in values if "${" in v]
+
+    def match(value, context):
+        if any(m(value) for m in fixed):
+            return True
+        for pattern in variable:
+            text = VARIABLE.sub(lambda m: str(context.get(m.group(1).lower(), "")), pattern)
+            if compile_(text)(value):
+                return True
+        return False
+    return match
+
+
+def _number(value):
+    return float(value)
+
+
+def _ip(value, network):
+    return ipaddress.ip_address(value) in ipaddress.ip_network(network, strict=False)
+
+
+# Positive form of each operator: (compare(context value, policy value), negated).
+OPERATORS = {
+    "StringEquals": (lambda a, b: a == b, False),
+    "StringNotEquals": (lambda a, b: a == b, True),
+    "StringEqualsIgnoreCase": (lambda a, b: a.lower() == b.lower(), False),
+    "StringNotEqualsIgnoreCase": (lambda a, b: a.lower() == b.lower(), True),
+    "StringLike": (lambda a, b: bool(resource_glob(b)(a)), False),
+    "StringNotLike": (lambda a, b: bool(resource_glob(b)(a)), True),
+    "ArnEquals": (lambda a, b: bool(resource_glob(b)(a)), False),
+    "ArnLike": (lambda a, b: bool(resource_glob(b)(a)), False),
+    "ArnNotEquals": (lambda a, b: bool(resource_glob(b)(a)), True),
+    "ArnNotLike": (lambda a, b: bool(resource_glob(b)(a)), True),
+    "NumericEquals": (lambda a, b: _number(a) == _number(b), False),
+    "NumericNotEquals": (lambda a, b: _number(a) == _number(b), True),
+    "NumericLessThan": (lambda a, b: _number(a) < _number(b), False),
+    "NumericLessThanEquals": (lambda a, b: _number(a) <= _number(b), False),
+    "NumericGreaterThan": (lambda a, b: _number(a) > _number(b), False),
+    "NumericGreaterThanEquals": (lambda a, b: _number(a) >= _number(b), False),
+    "Bool": (lambda a, b: a.lower() == b.lower(), False),
+    "IpAddress": (_ip, False),
+    "NotIpAddress": (_ip, True),
+}
+
+
+def _text(value):
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _test(operator, key, expected):
+    """Compile one condition key into test(context)."""
+    qualifier, _, name = operator.rpartition(":")
+    if_exists = name.endswith("IfExists")
+    name = name[:-len("IfExists")] if if_exists else name
+    key = key.lower()
+    expected = [_text(value) for value in _listed(expected)]
+    if name == "Null":
+        absent = expected[0].lower() == "true"
+        return lambda context: (key not in context) == absent
+    if name not in OPERATORS:
+        raise ValueError(f"condition operator {operator} is not supported")
+    compare, negated = OPERATORS[name]
+
+    def matches(value):
+        found = any(compare(value, item) for item in expected)
+        return not found if negated else found
+
+    def test(context):
+        value = context.get(key)
+        if value is None:
+            # Missing keys satisfy IfExists and negated operators only.
+            return if_exists or negated or qualifier == "ForAllValues"
+        values = [_text(v) for v in value] if isinstance(value, list) else [_text(value)]
+        if qualifier == "ForAllValues":
+            return all(matches(v) for v in values)
+        return any(matches(v) for v in values)
+    return test
+
+
+class Statement:
+    """One compiled policy statement."""
+    __slots__ = ("label", "effect", "services", "action", "not_action", "resource",
+                 "not_resource", "principal", "not_principal", "tests")
+
+    def __init__(self, label, statement, resource_arn=None):
+        self.label = label
+        self.effect = statement.get("Effect", ALLOW)
+        actions = _listed(statement.get("Action")) or _listed(statement.get("NotAction"))
+        self.services = {a.split(":", 1)[0].lower() if ":" in a else "*" for a in actions}
+        if "NotAction" in statement or "*" in actions:
+            self.services = {"*"}
+        self.action = _patterns(_listed(statement.get("Action")), action_glob) \
+            if "Action" in statement else None
+        self.not_action = _patterns(_listed(statement.get("NotAction")), action_glob) \
+            if "NotAction" in statement else None
+        resources = statement.get("Resource", resource_arn if "NotResource" not in statement else None)
+        self.resource = _patterns(_listed(resources), resource_glob) if resources is not None else None
+        self.not_resource = _patterns(_listed(statement.get("NotResource")), resource_glob) \
+            if "NotResource" in statement else None
+        self.principal = _principals(statement["Principal"]) if "Principal" in statement else None
+        self.not_principal = _principals(statement["NotPrincipal"]) if "NotPrincipal" in statement else None
+        self.tests = [_test(operator, key, value)
+                      for operator, block in statement.get("Condition", {}).items()
+                      for key, value in block.items()]
+
+    def matches(self, principal, action, resource, context):
+        """Return True, ACCOUNT (matched only through an account principal) or False."""
+        if self.action is not None and not self.action(action, context):
+            return False
+        if self.not_action is not None and self.not_action(action, context):
+            return False
+        if self.resource is not None and not self.resource(resource, context):
+            return False
+        if self.not_resource is not None and self.not_resource(resource, context):
+            return False
+        matched = self.principal(principal) if self.principal is not None else True
+        if not matched:
+            return False
+        if self.not_principal is not None and self.not_principal(principal):
+            return False
+        return matched if all(test(context) for test in self.tests) else False
+
+
+def _entity(principal):
+    """Return (account, kind, name) for a principal ARN or ``kind/name``."""
+    if principal.startswith("arn:"):
+        parts = principal.split(":", 5)
+        account, path = parts[4], parts[5]
+        kind, _, rest = path.partition("/")
+        if kind == "assumed-role":
+            return account, "role", rest.split("/")[0]
+        return account, kind, rest.rsplit("/", 1)[-1]
+    kind, _, name = principal.partition("/")
+    return None, kind, name
+
+
+def _principals(value):
+    """Compile a Principal element into test(principal).
+
+    The test returns True for a principal named outright and ACCOUNT for one
+    that only matches through its account (``123456789012`` or
+    ``arn:aws:iam::123456789012:root``).
+    """
+    if value == "*":
+        return lambda principal: True
+    names = set()
+    accounts = set()
+    for kind, entries in value.items():
+        for entry in _listed(entries):
+            if entry == "*":
+                return lambda principal: True
+            if kind == "AWS" and (entry.isdigit() or entry.endswith(":root")):
+                accounts.add(entry.split(":")[4] if entry.startswith("arn:") else entry)
+            names.add(entry)
+
+    def test(principal):
+        if principal in names:
+            return True
+        account, kind, name = _entity(principal)
+        if kind == "role" and account and f"arn:aws:iam::{account}:role/{name}" in names:
+            return True
+        return ACCOUNT if account in accounts else False
+    return test
+
+
+class PolicySet:
+    """Compiled identity and resource policies with a per-service index."""
+
+    def __init__(self, identity, resource):
+        self.identity = []
+        for label, attached, document in identity:
+            statements = self._compile(label, document)
+            self.identity.append((attached, self._index(statements)))
+        self.resource = []
+        for label, arn, document in resource:
+            statements = self._compile(label, document, arn)
+            self.resource.append((resource_glob(arn), self._index(statements)))
+        self.memo = {}
+
+    @staticmethod
+    def _compile(label, document, arn=None):
+        statements = _listed(document.get("Statement"))
+        return [Statement(f"{label}#{s.get('Sid') or i}", s, arn)
+                for i, s in enumerate(statements, 1)]
+
+    @staticmethod
+    def _index(statements):
+        index = {}
+        for statement in statements:
+            for service in statement.services:
+                index.setdefault(service, []).append(statement)
+        return index
+
+    def _candidates(self, index, service):
+        return index.get(service, []) + index.get("*", [])
+
+    def decide(self, principal, action, resource, context, groups=()):
+        """Return (decision, statement label) for one request."""
+        service = action.split(":", 1)[0].lower()
+        _, kind, name = _entity(principal)
+        allowed = None
+        candidates = []
+        for attached, index in self.identity:
+            if name in attached.get(kind, ()) or attached["group"].intersection(groups):
+                candidates.extend(self._candidates(index, service))
+        for arn, index in self.resource:
+            if arn(resource):
+                candidates.extend(self._candidates(index, service))
+        for statement in candidates:
+            matched = statement.matches(principal, action, resource, context)
+            if matched:
+                if statement.effect == DENY:
+                    return DENY, statement.label
+                # A resource policy naming the principal's own account only
+                # delegates to its identity policies, which are checked here too.
+                if matched is not ACCOUNT:
+                    allowed = allowed or statement.label
+        return (ALLOW, allowed) if allowed else (DENY, IMPLICIT)
+
+    def decide_line(self, line):
+        """Decide one JSON request line, memoized on the line."""
+        result = self.memo.get(line)
+        if result is None:
+            request = json.loads(line)
+            context = {key.lower(): value for key, value in request.get("context", {}).items()}
+            result = self.decide(request["principal"], request["action"], request.get("resource", "*"),
+                                 context, request.get("groups", ())) + (request.get("expect"),)
+            if len(self.memo) >= MEMO_LIMIT:
+                self.memo.clear()
+            self.memo[line] = result
+        return result
+
+
+## -- Batches
+_policies = None
+
+
+def _init(identity, resource):
+    global _policies
+    _policies = PolicySet(identity, resource)
+
+
+def evaluate_range(path, start, end, decisions_path=None):
+    """Evaluate the request lines starting in [start, end) of ``path``."""
+    counts = Counter()
+    mismatches = []
+    out = open(decisions_path, "w") if decisions_path else None
+    with open(path, "rb") as requests:
+        if start:
+            # A line starting at ``start`` is ours; one starting before it belongs
+            # to the previous range, so skip through the newline before ``start``.
+            requests.seek(start - 1)
+            requests.readline()
+        else:
+            requests.seek(0)
+        position = requests.tell()
+        while position < end:
+            raw = requests.readline()
+            if not raw:
+                break
+            position += len(raw)
+            line = raw.decode().strip()
+            if not line:
+                continue
+            decision, label, expect = _policies.decide_line(line)
+            counts[decision, label] += 1
+            if expect and expect.lower() != decision.lower() and len(mismatches) < MISMATCH_LIMIT:
+                mismatches.append((position - len(raw), line, decision, label))
+            if out:
+                out.write(json.dumps({"decision": decision, "statement": label}) + "\n")
+    if out:
+        out.close()
+    return counts, mismatches
+
+
+def simulate(identity, resource, path, workers=None, decisions=None):
+    """Evaluate a request file; returns (Counter of (decision, label), mismatches)."""
+    size = os.path.getsize(path)
+    ranges = [(offset, min(offset + CHUNK_BYTES, size)) for offset in range(0, size, CHUNK_BYTES)]
+    parts = [f"{decisions}.part{i}" if decisions else None for i in range(len(ranges))]
+    counts = Counter()
+    mismatches = []
+    if len(ranges) < 2 or workers == 1:
+        _init(identity, resource)
+        results = [evaluate_range(path, start, end, part) for (start, end), part in zip(ranges, parts)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init,
+                                 initargs=(identity, resource)) as pool:
+            results = list(pool.map(evaluate_range, [path] * len(ranges),
+                                    [start for start, _ in ranges], [end for _, end in ranges], parts))
+    for range_counts, range_mismatches in results:
+        counts.update(range_counts)
+        mismatches.extend(range_mismatches)
+    if decisions:
+        with open(decisions, "w") as out:
+            for part in parts:
+                with open(part) as f1:
+                    out.write(f1.read())
+                os.remove(part)
+    return counts, sorted(mismatches)[:MISMATCH_LIMIT]
+
+
+def _parameter(text):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text}")
+    return name, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate requests against the IAM policies of templates")
+    parser.add_argument("templates", nargs="+", help="template JSON files, then the request file")
+    parser.add_argument("--parameter", action="append", type=_parameter, default=[],
+                        metavar="NAME=VALUE", help="template parameter or pseudo parameter value (repeatable)")
+    parser.add_argument("--workers", type=int, help="processes used for the request file")
+    parser.add_argument("--decisions", help="write one decision per request line to this file")
+    args = parser.parse_args()
+    if len(args.templates) < 2:
+        parser.error("give at least one template and the request file")
+    *template_paths, requests = args.templates
+
+    templates = []
+    for path in template_paths:
+        with open(path) as f1:
+            templates.append(json.load(f1))
+    try:
+        identity, resource = load_policies(templates, dict(args.parameter))
+        PolicySet(identity, resource)  # compile once here to report errors early
+    except ValueError as e:
+        sys.exit(str(e))
+
+    started = time.perf_counter()
+    counts, mismatches = simulate(identity, resource, requests, args.workers, args.decisions)
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    allowed = sum(count for (decision, _), count in counts.items() if decision == ALLOW)
+    explicit = sum(count for (decision, label), count in counts.items()
+                   if decision == DENY and label != IMPLICIT)
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f}/s): "
+          f"{allowed} allowed, {total - allowed} denied ({explicit} explicitly)")
+    for (decision, label), count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"  {decision:<6}{label:<60}{count:>10}")
+    if mismatches:
+        print(f"{len(mismatches)} requests did not get the expected decision:")
+        for offset, line, decision, label in mismatches:
+            print(f"  byte {offset}: {decision} by {label}: {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
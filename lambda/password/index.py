@@ -0,0 +1,29 @@
+import logging
+import string
+import secrets
+import cfnresponse
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def random_string(size=12):
+    alphabet = string.ascii_letters + string.digits + string.punctuation
+    return ''.join(secrets.choice(alphabet) for _ in range(size))
+
+
+def lambda_handler(event, context):
+    logger.info('got event %s', event)
+    responseData = {}
+
+    if event['RequestType'] == 'Create':
+        number = int(event['ResourceProperties'].get('Length', 12))
+        rs = random_string(number)
+        responseData['final'] = rs
+
+    else:  # delete / update
+        rs = event['PhysicalResourceId']
+        responseData['final'] = rs
+
+    logger.info('responseData %s', responseData)
+    cfnresponse.send(event, context, cfnresponse.SUCCESS, responseData, responseData['final'])
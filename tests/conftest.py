@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The scripts import their helpers as top-level modules, the WAF ones from waf/.
+sys.path[:0] = [ROOT, os.path.join(ROOT, "waf")]
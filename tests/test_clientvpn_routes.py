@@ -0,0 +1,74 @@
+import ipaddress
+
+import pytest
+
+from clientvpn_routes import PrefixIndex, plan_routes, read_destinations
+
+
+def test_prefix_index_finds_the_longest_covering_entry():
+    index = PrefixIndex((ipaddress.ip_network(cidr), cidr) for cidr in ("10.0.0.0/8", "10.1.0.0/16"))
+    assert index.lookup(ipaddress.ip_network("10.1.2.0/24"))[1] == "10.1.0.0/16"
+    assert index.lookup(ipaddress.ip_network("10.2.0.0/16"))[1] == "10.0.0.0/8"
+    # Only entries containing all of the network match.
+    assert index.lookup(ipaddress.ip_network("10.0.0.0/7")) is None
+
+
+def test_destinations_collapse_without_widening():
+    plan = plan_routes([("172.16.0.0/24", "a"), ("172.16.1.0/24", "b"), ("172.16.0.128/25", "c"),
+                        ("192.168.0.0/24", "d"), ("172.16.0.0/24", "a")])
+    assert plan.routes == [("172.16.0.0/23", "a; b; c"), ("192.168.0.0/24", "d")]
+    assert plan.listed == 5
+    # 172.16.1.0/24 and 172.16.2.0/24 are adjacent but not one aligned block.
+    plan = plan_routes([("172.16.1.0/24", "a"), ("172.16.2.0/24", "b")])
+    assert [cidr for cidr, _ in plan.routes] == ["172.16.1.0/24", "172.16.2.0/24"]
+
+
+def test_only_unauthorized_routes_get_rules():
+    plan = plan_routes([("172.16.0.0/24", "a"), ("192.168.0.0/24", "b")],
+                       auth_rules=[("172.16.0.0/16", "VPC"), ("TargetCidrRange", "Parameter")])
+    assert plan.rules == [("192.168.0.0/24", "b")]
+
+
+def test_client_cidr_overlap_is_rejected_except_the_default_route():
+    with pytest.raises(ValueError, match="overlap the client CIDR"):
+        plan_routes([("10.0.2.0/24", "clients")])
+    assert plan_routes([("0.0.0.0/0", "Internet")]).routes == [("0.0.0.0/0", "Internet")]
+
+
+def test_quotas_and_address_families_are_checked():
+    destinations = [(f"172.16.{i * 2}.0/24", str(i)) for i in range(6)]
+    with pytest.raises(ValueError, match="6 destinations x 2 subnets need 12 routes"):
+        plan_routes(destinations, subnets=2)
+    with pytest.raises(ValueError, match="exceed the quota of 5"):
+        plan_routes(destinations, rule_quota=5)
+    with pytest.raises(ValueError, match="must be IPv4"):
+        plan_routes([("2001:db8::/32", "v6")])
+
+
+def test_long_descriptions_are_truncated():
+    plan = plan_routes([(f"172.16.{i}.0/24", str(i) * 100) for i in range(4)])
+    assert len(plan.routes[0][1]) == 255
+    assert plan.routes[0][1].endswith("...")
+
+
+def test_read_destinations_defaults_the_description(tmp_path):
+    path = tmp_path / "destinations.csv"
+    path.write_text("Cidr,Description\n10.1.0.0/16,Office\n10.2.0.0/16,\n10.3.0.300/16,Bad\n")
+    rows = read_destinations(str(path))
+    assert next(rows) == (ipaddress.ip_network("10.1.0.0/16"), "Office")
+    assert next(rows) == (ipaddress.ip_network("10.2.0.0/16"), "Access to 10.2.0.0/16")
+    with pytest.raises(ValueError, match=r"destinations\.csv:4: invalid Cidr"):
+        next(rows)
+
+
+def test_rule_and_route_ids_do_not_depend_on_their_neighbours():
+    from clientvpn import VPC_RULE, build_template
+
+    routes = [("172.16.0.0/24", "a"), ("192.168.0.0/24", "b")]
+    rules = [VPC_RULE, ("172.16.0.0/24", "a"), ("192.168.0.0/24", "b")]
+    both = set(build_template(["subnet-1"], rules, routes).resources)
+    one = set(build_template(["subnet-1"], rules[:1] + rules[2:], routes[1:]).resources)
+    assert {"ClientVPNAuthRule192x168x0x0n24", "ClientVpnRoute192x168x0x0n24Subnet1"} <= one
+    assert one < both
+    with pytest.raises(ValueError, match="more than one authorization rule"):
+        build_template(["subnet-1"], rules + [("192.168.0.0/24", "again")])
@@ -0,0 +1,69 @@
+import pytest
+
+from iam_actions import compress_actions, compress_policy, expand, glob
+
+ACTIONS = {
+    "cloudwatch": ["DescribeAlarmHistory", "DescribeAlarms", "DescribeAlarmsForMetric", "GetMetricData",
+                   "GetMetricStatistics", "ListMetrics", "PutMetricAlarm", "PutMetricData"],
+    "ec2": ["DescribeImages", "DescribeInstances", "DescribeRegions", "RunInstances"],
+}
+CATALOG = {service: {action.lower(): action for action in actions} for service, actions in ACTIONS.items()}
+
+
+def test_glob_is_case_insensitive():
+    assert glob("Describe*")("describeinstances")
+    assert glob("Get?etricData")("GetMetricData")
+    assert not glob("Describe*")("RunInstances")
+
+
+def test_expand_reports_what_the_catalog_cannot_resolve():
+    granted, unknown = expand(["ec2:Describe*", "es:ESHttpGet", "ec2:NoSuchAction"], CATALOG)
+    assert granted == {"ec2": {"describeimages", "describeinstances", "describeregions"}}
+    assert unknown == ["es:ESHttpGet", "ec2:NoSuchAction"]
+
+
+def test_existing_wildcards_are_kept_and_new_ones_only_when_widening():
+    entries = ["ec2:DescribeImages", "ec2:DescribeInstances", "ec2:DescribeRegions",
+               "cloudwatch:DescribeAlarmHistory", "cloudwatch:DescribeAlarms",
+               "cloudwatch:DescribeAlarmsForMetric"]
+    result, report = compress_actions(entries, CATALOG)
+    assert result == entries
+    assert report["widened"] == []
+    result, report = compress_actions(entries, CATALOG, widen=True)
+    assert result == ["ec2:Describe*", "cloudwatch:Describe*"]
+    assert report["widened"] == result
+    assert report["after"] < report["before"]
+
+    result, report = compress_actions(["cloudwatch:Get*", "cloudwatch:GetMetricData"], CATALOG)
+    assert result == ["cloudwatch:Get*"]
+    assert report["widened"] == []
+
+
+def test_patterns_are_cut_at_word_boundaries():
+    result, _ = compress_actions(["cloudwatch:Put*", "cloudwatch:DescribeAlarms",
+                                  "cloudwatch:DescribeAlarmsForMetric"], CATALOG, widen=True)
+    assert result == ["cloudwatch:DescribeAlarms*", "cloudwatch:Put*"]
+    assert expand(result, CATALOG) == expand(["cloudwatch:Put*", "cloudwatch:DescribeAlarms",
+                                              "cloudwatch:DescribeAlarmsForMetric"], CATALOG)
+
+
+def test_unknown_entries_and_star_pass_through():
+    result, report = compress_actions(["es:ESHttpGet", "ec2:DescribeImages"], CATALOG)
+    assert result == ["es:ESHttpGet", "ec2:DescribeImages"]
+    assert report["kept"] == ["es:ESHttpGet"]
+    assert compress_actions(["ec2:RunInstances", "*"], CATALOG)[0] == ["*"]
+
+
+def test_compress_policy_keeps_a_single_statement_dict():
+    document = {"Version": "2012-10-17", "Statement": {"Effect": "Allow", "Resource": "*",
+                                                       "Action": ["ec2:Describe*", "ec2:DescribeRegions"]}}
+    compressed, reports = compress_policy(document, CATALOG)
+    assert compressed["Statement"]["Action"] == ["ec2:Describe*"]
+    assert document["Statement"]["Action"] == ["ec2:Describe*", "ec2:DescribeRegions"]
+    assert len(reports) == 1
+
+
+@pytest.mark.parametrize("entries", [["ec2:*"], ["cloudwatch:List*", "ec2:RunInstances"]])
+def test_result_grants_the_same_actions(entries):
+    result, _ = compress_actions(entries, CATALOG, widen=True)
+    assert expand(result, CATALOG)[0] == expand(entries, CATALOG)[0]
@@ -0,0 +1,73 @@
+import pytest
+from troposphere import Template
+
+from iam_policy import (
+    GROUP_INLINE_LIMIT,
+    USER_INLINE_LIMIT,
+    add_policies,
+    inline_limit,
+    pack_policy,
+    policy_size,
+)
+
+REGION = {"StringEquals": {"aws:RequestedRegion": "us-east-1"}}
+
+
+def _statement(sid, count, condition=REGION):
+    return {"Sid": sid, "Effect": "Allow", "Resource": "*", "Condition": condition,
+            "Action": [f"ec2:Action{sid}{i:04d}" for i in range(count)]}
+
+
+def _document(*statements):
+    return {"Version": "2012-10-17", "Statement": list(statements)}
+
+
+def _actions(documents):
+    return sorted(action for document in documents for statement in document["Statement"]
+                  for action in statement["Action"])
+
+
+def test_size_ignores_whitespace():
+    assert policy_size({"Action": ["ec2:A", "ec2:B"]}) == len('{"Action":["ec2:A","ec2:B"]}')
+
+
+def test_inline_limit_is_the_smallest_attached():
+    assert inline_limit(groups=["Devs"]) == GROUP_INLINE_LIMIT
+    assert inline_limit(groups=["Devs"], users=["alice"]) == USER_INLINE_LIMIT
+    assert inline_limit() == GROUP_INLINE_LIMIT
+
+
+def test_statements_are_packed_whole_when_they_fit():
+    statements = [_statement(sid, 40) for sid in "ABCDE"]
+    documents = pack_policy(_document(*statements), 2000)
+    assert all(policy_size(document) <= 2000 for document in documents)
+    assert sorted(s["Sid"] for d in documents for s in d["Statement"]) == list("ABCDE")
+    assert len(documents) < len(statements)
+
+
+def test_oversized_statements_split_by_action_and_keep_their_condition():
+    statement = _statement("A", 400)
+    documents = pack_policy(_document(statement), 2000)
+    assert len(documents) > 1
+    assert all(policy_size(document) <= 2000 for document in documents)
+    assert _actions(documents) == sorted(statement["Action"])
+    for document in documents:
+        for fragment in document["Statement"]:
+            assert fragment["Condition"] == REGION and fragment["Resource"] == "*"
+
+
+def test_not_action_statements_must_fit_whole():
+    statement = {"Effect": "Deny", "Resource": "*", "NotAction": [f"s3:Get{i}" for i in range(400)]}
+    with pytest.raises(ValueError, match="NotAction cannot be split"):
+        pack_policy(_document(statement), 2000)
+
+
+def test_add_policies_uses_managed_fragments_over_the_inline_limit():
+    t = Template()
+    small = add_policies(t, "Small", _document(_statement("A", 5)), "small", Groups=["Devs"])
+    assert [r.resource_type for r in small] == ["AWS::IAM::Policy"]
+    large = add_policies(t, "Large", _document(_statement("A", 300)), "large", Groups=["Devs"])
+    assert [r.title for r in large] == [f"Large{i}" for i in range(1, len(large) + 1)]
+    assert all(r.resource_type == "AWS::IAM::ManagedPolicy" for r in large)
+    assert all(r.properties["Groups"] == ["Devs"] for r in large)
+    assert _actions(r.properties["PolicyDocument"] for r in large) == sorted(_statement("A", 300)["Action"])
@@ -0,0 +1,84 @@
+import json
+
+import iam_simulate
+from iam_simulate import ALLOW, DENY, IMPLICIT, PolicySet, load_policies
+
+ALICE = "arn:aws:iam::123456789012:user/alice"
+APP_ROLE = "arn:aws:iam::123456789012:role/app"
+
+
+def _allow(action, resource="*", **extra):
+    statement = dict(Effect="Allow", Action=action, Resource=resource, **extra)
+    return {"Version": "2012-10-17", "Statement": [statement]}
+
+
+def _template():
+    return {
+        "Parameters": {"GroupParam": {"Type": "String", "Default": "Devs"}},
+        "Resources": {
+            "AppRole": {"Type": "AWS::IAM::Role", "Properties": {
+                "RoleName": "app",
+                "Policies": [{"PolicyName": "logs", "PolicyDocument": _allow("logs:PutLogEvents")}],
+            }},
+            "DevPolicy": {"Type": "AWS::IAM::Policy", "Properties": {
+                "Groups": [{"Ref": "GroupParam"}],
+                "PolicyDocument": {"Statement": [
+                    {"Effect": "Allow", "Action": "ec2:Describe*", "Resource": "*"},
+                    {"Effect": "Deny", "Action": "ec2:*", "Resource": "*",
+                     "Condition": {"StringNotEquals": {"aws:RequestedRegion": "us-east-1"}}},
+                ]},
+            }},
+        },
+    }
+
+
+def _policies(template=None):
+    return PolicySet(*load_policies([template or _template()], {}))
+
+
+def test_role_inline_policies_do_not_break_other_principals():
+    policies = _policies()
+    assert policies.decide(ALICE, "logs:PutLogEvents", "*", {})[0] == DENY
+    assert policies.decide(APP_ROLE, "logs:PutLogEvents", "*", {})[0] == ALLOW
+    assert policies.decide(f"{APP_ROLE.replace(':role/', ':assumed-role/')}/session",
+                           "logs:PutLogEvents", "*", {})[0] == ALLOW
+
+
+def test_group_policy_and_explicit_deny():
+    policies = _policies()
+    east = {"aws:requestedregion": "us-east-1"}
+    west = {"aws:requestedregion": "eu-west-1"}
+    assert policies.decide(ALICE, "ec2:DescribeInstances", "*", east, ["Devs"]) == (ALLOW, "DevPolicy#1")
+    assert policies.decide(ALICE, "ec2:DescribeInstances", "*", west, ["Devs"]) == (DENY, "DevPolicy#2")
+    assert policies.decide(ALICE, "ec2:DescribeInstances", "*", east, ["Ops"]) == (DENY, IMPLICIT)
+
+
+def test_account_principal_needs_an_identity_allow():
+    template = _template()
+    template["Resources"]["Repo"] = {"Type": "AWS::ECR::Repository", "Properties": {
+        "RepositoryName": "app",
+        "RepositoryPolicyText": {"Statement": [{
+            "Effect": "Allow", "Principal": {"AWS": "arn:aws:iam::123456789012:root"},
+            "Action": "ecr:BatchGetImage",
+        }]},
+    }}
+    template["Resources"]["AppRole"]["Properties"]["Policies"].append(
+        {"PolicyName": "ecr", "PolicyDocument": _allow("ecr:*")})
+    parameters = {"AWS::AccountId": "123456789012", "AWS::Region": "us-east-1"}
+    policies = PolicySet(*load_policies([template], parameters))
+    repository = "arn:aws:ecr:us-east-1:123456789012:repository/app"
+    assert policies.decide(ALICE, "ecr:BatchGetImage", repository, {}) == (DENY, IMPLICIT)
+    assert policies.decide(APP_ROLE, "ecr:BatchGetImage", repository, {})[0] == ALLOW
+
+
+def test_ranges_evaluate_every_line_once(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    lines = [json.dumps({"principal": APP_ROLE, "action": "logs:PutLogEvents", "n": i}) for i in range(10)]
+    path.write_text("\n".join(lines) + "\n")
+    iam_simulate._init(*load_policies([_template()], {}))
+    size = path.stat().st_size
+    # A boundary on the first byte of a line, one inside a line and odd sizes.
+    for step in (len(lines[0]) + 1, 7, 13, size):
+        total = sum(sum(iam_simulate.evaluate_range(str(path), start, min(start + step, size))[0].values())
+                    for start in range(0, size, step))
+        assert total == len(lines)
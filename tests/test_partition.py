@@ -0,0 +1,64 @@
+import pytest
+
+from tools.graph import DependencyGraph
+from tools.partition import TEMPLATE_BASE_URL, assign, partition
+
+
+def _chain_template(count):
+    """Topics where each one references the previous; the first takes parameters."""
+    resources = {"Topic0": {"Type": "AWS::SNS::Topic", "Properties": {
+        "TopicName": {"Ref": "Name"}, "Tags": [{"Key": "Subnets", "Value": {"Ref": "Subnets"}}]}}}
+    for i in range(1, count):
+        previous = {"Fn::GetAtt": [f"Topic{i - 1}", "TopicName"]}
+        resources[f"Topic{i}"] = {"Type": "AWS::SNS::Topic", "Properties": {"DisplayName": previous}}
+    return {
+        "Description": "Chain",
+        "Parameters": {"Name": {"Type": "String"}, "Subnets": {"Type": "List<AWS::EC2::Subnet::Id>"}},
+        "Resources": resources,
+        "Outputs": {"Last": {"Value": {"Ref": f"Topic{count - 1}"}}},
+    }
+
+
+def test_assign_respects_the_size_and_edge_order():
+    data = _chain_template(25)
+    part = assign(DependencyGraph(data), max_resources=10)
+    assert max(part.values()) + 1 == 3
+    assert max(list(part.values()).count(i) for i in set(part.values())) <= 10
+    for i in range(1, 25):
+        assert part[f"Topic{i - 1}"] <= part[f"Topic{i}"]
+
+
+def test_cut_edges_become_outputs_and_parameters():
+    parent, children = partition(_chain_template(25), max_resources=10, base_name="chain")
+    assert len(children) == 3
+    assert sum(len(child["Resources"]) for child in children) == 25
+    stacks = parent["Resources"]
+    assert list(stacks) == ["NestedStack1", "NestedStack2", "NestedStack3"]
+    assert TEMPLATE_BASE_URL in parent["Parameters"]
+    assert stacks["NestedStack1"]["Properties"]["TemplateURL"] == \
+        {"Fn::Sub": "${TemplateBaseURL}/chain-1.json"}
+    # The chain crosses two child boundaries.
+    cut = [(index, name) for index, child in enumerate(children, 1)
+           for name in child.get("Parameters", {}) if name not in ("Name", "Subnets")]
+    assert len(cut) == 2
+    for index, name in cut:
+        producer, output = stacks[f"NestedStack{index}"]["Properties"]["Parameters"][name]["Fn::GetAtt"]
+        assert output == f"Outputs.{name}"
+        assert name in children[int(producer[len("NestedStack"):]) - 1]["Outputs"]
+    assert parent["Outputs"]["Last"]["Value"]["Fn::GetAtt"][0] == "NestedStack3"
+
+
+def test_list_parameters_are_joined_for_the_child():
+    parent, children = partition(_chain_template(25), max_resources=10)
+    owner = next(i for i, child in enumerate(children) if "Topic0" in child["Resources"])
+    passed = parent["Resources"][f"NestedStack{owner + 1}"]["Properties"]["Parameters"]
+    assert passed["Name"] == {"Ref": "Name"}
+    assert passed["Subnets"] == {"Fn::Join": [",", {"Ref": "Subnets"}]}
+    assert children[owner]["Parameters"]["Subnets"]["Type"] == "List<AWS::EC2::Subnet::Id>"
+
+
+def test_missing_depends_on_targets_are_rejected():
+    data = _chain_template(3)
+    data["Resources"]["Topic2"]["DependsOn"] = "Nowhere"
+    with pytest.raises(ValueError, match="DependsOn targets do not exist"):
+        partition(data)
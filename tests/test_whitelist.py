@@ -0,0 +1,84 @@
+import ipaddress
+
+import pytest
+
+from whitelist import WAFV2_IPV4_PREFIXES, DescriptorArray, aggregate, read_cidrs, shard_blocks
+
+
+def _networks(*cidrs):
+    return [ipaddress.ip_network(cidr, strict=False) for cidr in cidrs]
+
+
+def _values(blocks):
+    return DescriptorArray(blocks).render()
+
+
+def test_duplicates_and_adjacent_ranges_collapse():
+    blocks, stats = aggregate(_networks("10.0.0.0/24", "10.0.1.0/24", "10.0.0.0/24", "10.0.0.5/32"))
+    assert _values(blocks) == ["10.0.0.0/23"]
+    assert stats == (4, 1, 1)
+
+
+def test_only_accepted_prefixes_are_emitted():
+    # WAF Regional has no /9-/15, so a /12 becomes sixteen /16s.
+    blocks, _ = aggregate(_networks("172.16.0.0/12"))
+    assert len(blocks) == 16
+    assert {prefix for _, _, prefix in blocks} == {16}
+    blocks, _ = aggregate(_networks("172.16.0.0/12"), ipv4_prefixes=WAFV2_IPV4_PREFIXES)
+    assert _values(blocks) == ["172.16.0.0/12"]
+
+
+def test_unaligned_ranges_use_the_fewest_blocks():
+    blocks, _ = aggregate(_networks("10.0.0.1/32", "10.0.0.2/31", "10.0.0.4/30"))
+    assert _values(blocks) == ["10.0.0.1/32", "10.0.0.2/31", "10.0.0.4/30"]
+    assert _values(aggregate(_networks("10.0.0.0/32", "10.0.0.1/32"))[0]) == ["10.0.0.0/31"]
+
+
+def test_ipv4_before_ipv6():
+    blocks, _ = aggregate(_networks("2001:db8::/48", "192.0.2.0/24"))
+    assert _values(blocks) == ["192.0.2.0/24", "2001:db8::/48"]
+    assert DescriptorArray(blocks).to_dict()[1] == {"Type": "IPV6", "Value": "2001:db8::/48"}
+
+
+def test_rows_expanding_past_the_limit_are_rejected(tmp_path):
+    path = tmp_path / "whitelist.csv"
+    path.write_text("Cidr\n10.0.0.0/8\n2001:db8::/112\n")
+    with pytest.raises(ValueError, match=r"whitelist\.csv:3: 2001:db8::/112 would be split into 65,536"):
+        aggregate(read_cidrs(str(path)))
+
+
+def test_invalid_rows_name_their_line(tmp_path):
+    path = tmp_path / "whitelist.csv"
+    path.write_text("Cidr\n10.0.0.0/8\nnot-an-ip\n")
+    with pytest.raises(ValueError, match=r"whitelist\.csv:3: invalid Cidr 'not-an-ip'"):
+        list(read_cidrs(str(path)))
+
+
+def _blocks(count):
+    return [(4, (10 << 24) + (i << 8), 24) for i in range(count)]
+
+
+def test_shard_count_is_the_smallest_that_fits():
+    blocks = _blocks(50)
+    shards = shard_blocks(blocks, limit=20)
+    assert len(shards) >= 3
+    assert all(len(shard) <= 20 for shard in shards)
+    assert sorted(block for shard in shards for block in shard) == sorted(blocks)
+    with pytest.raises(ValueError):
+        shard_blocks(blocks, shards=len(shards) - 1, limit=20)
+
+
+def test_adding_a_block_only_touches_its_shard():
+    blocks = _blocks(40)
+    before = [set(shard) for shard in shard_blocks(blocks, shards=4)]
+    after = [set(shard) for shard in shard_blocks(blocks + [(4, 192 << 24, 8)], shards=4)]
+    assert sum(a != b for a, b in zip(before, after)) == 1
+
+
+def test_explicit_shard_counts_are_checked():
+    with pytest.raises(ValueError, match="exceed the limit of 10"):
+        shard_blocks(_blocks(50), shards=11)
+    with pytest.raises(ValueError, match="empty"):
+        shard_blocks(_blocks(2), shards=8)
+    with pytest.raises(ValueError, match="do not fit"):
+        shard_blocks(_blocks(50), limit=4)
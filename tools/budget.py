@@ -0,0 +1,123 @@
+"""Template size budget analyzer.
+
+``serialize_sized`` produces exactly the JSON ``Template.to_json`` would (or
+the minified form) while recording the serialized size of every section,
+resource and property along the way, so attribution needs no second pass.
+``write_template`` uses it for every build; ``report`` compares the totals
+with CloudFormation's limits and lists the biggest contributors.
+
+    python -m tools.budget build/waf-ip-list.json [--top 10]
+    TEMPLATE_BUDGET=1 python waf/waf-ip-list.py
+"""
+import argparse
+import json
+import sys
+
+# CloudFormation quotas.
+INLINE_BODY_LIMIT = 51200
+S3_BODY_LIMIT = 1048576
+COUNT_LIMITS = {
+    "Resources": 500,
+    "Parameters": 200,
+    "Outputs": 200,
+    "Mappings": 200,
+}
+
+# Sizes are recorded down to Resources -> logical id -> Properties -> name.
+MAX_DEPTH = 4
+
+
+def _dump(value, depth, path, sizes, indent):
+    """Serialize ``value`` at ``depth`` as json.dumps(sort_keys=True) would."""
+    if isinstance(value, dict) and value and len(path) < MAX_DEPTH:
+        if indent is None:
+            items = [f"{json.dumps(key)}:{_dump(value[key], depth + 1, path + (key,), sizes, indent)}"
+                     for key in sorted(value)]
+            text = "{" + ",".join(items) + "}"
+        else:
+            inner = "\n" + " " * (indent * (depth + 1))
+            items = [f"{json.dumps(key)}: {_dump(value[key], depth + 1, path + (key,), sizes, indent)}"
+                     for key in sorted(value)]
+            text = "{" + inner + ("," + inner).join(items) + "\n" + " " * (indent * depth) + "}"
+    elif indent is None:
+        text = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    else:
+        # Strings never contain raw newlines in JSON, so re-indenting the
+        # nested dump line by line is exact.
+        text = json.dumps(value, indent=indent, sort_keys=True, separators=(",", ": "))
+        if depth:
+            text = text.replace("\n", "\n" + " " * (indent * depth))
+    if path:
+        sizes[path] = len(text)
+    return text
+
+
+def serialize_sized(t, minify=False):
+    """Return (JSON text, {path tuple: bytes}) for a Template or template dict."""
+    data = t if isinstance(t, dict) else t.to_dict()
+    sizes = {}
+    text = _dump(data, 0, (), sizes, None if minify else 1)
+    sizes[()] = len(text)
+    return text, sizes
+
+
+INLINE_CHECK = "body bytes (inline TemplateBody)"
+
+
+def budget(data, sizes):
+    """Return a list of (check, value, limit) for the template limits."""
+    checks = [
+        (INLINE_CHECK, sizes[()], INLINE_BODY_LIMIT),
+        ("body bytes (S3 TemplateURL)", sizes[()], S3_BODY_LIMIT),
+    ]
+    for section, limit in COUNT_LIMITS.items():
+        checks.append((f"{section.lower()}", len(data.get(section, {})), limit))
+    return checks
+
+
+def report(data, sizes, top=10, out=sys.stderr):
+    """Print limits and the largest resources / properties.
+
+    Returns False when the template cannot be deployed even from S3; a body
+    over the inline limit only needs uploading first.
+    """
+    ok = True
+    print(f"Template size budget ({sizes[()]} bytes):", file=out)
+    for check, value, limit in budget(data, sizes):
+        status = "ok" if value <= limit else "OVER"
+        if value > limit and check != INLINE_CHECK:
+            ok = False
+        print(f"  {check:<36}{value:>10} / {limit:<10}{value / limit:>7.1%}  {status}", file=out)
+
+    resources = sorted(((size, path[1]) for path, size in sizes.items()
+                        if len(path) == 2 and path[0] == "Resources"), reverse=True)
+    if resources:
+        print("Largest resources:", file=out)
+        for size, name in resources[:top]:
+            print(f"  {name:<48}{size:>10}  {size / sizes[()]:>6.1%}", file=out)
+    properties = sorted(((size, f"{path[1]}.{path[3]}") for path, size in sizes.items()
+                         if len(path) == 4 and path[0] == "Resources" and path[2] == "Properties"),
+                        reverse=True)
+    if properties:
+        print("Largest properties:", file=out)
+        for size, name in properties[:top]:
+            print(f"  {name:<48}{size:>10}  {size / sizes[()]:>6.1%}", file=out)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a generated template against CloudFormation size limits")
+    parser.add_argument("template", help="template JSON file")
+    parser.add_argument("--top", type=int, default=10, help="contributors to list")
+    parser.add_argument("--minify", action="store_true", help="measure the minified body")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        data = json.load(f1)
+    _, sizes = serialize_sized(data, args.minify)
+    if not report(data, sizes, args.top, sys.stdout):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Build every template in the repository in parallel.
+
+Finds each script that writes its template through ``write_template``, runs
+them across a process pool and prints the time taken per template and in
+total. Stops at the first failure, names the template that broke and exits
+non-zero. Templates whose inputs are unchanged are restored from the build
+cache (see tools/cache.py) without running the script. Lambda handlers under
+lambda/ must first pass the cold start check in tools/coldstart.py.
+
+    python -m tools.build [--output-dir build] [--workers 4] [--no-cache] [script ...]
+"""
+import argparse
+import glob
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
+from tools.cache import TemplateCache, cache_key
+from tools.coldstart import COLD_START_BUDGET_MS, check
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def discover_handlers(root=ROOT):
+    """Return every Lambda handler module under ``root``/lambda."""
+    return sorted(glob.glob(os.path.join(root, "lambda", "*", "index.py")))
+
+
+def discover(root=ROOT):
+    """Return every script under ``root`` that writes a template."""
+    scripts = []
+    for path in sorted(glob.glob(os.path.join(root, "*.py")) +
+                       glob.glob(os.path.join(root, "*", "*.py"))):
+        if os.path.relpath(path, root).startswith("tools" + os.sep):
+            continue
+        with open(path, errors="replace") as source:
+            if "write_template(" in source.read():
+                scripts.append(path)
+    return scripts
+
+
+class BuildError(Exception):
+    """A template script failed; carries the formatted traceback."""
+
+    def __init__(self, script, details):
+        super().__init__(script, details)
+        self.script = script
+        self.details = details
+
+
+def build_one(script, output_dir):
+    """Run one script the way ``python <script>`` would, from its directory."""
+    start = time.perf_counter()
+    directory = os.path.dirname(script)
+    os.environ["TEMPLATE_OUTPUT_DIR"] = output_dir
+    os.environ["TEMPLATE_QUIET"] = "1"
+    os.chdir(directory)
+    sys.argv = [script]
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code:
+            raise BuildError(script, f"exited with status {e.code}")
+    except BaseException as e:
+        # Drop the driver / runpy frames; a SyntaxError has no script frame.
+        tb = e.__traceback__
+        while tb and tb.tb_frame.f_code.co_filename != script:
+            tb = tb.tb_next
+        raise BuildError(script, "".join(traceback.format_exception(type(e), e, tb)))
+    return script, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build all templates in parallel")
+    parser.add_argument("scripts", nargs="*", help="scripts to build (default: all)")
+    parser.add_argument("--output-dir", default=os.path.join(ROOT, "build"),
+                        help="where the json templates are written")
+    parser.add_argument("--workers", type=int, help="processes to use (default: CPU count)")
+    parser.add_argument("--no-cache", action="store_true", help="always run every script")
+    args = parser.parse_args()
+
+    scripts = [os.path.abspath(s) for s in args.scripts] or discover()
+    output_dir = os.path.abspath(args.output_dir)
+    cache = None if args.no_cache else TemplateCache()
+    start = time.perf_counter()
+    failed = None
+
+    # Each script builds into its own directory so its files can be cached.
+    keys = {}
+    build_dirs = {}
+    for script in list(scripts):
+        if cache:
+            try:
+                keys[script] = cache_key(script)
+            except SyntaxError:
+                keys[script] = None
+            if keys[script] and cache.restore(keys[script], output_dir):
+                print(f"  {os.path.relpath(script, ROOT):<50}  cached")
+                continue
+        build_dirs[script] = tempfile.mkdtemp(prefix="template-build-")
+
+    # Handlers are inputs of the scripts that package them, so a change to one
+    # is a cache miss; nothing to check when every template was restored.
+    if build_dirs:
+        for handler in discover_handlers():
+            cold_ms, problems = check(handler)
+            print(f"  {os.path.relpath(handler, ROOT):<50}{cold_ms:>7.1f}ms cold start "
+                  f"(budget {COLD_START_BUDGET_MS:g}ms)")
+            if problems:
+                print(f"FAILED {os.path.relpath(handler, ROOT)}\n" + "\n".join(problems), file=sys.stderr)
+                for build_dir in build_dirs.values():
+                    shutil.rmtree(build_dir, ignore_errors=True)
+                sys.exit(1)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        pending = {pool.submit(build_one, script, build_dir)
+                   for script, build_dir in build_dirs.items()}
+        while pending and not failed:
+            done, pending = wait(pending, return_when=FIRST_EXCEPTION)
+            for future in done:
+                try:
+                    script, elapsed = future.result()
+                except BuildError as e:
+                    failed = failed or e
+                    continue
+                if cache and keys.get(script):
+                    cache.store(keys[script], build_dirs[script])
+                shutil.copytree(build_dirs[script], output_dir, dirs_exist_ok=True)
+                print(f"  {os.path.relpath(script, ROOT):<50}{elapsed:>8.2f}s")
+        for future in pending:
+            future.cancel()
+
+    for build_dir in build_dirs.values():
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    if failed:
+        print(f"FAILED {os.path.relpath(failed.script, ROOT)}\n{failed.details}", file=sys.stderr)
+        sys.exit(1)
+    print(f"Built {len(scripts)} templates into {output_dir} in "
+          f"{time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Content-addressed cache for generated templates.
+
+A template's key is a hash of its script source, the local modules and data
+files it references (e.g. waf/whitelist.py and WAF_IP_Whitelist.csv), the
+installed troposphere / awacs versions and any build parameters. Inputs are
+found by parsing the script, never by importing it, so a hit reuses the
+stored JSON without running any template code. The cache is size bounded and
+evicts least recently used entries; the packaged Lambda handlers kept in
+``.lambda/`` count toward the same limit.
+
+    python -m tools.cache list | clear | prune [--max-bytes N]
+"""
+import argparse
+import ast
+import hashlib
+import os
+import shutil
+import sys
+import time
+from importlib import metadata
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", os.path.join(ROOT, ".template-cache"))
+MAX_BYTES = int(os.environ.get("TEMPLATE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+PACKAGES = ("troposphere", "awacs", "troposphere-dns-certificate", "python-minifier")
+# Environment variables that change what a script writes.
+BUILD_ENV = ("TEMPLATE_MINIFY",)
+# Subdirectory where tools/package.py caches minified Lambda handlers.
+LAMBDA_DIR = ".lambda"
+
+
+def _module_file(name, directory):
+    """Resolve a dotted module name to a file in ``directory`` or the repo root."""
+    parts = name.split(".")
+    for base in dict.fromkeys((directory, ROOT)):
+        for candidate in (os.path.join(base, *parts) + ".py",
+                          os.path.join(base, *parts, "__init__.py")):
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+
+def inputs(script):
+    """Return the sorted local files ``script`` depends on, itself included."""
+    found = set()
+    queue = [os.path.abspath(script)]
+    while queue:
+        path = queue.pop()
+        if path in found:
+            continue
+        found.add(path)
+        if not path.endswith(".py"):
+            continue
+        directory = os.path.dirname(path)
+        with open(path, "rb") as source:
+            tree = ast.parse(source.read(), path)
+        for node in ast.walk(tree):
+            names = []
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module] + [f"{node.module}.{a.name}" for a in node.names]
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str) \
+                    and len(node.value) < 256 and "\n" not in node.value:
+                data = os.path.join(directory, node.value)
+                if os.path.isfile(data):
+                    queue.append(os.path.abspath(data))
+            for name in names:
+                module = _module_file(name, directory)
+                if module:
+                    queue.append(module)
+    return sorted(found)
+
+
+def cache_key(script, params=()):
+    """Hash everything that can change the template ``script`` generates."""
+    digest = hashlib.sha256()
+    for path in inputs(script):
+        digest.update(os.path.relpath(path, ROOT).encode() + b"\0")
+        with open(path, "rb") as source:
+            digest.update(hashlib.sha256(source.read()).digest())
+    for package in PACKAGES:
+        try:
+            version = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            version = "-"
+        digest.update(f"{package}={version}\0".encode())
+    digest.update(f"python={sys.version_info[:2]}\0".encode())
+    for name in BUILD_ENV:
+        digest.update(f"{name}={os.environ.get(name, '')}\0".encode())
+    for param in params:
+        digest.update(f"{param}\0".encode())
+    return digest.hexdigest()
+
+
+def _size(path):
+    """Return the bytes of the files under ``path``."""
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+class TemplateCache:
+    """Directory of ``<key>/`` entries holding the files a build wrote."""
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entries(self):
+        """Return (last use, bytes, key) of every entry, least recently used first.
+
+        Packaged Lambda sources and zips (``.lambda/<file>``, see tools/package.py)
+        are entries too, so they count toward the same limit.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for key in os.listdir(self.directory):
+            path = os.path.join(self.directory, key)
+            if os.path.isdir(path) and not key.startswith("."):
+                entries.append((os.path.getmtime(path), _size(path), key))
+        packaged = os.path.join(self.directory, LAMBDA_DIR)
+        if os.path.isdir(packaged):
+            for name in os.listdir(packaged):
+                path = os.path.join(packaged, name)
+                if os.path.isfile(path) and not name.endswith(".tmp"):
+                    entries.append((os.path.getmtime(path), os.path.getsize(path),
+                                    os.path.join(LAMBDA_DIR, name)))
+        return sorted(entries)
+
+    def restore(self, key, output_dir):
+        """Copy a cached entry into ``output_dir``; returns the files or None."""
+        path = os.path.join(self.directory, key)
+        if not os.path.isdir(path):
+            return None
+        os.utime(path)
+        os.makedirs(output_dir, exist_ok=True)
+        files = sorted(os.listdir(path))
+        for name in files:
+            source = os.path.join(path, name)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(output_dir, name), dirs_exist_ok=True)
+            else:
+                shutil.copy2(source, os.path.join(output_dir, name))
+        return files
+
+    def store(self, key, build_dir):
+        """Save every file a build wrote to ``build_dir`` under ``key``."""
+        os.makedirs(self.directory, exist_ok=True)
+        staging = os.path.join(self.directory, f".{key}.{os.getpid()}")
+        shutil.copytree(build_dir, staging)
+        try:
+            os.rename(staging, os.path.join(self.directory, key))
+        except OSError:
+            # Another build stored the same key first.
+            shutil.rmtree(staging)
+        self.prune()
+
+    def prune(self, max_bytes=None):
+        """Evict least recently used entries until the cache fits."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, key in entries:
+            if total <= limit:
+                break
+            path = os.path.join(self.directory, key)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            evicted += 1
+        return evicted
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the template build cache")
+    parser.add_argument("command", choices=["list", "clear", "prune"])
+    parser.add_argument("--max-bytes", type=int, help="size limit for prune")
+    args = parser.parse_args()
+
+    cache = TemplateCache()
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {cache.directory}")
+    elif args.command == "prune":
+        print(f"Evicted {cache.prune(args.max_bytes)} entries")
+    else:
+        entries = cache._entries()
+        for mtime, size, key in reversed(entries):
+            path = os.path.join(cache.directory, key)
+            files = ", ".join(sorted(os.listdir(path))) if os.path.isdir(path) else key
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime))
+            print(f"{key[:16]}  {used}  {size:>10}  {files}")
+        print(f"{len(entries)} entries, {sum(s for _, s, _ in entries)} bytes "
+              f"(limit {cache.max_bytes}) in {cache.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Local cold start and throughput harness for the Lambda handlers.
+
+Each sample imports the handler in a fresh interpreter with a stub
+``cfnresponse`` module, then replays fake CloudFormation Create, Update and
+Delete events through ``lambda_handler``. Reports the cold import time, the
+latency per invocation and the memory the import and invocations use, checks
+the responses sent back and exits non-zero when the median cold import is
+over the budget. ``tools.build`` runs the same check for every handler under
+lambda/ before building templates.
+
+    python -m tools.coldstart lambda/password/index.py [--samples 5] [--budget-ms 100]
+    LAMBDA_COLD_START_BUDGET_MS=50 python -m tools.build
+"""
+# Only modules the interpreter has loaded anyway are imported at the top, so
+# the child's import time is not flattered by modules it already loaded.
+import os
+import sys
+import time
+
+COLD_START_BUDGET_MS = float(os.environ.get("LAMBDA_COLD_START_BUDGET_MS", 100))
+REQUEST_TYPES = ("Create", "Update", "Delete")
+
+
+class _Context:
+    """The parts of the Lambda context object handlers and cfnresponse use."""
+    function_name = "coldstart"
+    aws_request_id = "00000000-0000-0000-0000-000000000000"
+    log_stream_name = "coldstart/local"
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+def _events():
+    """Fake custom resource events, one per request type."""
+    common = {
+        "ResponseURL": "http://localhost/response",
+        "StackId": "arn:aws:cloudformation:us-east-1:123456789012:stack/coldstart/local",
+        "RequestId": "coldstart",
+        "LogicalResourceId": "LambdaPassword",
+        "ResourceType": "Custom::Password",
+        "ResourceProperties": {"ServiceToken": "arn:aws:lambda:local", "Length": "22"},
+    }
+    for request_type in REQUEST_TYPES:
+        event = dict(common, RequestType=request_type)
+        if request_type != "Create":
+            event["PhysicalResourceId"] = "existing-physical-id"
+        if request_type == "Update":
+            event["OldResourceProperties"] = dict(common["ResourceProperties"], Length="12")
+        yield event
+
+
+def _check(event, response):
+    """Return a problem with the response sent for ``event``, or None."""
+    if response is None:
+        return "no response sent"
+    status, physical_id = response
+    if status != "SUCCESS":
+        return f"status {status}"
+    if event["RequestType"] == "Create":
+        if len(physical_id) != int(event["ResourceProperties"]["Length"]):
+            return f"{len(physical_id)} character password, expected {event['ResourceProperties']['Length']}"
+    elif physical_id != event["PhysicalResourceId"]:
+        return "physical resource id changed"
+    return None
+
+
+def _child(path, invocations):
+    """Import and invoke the handler once; prints the measurements as JSON."""
+    import importlib.util
+    import resource
+    import types
+
+    responses = []
+    cfnresponse = types.ModuleType("cfnresponse")
+    cfnresponse.SUCCESS, cfnresponse.FAILED = "SUCCESS", "FAILED"
+    cfnresponse.send = lambda event, context, status, data, physical_id=None, noEcho=False: \
+        responses.append((status, physical_id))
+    sys.modules["cfnresponse"] = cfnresponse
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location("index", path)
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+    cold = time.perf_counter() - start
+    import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+
+    import json
+    import tracemalloc
+
+    context = _Context()
+    events = list(_events())
+    latencies = {request_type: [] for request_type in REQUEST_TYPES}
+    problems = []
+    for i in range(invocations):
+        for event in events:
+            del responses[:]
+            start = time.perf_counter()
+            handler.lambda_handler(event, context)
+            latencies[event["RequestType"]].append(time.perf_counter() - start)
+            problem = i == 0 and _check(event, responses[-1] if responses else None)
+            if problem:
+                problems.append(f"{event['RequestType']}: {problem}")
+    tracemalloc.start()
+    for event in events:
+        handler.lambda_handler(event, context)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    json.dump({"cold": cold, "import_rss_kb": import_rss, "invoke_peak_bytes": peak,
+               "latencies": latencies, "problems": problems}, sys.stdout)
+
+
+def measure(path, samples=5, invocations=200):
+    """Run ``samples`` cold starts of the handler; returns the combined results."""
+    import json
+    import subprocess
+
+    runs = []
+    for _ in range(samples):
+        proc = subprocess.run([sys.executable, "-I", os.path.abspath(__file__), "--child",
+                               os.path.abspath(path), str(invocations)],
+                              capture_output=True, text=True)
+        if proc.returncode:
+            raise RuntimeError(f"{path} failed to import or run:\n{proc.stderr}")
+        runs.append(json.loads(proc.stdout))
+    latencies = {request_type: sorted(t for run in runs for t in run["latencies"][request_type])
+                 for request_type in REQUEST_TYPES}
+    return {
+        "cold": sorted(run["cold"] for run in runs),
+        "import_rss_kb": max(run["import_rss_kb"] for run in runs),
+        "invoke_peak_bytes": max(run["invoke_peak_bytes"] for run in runs),
+        "latencies": latencies,
+        "problems": sorted({p for run in runs for p in run["problems"]}),
+    }
+
+
+def _median(values):
+    return values[len(values) // 2]
+
+
+def check(path, budget_ms=COLD_START_BUDGET_MS, samples=3, invocations=20):
+    """Return (median cold start ms, problems) with the budget as a problem."""
+    results = measure(path, samples, invocations)
+    cold_ms = _median(results["cold"]) * 1000
+    problems = list(results["problems"])
+    if cold_ms > budget_ms:
+        problems.append(f"cold start {cold_ms:.1f} ms is over the {budget_ms:g} ms budget")
+    return cold_ms, problems
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure a Lambda handler's cold start and invocation latency")
+    parser.add_argument("handler", help="handler module, e.g. lambda/password/index.py")
+    parser.add_argument("--samples", type=int, default=5, help="fresh interpreters to import in")
+    parser.add_argument("--invocations", type=int, default=200, help="invocations per request type and sample")
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS,
+                        help="median cold import budget (default: $LAMBDA_COLD_START_BUDGET_MS or 100)")
+    args = parser.parse_args()
+
+    results = measure(args.handler, args.samples, args.invocations)
+    cold = results["cold"]
+    print(f"{args.handler}: {args.samples} cold starts, {args.invocations} invocations per request type each")
+    print(f"  cold import     {_median(cold) * 1000:>9.2f} ms median "
+          f"({cold[0] * 1000:.2f} - {cold[-1] * 1000:.2f} ms), budget {args.budget_ms:g} ms")
+    print(f"  import memory   {results['import_rss_kb']:>9} KB max RSS growth")
+    print(f"  invoke memory   {results['invoke_peak_bytes'] / 1024:>9.1f} KB peak traced")
+    for request_type, latencies in results["latencies"].items():
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"  {request_type:<16}{_median(latencies) * 1e6:>9.1f} us median, {p99 * 1e6:.1f} us p99, "
+              f"{len(latencies) / sum(latencies):,.0f} invocations/s")
+    problems = results["problems"]
+    if _median(cold) * 1000 > args.budget_ms:
+        problems.append(f"cold start over the {args.budget_ms:g} ms budget")
+    for problem in problems:
+        print(f"FAILED {problem}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        _child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
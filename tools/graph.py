@@ -0,0 +1,243 @@
+"""Resource dependency graph for a template.
+
+Extracts every ``Ref``, ``Fn::GetAtt``, ``Fn::Sub`` and ``DependsOn`` edge
+between resources and reports:
+
+* redundant ``DependsOn`` - the dependency is already implied by a Ref /
+  GetAtt, directly or through other resources;
+* over-constraining ``DependsOn`` - no data flows along the edge and removing
+  it shortens the longest dependency chain;
+* cycles, which CloudFormation rejects;
+* the longest dependency chain, i.e. how many resources have to be created
+  one after the other.
+
+    python -m tools.graph build/appstream-example.json [--dot]
+"""
+import argparse
+import json
+import re
+import sys
+
+DEPENDS_ON = "DependsOn"
+SUB_REFERENCE = re.compile(r"\$\{([^!][^}.]*)(?:\.[^}]*)?\}")
+
+
+def references(value, found):
+    """Collect (target, kind) for every Ref / GetAtt / Sub inside ``value``."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "Ref" and isinstance(item, str):
+                found.append((item, "Ref"))
+            elif key == "Fn::GetAtt":
+                target = item[0] if isinstance(item, list) else str(item).split(".", 1)[0]
+                found.append((target, "GetAtt"))
+            elif key == "Fn::Sub":
+                text, variables = (item[0], item[1] if len(item) > 1 else {}) \
+                    if isinstance(item, list) else (item, {})
+                found.extend((name, "Sub") for name in SUB_REFERENCE.findall(text)
+                             if name not in variables)
+                references(variables, found)
+                continue
+            references(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            references(item, found)
+    return found
+
+
+class DependencyGraph:
+    """Edges between the resources of a template.
+
+    ``edges[resource][dependency]`` is the set of edge kinds ("Ref", "GetAtt",
+    "Sub", "DependsOn") from ``resource`` to the resource it waits for.
+    """
+
+    def __init__(self, template):
+        data = template if isinstance(template, dict) else template.to_dict()
+        self.resources = data.get("Resources", {})
+        self.edges = {name: {} for name in self.resources}
+        for name, resource in self.resources.items():
+            body = {k: v for k, v in resource.items() if k != DEPENDS_ON}
+            for target, kind in references(body, []):
+                if target in self.resources:
+                    self.edges[name].setdefault(target, set()).add(kind)
+            depends_on = resource.get(DEPENDS_ON, [])
+            for target in [depends_on] if isinstance(depends_on, str) else depends_on:
+                self.edges[name].setdefault(target, set()).add(DEPENDS_ON)
+
+    def missing(self):
+        """Return (resource, target) for DependsOn targets that do not exist."""
+        return [(name, target) for name, deps in self.edges.items()
+                for target in deps if target not in self.resources]
+
+    def _reachable(self, start, skip):
+        """Resources reachable from ``start`` without using the edge ``skip``."""
+        seen = set()
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for target in self.edges.get(node, ()):
+                if (node, target) != skip and target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return seen
+
+    def redundant(self):
+        """Return (resource, target, reason) for DependsOn edges that add nothing."""
+        found = []
+        for name, deps in sorted(self.edges.items()):
+            for target, kinds in sorted(deps.items()):
+                if DEPENDS_ON not in kinds or target not in self.resources:
+                    continue
+                if kinds != {DEPENDS_ON}:
+                    found.append((name, target, f"already a {'/'.join(sorted(kinds - {DEPENDS_ON}))}"))
+                elif target in self._reachable(name, (name, target)):
+                    found.append((name, target, "implied through other dependencies"))
+        return found
+
+    def cycles(self):
+        """Return the strongly connected components that form cycles (Tarjan)."""
+        index, low, on_stack, stack, components = {}, {}, set(), [], []
+        for root in self.edges:
+            if root in index:
+                continue
+            work = [(root, iter(self.edges[root]))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, targets = work[-1]
+                for target in targets:
+                    if target not in self.edges:
+                        continue
+                    if target not in index:
+                        index[target] = low[target] = len(index)
+                        stack.append(target)
+                        on_stack.add(target)
+                        work.append((target, iter(self.edges[target])))
+                        break
+                    if target in on_stack:
+                        low[node] = min(low[node], index[target])
+                else:
+                    work.pop()
+                    if work:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[node])
+                    if low[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in self.edges[node]:
+                            components.append(sorted(component))
+        return components
+
+    def order(self):
+        """Resources in creation order (dependencies first); requires no cycles."""
+        waiting = {name: sum(t in self.edges for t in deps) for name, deps in self.edges.items()}
+        dependents = {name: [] for name in self.edges}
+        for name, deps in self.edges.items():
+            for target in deps:
+                if target in dependents:
+                    dependents[target].append(name)
+        ready = sorted(name for name, count in waiting.items() if not count)
+        ordered = []
+        while ready:
+            name = ready.pop()
+            ordered.append(name)
+            for dependent in dependents[name]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        if len(ordered) != len(self.edges):
+            raise ValueError("template has a dependency cycle")
+        return ordered
+
+    def longest_chain(self, weights=None, skip=None):
+        """Return (length, [resources]) of the heaviest dependency chain.
+
+        ``weights`` maps resource name to a cost (default 1 each); ``skip`` is
+        an edge to leave out.
+        """
+        best = {}
+        for name in self.order():
+            cost = weights[name] if weights else 1
+            previous = max(((best[t][0], t) for t in self.edges[name]
+                            if t in best and (name, t) != skip), default=(0, None))
+            best[name] = (previous[0] + cost, previous[1])
+        if not best:
+            return 0, []
+        length, name = max((value[0], name) for name, value in best.items())
+        chain = []
+        while name:
+            chain.append(name)
+            name = best[name][1]
+        return length, chain[::-1]
+
+    def over_constraining(self, weights=None):
+        """Return (resource, target, saved) for DependsOn-only edges on the critical path."""
+        length, _ = self.longest_chain(weights)
+        redundant = {(name, target) for name, target, _ in self.redundant()}
+        found = []
+        for name, deps in sorted(self.edges.items()):
+            for target, kinds in sorted(deps.items()):
+                if kinds != {DEPENDS_ON} or (name, target) in redundant or target not in self.resources:
+                    continue
+                shorter, _ = self.longest_chain(weights, skip=(name, target))
+                if shorter < length:
+                    found.append((name, target, length - shorter))
+        return found
+
+    def to_dot(self):
+        lines = ["digraph template {", "  rankdir=LR;"]
+        for name, deps in sorted(self.edges.items()):
+            lines.append(f'  "{name}";')
+            for target, kinds in sorted(deps.items()):
+                style = ' [style=dashed]' if kinds == {DEPENDS_ON} else ""
+                lines.append(f'  "{name}" -> "{target}"{style};')
+        lines.append("}")
+        return "\n".join(lines)
+
+
+def report(graph, out=sys.stdout):
+    """Print the findings; returns False when the graph cannot be deployed."""
+    ok = True
+    edges = sum(len(deps) for deps in graph.edges.values())
+    print(f"{len(graph.edges)} resources, {edges} dependencies", file=out)
+    for name, target in graph.missing():
+        ok = False
+        print(f"  MISSING    {name} -> {target} (no such resource)", file=out)
+    cycles = graph.cycles()
+    for component in cycles:
+        ok = False
+        print(f"  CYCLE      {' -> '.join(component)}", file=out)
+    for name, target, reason in graph.redundant():
+        print(f"  REDUNDANT  {name} DependsOn {target}: {reason}", file=out)
+    if cycles or not ok:
+        return ok
+    for name, target, saved in graph.over_constraining():
+        print(f"  CONSTRAINS {name} DependsOn {target}: no data dependency, "
+              f"lengthens the longest chain by {saved}", file=out)
+    length, chain = graph.longest_chain()
+    print(f"Longest chain ({length}): {' -> '.join(chain)}", file=out)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the resource dependency graph of a template")
+    parser.add_argument("template", help="template JSON file")
+    parser.add_argument("--dot", action="store_true", help="print the graph in Graphviz format")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        graph = DependencyGraph(json.load(f1))
+    if args.dot:
+        print(graph.to_dot())
+    elif not report(graph):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
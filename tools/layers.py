@@ -0,0 +1,219 @@
+"""Split a template into layered stacks that change at different rates.
+
+``split_layers`` takes an ordered list of layers, each naming the logical ids
+it owns, and returns one template per layer. Logical ids never change.
+Resources that are not listed join the first layer that uses them, or the
+last layer when nothing does. A reference to a resource in an earlier layer
+becomes an ``Fn::ImportValue`` of an export that the earlier layer gains.
+Exports are named ``<stack name>-<logical id>[-<attribute>]``, and the stack
+name of each earlier layer is a parameter of the later ones. Dependencies
+across layers are satisfied by deploying the layers in order, so such
+``DependsOn`` entries are dropped. A reference from an earlier layer to a
+later one is an error. Layers that end up without resources are left out.
+"""
+import re
+
+from tools.graph import SUB_REFERENCE, DependencyGraph, references
+
+# GetAtt attributes that are lists; exported joined and split on import.
+LIST_ATTRIBUTES = {
+    ("AWS::DirectoryService::MicrosoftAD", "DnsIpAddresses"),
+    ("AWS::DirectoryService::SimpleAD", "DnsIpAddresses"),
+    ("AWS::EC2::VPC", "CidrBlockAssociations"),
+    ("AWS::EC2::VPC", "Ipv6CidrBlocks"),
+}
+SECTIONS = ("Parameters", "Mappings", "Conditions", "Resources", "Outputs")
+
+
+def _stack_parameter(layer):
+    return "".join(part.capitalize() for part in re.split(r"[^A-Za-z0-9]+", layer)) + "StackName"
+
+
+def _names(value, found):
+    """Collect the parameter, mapping and condition names ``value`` uses."""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "Ref" and isinstance(item, str):
+                found.add(item)
+            elif key == "Fn::FindInMap":
+                found.add(item[0])
+            elif key in ("Condition", "Fn::If") and isinstance(item, (str, list)):
+                found.add(item if isinstance(item, str) else item[0])
+            elif key == "Fn::Sub":
+                text = item[0] if isinstance(item, list) else item
+                found.update(SUB_REFERENCE.findall(text))
+            _names(item, found)
+    elif isinstance(value, list):
+        for item in value:
+            _names(item, found)
+    return found
+
+
+def used_sections(data, parts):
+    """Return the Conditions, Mappings and Parameters of ``data`` that ``parts`` use."""
+    used = _names(parts, set())
+    sections = {}
+    for section in ("Conditions", "Mappings", "Parameters"):
+        kept = {key: value for key, value in data.get(section, {}).items() if key in used}
+        if section == "Conditions":
+            used |= _names(kept, set())
+        if kept:
+            sections[section] = kept
+    return sections
+
+
+def rewrite_references(value, remote, replace):
+    """Copy ``value`` with every Ref / GetAtt / Sub of a ``remote`` resource
+    replaced by ``replace(logical id, attribute or None)``."""
+    if isinstance(value, list):
+        return [rewrite_references(item, remote, replace) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        key, item = next(iter(value.items()))
+        if key == "Ref" and isinstance(item, str) and remote(item):
+            return replace(item, None)
+        if key == "Fn::GetAtt":
+            target, attribute = item if isinstance(item, list) else item.split(".", 1)
+            if remote(target):
+                return replace(target, attribute)
+        if key == "Fn::Sub":
+            text, variables = (item[0], dict(item[1]) if len(item) > 1 else {}) \
+                if isinstance(item, list) else (item, {})
+
+            def substitute(match):
+                target, _, attribute = match.group(1).partition(".")
+                if match.group(1) in variables or not remote(target):
+                    return match.group(0)
+                name = re.sub(r"[^A-Za-z0-9]", "", match.group(1))
+                variables[name] = replace(target, attribute or None)
+                return "${" + name + "}"
+
+            text = re.sub(r"\$\{([^!}][^}]*)\}", substitute, text)
+            variables = rewrite_references(variables, remote, replace)
+            return {"Fn::Sub": [text, variables] if variables else text}
+    return {key: rewrite_references(item, remote, replace) for key, item in value.items()}
+
+
+def drop_depends_on(resource, remote):
+    """Remove DependsOn entries naming ``remote`` resources; returns them."""
+    depends_on = resource.get("DependsOn")
+    if depends_on is None:
+        return []
+    targets = [depends_on] if isinstance(depends_on, str) else depends_on
+    kept = [target for target in targets if not remote(target)]
+    if kept:
+        resource["DependsOn"] = kept if isinstance(depends_on, list) else kept[0]
+    else:
+        del resource["DependsOn"]
+    return [target for target in targets if remote(target)]
+
+
+class _Layer:
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+        self.resources = {}
+        self.outputs = {}
+        self.exports = {}
+        self.imports = set()
+
+
+def split_layers(t, layers):
+    """Return [(layer name, template dict)] for ``layers`` = [(name, [ids])].
+
+    ``t`` is a Template or a template dict; the layers are returned in
+    deployment order, without the ones that own no resources.
+    """
+    data = t if isinstance(t, dict) else t.to_dict()
+    resources = data.get("Resources", {})
+    graph = DependencyGraph(data)
+    ordered = [_Layer(name, i) for i, (name, _) in enumerate(layers)]
+    owner = {}
+    for layer, (_, ids) in zip(ordered, layers):
+        for logical_id in ids:
+            if logical_id not in resources:
+                raise ValueError(f"layer {layer.name}: no resource {logical_id}")
+            owner[logical_id] = layer
+
+    # Dependents come before their dependencies in reversed creation order.
+    dependents = {name: [] for name in resources}
+    for name, deps in graph.edges.items():
+        for target in deps:
+            if target in dependents:
+                dependents[target].append(name)
+    for name in reversed(graph.order()):
+        if name not in owner:
+            users = [owner[d] for d in dependents[name]]
+            owner[name] = min(users, key=lambda layer: layer.index) if users else ordered[-1]
+    for name, deps in graph.edges.items():
+        for target in deps:
+            if target in owner and owner[target].index > owner[name].index:
+                raise ValueError(f"{name} ({owner[name].name}) depends on {target}, "
+                                 f"which is in the later {owner[target].name} layer")
+
+    def export(consumer, target, attribute=None):
+        producer = owner[target]
+        suffix = f"-{attribute.replace('.', '')}" if attribute else ""
+        output_id = re.sub(r"[^A-Za-z0-9]", "", target + (attribute or ""))
+        if output_id not in producer.exports:
+            value = {"Fn::GetAtt": [target, attribute]} if attribute else {"Ref": target}
+            listed = (resources[target]["Type"], attribute) in LIST_ATTRIBUTES
+            if listed:
+                value = {"Fn::Join": [",", value]}
+            producer.exports[output_id] = ({
+                "Description": f"{target}{'.' + attribute if attribute else ''} for later layers",
+                "Export": {"Name": {"Fn::Sub": "${AWS::StackName}" + f"-{target}{suffix}"}},
+                "Value": value,
+            }, listed)
+        consumer.imports.add(producer)
+        value = {"Fn::ImportValue": {"Fn::Sub": f"${{{_stack_parameter(producer.name)}}}-{target}{suffix}"}}
+        if producer.exports[output_id][1]:
+            value = {"Fn::Split": [",", value]}
+        return value
+
+    def localize(value, layer):
+        """Import what ``value`` uses from earlier layers."""
+        def remote(target):
+            return owner.get(target, layer) is not layer
+
+        def imported(target, attribute):
+            return export(layer, target, attribute)
+
+        value = rewrite_references(value, remote, imported)
+        drop_depends_on(value, remote)
+        return value
+
+    for name, resource in resources.items():
+        layer = owner[name]
+        layer.resources[name] = localize(resource, layer)
+    # A stack needs at least one resource, so layers left empty are not
+    # written; nothing imports from them, as they export nothing.
+    kept = [layer for layer in ordered if layer.resources]
+    for name, output in data.get("Outputs", {}).items():
+        used = [owner[t] for t, _ in references(output, []) if t in owner]
+        layer = max(used, key=lambda layer: layer.index) if used else kept[-1]
+        layer.outputs[name] = localize(output, layer)
+
+    templates = []
+    for layer in kept:
+        body = {key: value for key, value in data.items() if key not in SECTIONS}
+        if "Description" in data:
+            body["Description"] = f"{data['Description']} ({layer.name} layer)"
+        body.update(used_sections(data, [layer.resources, layer.outputs]))
+        parameters = body.setdefault("Parameters", {})
+        for producer in sorted(layer.imports, key=lambda layer: layer.index):
+            parameters[_stack_parameter(producer.name)] = {
+                "Description": f"Name of the {producer.name} layer stack",
+                "Type": "String",
+            }
+        if not parameters:
+            del body["Parameters"]
+        body["Resources"] = layer.resources
+        outputs = dict(layer.outputs)
+        outputs.update((key, value) for key, (value, _) in layer.exports.items())
+        if outputs:
+            body["Outputs"] = outputs
+        templates.append((layer.name, body))
+    return templates
+
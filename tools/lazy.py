@@ -0,0 +1,47 @@
+"""Lazy module loading for the template scripts.
+
+``lazy_module`` returns a placeholder that imports the real module on first
+attribute access. ``defer_imports`` installs placeholders for dependencies
+troposphere and its plugins import eagerly but a JSON build never touches
+(cfn_flip is only used by ``Template.to_yaml``); call it before importing
+troposphere.
+"""
+import importlib
+import importlib.util
+import sys
+import types
+
+# Imported by troposphere / its plugins at import time, used only on demand.
+DEFERRED = ("cfn_flip", "pkg_resources")
+
+
+class _LazyModule(types.ModuleType):
+    """Stands in for a module in sys.modules until one of its names is used."""
+
+    def __getattr__(self, attr):
+        module = self.__dict__.get("_lazy_target")
+        if module is None:
+            if sys.modules.get(self.__name__) is self:
+                del sys.modules[self.__name__]
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_target"] = module
+        return getattr(module, attr)
+
+
+def lazy_module(name):
+    """Return module ``name``, importing it only when an attribute is used."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    module = sys.modules[name] = _LazyModule(name)
+    return module
+
+
+def defer_imports(names=DEFERRED):
+    """Make the given modules lazy; ones that are not installed are skipped."""
+    for name in names:
+        try:
+            lazy_module(name)
+        except ModuleNotFoundError:
+            pass
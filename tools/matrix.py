@@ -0,0 +1,256 @@
+"""Render one template for every (account, region) variant of a matrix.
+
+The skeleton template is built once, by running the script (arguments after
+``--`` are passed to it) or by reading an already generated JSON file. The
+parameters a variant sets are then baked in: ``Ref``s to them become the
+values, ``Fn::Sub`` and ``Fn::Join`` that end up fully known become plain
+strings, and the parameters are dropped. ``AWS::AccountId`` and
+``AWS::Region`` are set from the account and region of each variant.
+
+Baking is done once, with a marker in place of every value, and the result
+is serialized once, exactly as ``write_template`` would. The text is split at
+the markers, so each variant is a join of the shared, already serialized
+fragments with its JSON escaped values; no template objects are rebuilt. The
+fast path is checked against a full bake and serialization of the first
+variant. Files are written atomically across worker processes.
+
+Variants are the rows of a CSV (``Account``, ``Region`` and one column per
+parameter) or the product of ``--accounts`` and ``--regions``. ``--set``
+values may use ``{account}`` and ``{region}``.
+
+    python -m tools.matrix iam-role-policy-region-restriction-example.py \\
+        --accounts 111111111111,222222222222 --regions us-east-1,eu-west-1 \\
+        --set RegionParam={region} --set GroupParam=Dev-{region} [--output-dir build/matrix]
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from tools.output import serialize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PSEUDO = ("AWS::AccountId", "AWS::Region")
+MARK = "\x01"
+# A marker as json.dumps writes it; names are parameter names, never escaped.
+MARKED = re.compile(r"\\u0001([^\\]+)\\u0001")
+SUB_VARIABLE = re.compile(r"\$\{([^!}][^}]*)\}")
+NAME = "{name}-{account}-{region}"
+
+
+## -- Baking
+def bake(value, values):
+    """Copy ``value`` with the Refs / Subs / Joins of ``values``' names resolved.
+
+    Subtrees without such references are returned as they are, not copied.
+    """
+    if isinstance(value, list):
+        items = [bake(item, values) for item in value]
+        return value if all(a is b for a, b in zip(items, value)) else items
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        key, item = next(iter(value.items()))
+        if key == "Ref" and item in values:
+            return values[item]
+        if key == "Fn::Sub":
+            text, variables = (item[0], item[1] if len(item) > 1 else {}) \
+                if isinstance(item, list) else (item, {})
+            text = SUB_VARIABLE.sub(lambda m: values[m.group(1)] if m.group(1) in values
+                                    and m.group(1) not in variables else m.group(0), text)
+            variables = bake(variables, values)
+            if not variables and "${" not in text:
+                return text
+            return {"Fn::Sub": [text, variables] if variables else text}
+        if key == "Fn::Join":
+            parts = bake(item[1], values)
+            if isinstance(parts, list) and all(isinstance(part, str) for part in parts):
+                return item[0].join(parts)
+            return value if parts is item[1] else {"Fn::Join": [item[0], parts]}
+    baked = {key: bake(item, values) for key, item in value.items()}
+    return value if all(baked[key] is value[key] for key in value) else baked
+
+
+def bake_template(data, values):
+    """Return ``data`` with ``values`` baked in and their parameters removed."""
+    baked = bake(data, values)
+    parameters = {name: spec for name, spec in data.get("Parameters", {}).items() if name not in values}
+    baked = dict(baked)
+    if parameters:
+        baked["Parameters"] = parameters
+    else:
+        baked.pop("Parameters", None)
+    return baked
+
+
+class Skeleton:
+    """A template serialized once, with holes where variant values go."""
+
+    def __init__(self, data, names, minify=False):
+        unknown = set(names) - set(data.get("Parameters", {})) - set(PSEUDO)
+        if unknown:
+            raise ValueError(f"not parameters of the template: {', '.join(sorted(unknown))}")
+        self.data = data
+        self.names = tuple(names)
+        self.minify = minify
+        marked = bake_template(data, {name: f"{MARK}{name}{MARK}" for name in names})
+        # Even positions are literal text, odd positions parameter names.
+        self.parts = MARKED.split(serialize(marked, minify))
+
+    def render(self, values):
+        """Return the template text for one variant's {name: value}."""
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = json.dumps(values[parts[i]])[1:-1]
+        return "".join(parts) + "\n"
+
+    def check(self, values):
+        """Raise ValueError unless render() equals a full bake of ``values``."""
+        expected = serialize(bake_template(self.data, values), self.minify) + "\n"
+        if self.render(values) != expected:
+            raise ValueError("rendered variant differs from the fully baked template")
+
+
+## -- Variants
+def variants(rows=None, accounts=(), regions=(), settings=()):
+    """Return [(account, region, {name: value})] from CSV rows or the product."""
+    if rows is None:
+        rows = [{"Account": account, "Region": region} for account in accounts for region in regions]
+    result = []
+    for row in rows:
+        account, region = row["Account"].strip(), row["Region"].strip()
+        values = {"AWS::AccountId": account, "AWS::Region": region}
+        values.update((name, value) for name, value in row.items()
+                      if name not in ("Account", "Region") and value)
+        values.update((name, value.format(account=account, region=region)) for name, value in settings)
+        result.append((account, region, values))
+    return result
+
+
+def _write(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f1:
+        f1.write(text)
+    os.replace(tmp_path, path)
+
+
+_skeleton = None
+
+
+def _init(skeleton):
+    global _skeleton
+    _skeleton = skeleton
+
+
+def _render_batch(batch):
+    written = 0
+    for path, values in batch:
+        text = _skeleton.render(values)
+        _write(path, text)
+        written += len(text)
+    return written
+
+
+def render_matrix(skeleton, jobs, workers=None, batch_size=256):
+    """Write every (path, values) job; returns the bytes written."""
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    if len(batches) < 2 or workers == 1:
+        _init(skeleton)
+        return sum(map(_render_batch, batches))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init, initargs=(skeleton,)) as pool:
+        return sum(pool.map(_render_batch, batches))
+
+
+def build_skeleton(source, argv=()):
+    """Return the template dict of a generated JSON file, or of running a script once."""
+    if source.endswith(".json"):
+        with open(source) as f1:
+            return json.load(f1)
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(os.environ, TEMPLATE_QUIET="1", TEMPLATE_OUTPUT_DIR=scratch, TEMPLATE_MINIFY="1",
+                   PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+        proc = subprocess.run([sys.executable, os.path.abspath(source)] + list(argv),
+                              capture_output=True, text=True, env=env,
+                              cwd=os.path.dirname(os.path.abspath(source)))
+        outputs = [name for name in os.listdir(scratch) if name.endswith(".json")]
+        if proc.returncode or len(outputs) != 1:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"{source} did not write exactly one template")
+        with open(os.path.join(scratch, outputs[0])) as f1:
+            return json.load(f1)
+
+
+def _setting(text):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {text}")
+    return name, value
+
+
+def _listed(text):
+    return [item.strip() for item in text.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a template for every account / region variant")
+    parser.add_argument("source", help="template script (run once) or generated template JSON")
+    parser.add_argument("matrix", nargs="?", help="CSV with Account, Region and parameter columns")
+    parser.add_argument("--accounts", type=_listed, default=[], help="comma separated account ids")
+    parser.add_argument("--regions", type=_listed, default=[], help="comma separated regions")
+    parser.add_argument("--set", action="append", type=_setting, default=[], metavar="NAME=VALUE",
+                        help="parameter value for every variant; may use {account} and {region}")
+    parser.add_argument("--name", default=NAME, help=f"file name pattern (default: {NAME})")
+    parser.add_argument("--output-dir", default=os.path.join(ROOT, "build", "matrix"))
+    parser.add_argument("--minify", action="store_true", help="write compact JSON")
+    parser.add_argument("--workers", type=int, help="processes used to write the variants")
+    # Everything after "--" is passed to the script untouched.
+    argv = sys.argv[1:]
+    script_argv = []
+    if "--" in argv:
+        argv, script_argv = argv[:argv.index("--")], argv[argv.index("--") + 1:]
+    args = parser.parse_args(argv)
+    if not args.matrix and not (args.accounts and args.regions):
+        parser.error("give a matrix CSV or both --accounts and --regions")
+
+    start = time.perf_counter()
+    data = build_skeleton(args.source, script_argv)
+    built = time.perf_counter()
+    rows = None
+    if args.matrix:
+        with open(args.matrix, newline="") as f1:
+            rows = list(csv.DictReader(f1))
+    matrix = variants(rows, args.accounts, args.regions, args.set)
+    if not matrix:
+        parser.error("the matrix has no variants")
+    name = os.path.splitext(os.path.basename(args.source))[0]
+    try:
+        skeleton = Skeleton(data, sorted(set().union(*(values for _, _, values in matrix))),
+                            args.minify or os.environ.get("TEMPLATE_MINIFY", "").lower() in ("1", "true", "yes"))
+        skeleton.check(matrix[0][2])
+    except ValueError as e:
+        sys.exit(str(e))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    jobs = []
+    for account, region, values in matrix:
+        missing = set(skeleton.names) - set(values)
+        if missing:
+            sys.exit(f"{account} {region}: no value for {', '.join(sorted(missing))}")
+        jobs.append((os.path.join(args.output_dir, args.name.format(name=name, account=account,
+                                                                      region=region) + ".json"), values))
+    if len({path for path, _ in jobs}) != len(jobs):
+        sys.exit(f"--name {args.name} gives several variants the same file name")
+    size = render_matrix(skeleton, jobs, args.workers)
+    done = time.perf_counter()
+    print(f"Skeleton built in {built - start:.3f}s; {len(jobs)} variants ({size:,} bytes) written to "
+          f"{args.output_dir} in {done - built:.3f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Shared output stage for the example scripts.
+
+Every script used to call ``t.to_json()`` twice (once for the file, once for
+stdout) and leave the file handle open. ``write_template`` serializes the
+template once, writes it atomically and optionally echoes it to stdout.
+
+Defaults can be changed without touching the scripts:
+
+    TEMPLATE_OUTPUT_DIR   directory the .json file is written to (default ./)
+    TEMPLATE_MINIFY=1     write compact JSON with no indentation
+    TEMPLATE_QUIET=1      do not echo the template to stdout
+    TEMPLATE_BUDGET=1     print the size budget report (tools/budget.py)
+"""
+import os
+import sys
+import time
+
+from tools.budget import report, serialize_sized
+
+
+def _flag(name):
+    return os.environ.get(name, "").lower() in ("1", "true", "yes")
+
+
+def serialize(t, minify=False):
+    """Return the template JSON, indented like troposphere or minified."""
+    return serialize_sized(t, minify)[0]
+
+
+def write_template(t, script, suffix="", output_dir=None, stdout=None, minify=None,
+                   budget=None):
+    """Serialize ``t`` once and write it to ``<output_dir>/<script name><suffix>.json``.
+
+    ``t`` is a Template or an already rendered template dict. Returns (path, bytes written, seconds taken).
+    """
+    if output_dir is None:
+        output_dir = os.environ.get("TEMPLATE_OUTPUT_DIR", "./")
+    if stdout is None:
+        stdout = not _flag("TEMPLATE_QUIET")
+    if minify is None:
+        minify = _flag("TEMPLATE_MINIFY")
+    if budget is None:
+        budget = _flag("TEMPLATE_BUDGET")
+
+    start = time.perf_counter()
+    # Byte attribution is collected while serializing, not in a second pass.
+    data = t if isinstance(t, dict) else t.to_dict()
+    text, sizes = serialize_sized(data, minify)
+    text += "\n"
+    body = text.encode()
+    name = os.path.splitext(os.path.basename(script))[0] + suffix + ".json"
+    path = os.path.join(output_dir, name)
+
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f1:
+            f1.write(body)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    elapsed = time.perf_counter() - start
+
+    if stdout:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    print(f"Wrote {path} ({len(body)} bytes in {elapsed:.3f}s)", file=sys.stderr)
+    if budget:
+        report(data, sizes)
+    return path, len(body), elapsed
@@ -0,0 +1,151 @@
+"""Packaging stage for the Lambda handlers used by custom resources.
+
+Handlers live as ordinary modules under lambda/ so they can be imported,
+tested and linted. ``lambda_code`` minifies a handler and returns a ``Code``
+with the source inline when it fits CloudFormation's ZipFile limit; otherwise
+it writes a deterministic zip next to the template and points ``Code`` at S3.
+The minified source and the zip are cached by content hash, so an unchanged
+handler is not repackaged on every build.
+
+    python -m tools.package lambda/password/index.py [--zip] [--output-dir build]
+"""
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import tokenize
+import zipfile
+from importlib import metadata
+
+from tools.cache import CACHE_DIR, LAMBDA_DIR
+
+# CloudFormation rejects inline Code.ZipFile sources longer than this.
+ZIPFILE_LIMIT = 4096
+LAMBDA_CACHE = os.path.join(CACHE_DIR, LAMBDA_DIR)
+# Fixed entry metadata so the same source always gives the same zip bytes.
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+ZIP_MODE = 0o644 << 16
+
+
+def _minifier():
+    try:
+        import python_minifier
+    except ImportError:
+        return None
+    return python_minifier
+
+
+def _strip(source):
+    """Drop comments and blank lines when python-minifier is not installed."""
+    tokens = [tok for tok in tokenize.generate_tokens(io.StringIO(source).readline)
+              if tok.type != tokenize.COMMENT]
+    lines = tokenize.untokenize(tokens).splitlines()
+    return "\n".join(line.rstrip() for line in lines if line.strip()) + "\n"
+
+
+def minify(source):
+    """Return ``source`` minified; module level names are never renamed."""
+    python_minifier = _minifier()
+    if python_minifier is None:
+        return _strip(source)
+    return python_minifier.minify(source, remove_literal_statements=True,
+                                  rename_globals=False) + "\n"
+
+
+def _digest(source):
+    tool = "strip"
+    if _minifier() is not None:
+        tool = f"python-minifier={metadata.version('python-minifier')}"
+    return hashlib.sha256(f"{tool}\0{source}".encode()).hexdigest()
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f1:
+        f1.write(data)
+    os.replace(tmp_path, path)
+
+
+def minified(path, cache_dir=LAMBDA_CACHE):
+    """Return (minified source, content hash) for the handler at ``path``."""
+    with open(path) as f1:
+        source = f1.read()
+    digest = _digest(source)
+    cached = os.path.join(cache_dir, digest + ".py")
+    if os.path.exists(cached):
+        os.utime(cached)  # last use, for the cache's LRU eviction
+        with open(cached) as f1:
+            return f1.read(), digest
+    text = minify(source)
+    _write(cached, text.encode())
+    return text, digest
+
+
+def build_zip(path, output_dir, cache_dir=LAMBDA_CACHE):
+    """Copy a deterministic zip of the minified handler into ``output_dir``.
+
+    The archive is named ``<handler directory>-<hash>.zip`` and holds a single
+    entry with the handler's file name, so ``Handler`` stays the same.
+    """
+    text, digest = minified(path, cache_dir)
+    name = f"{os.path.basename(os.path.dirname(os.path.abspath(path)))}-{digest[:16]}.zip"
+    cached = os.path.join(cache_dir, name)
+    if os.path.exists(cached):
+        os.utime(cached)
+    else:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            info = zipfile.ZipInfo(os.path.basename(path), ZIP_DATE)
+            info.create_system = 3
+            info.external_attr = ZIP_MODE
+            archive.writestr(info, text, compress_type=zipfile.ZIP_DEFLATED, compresslevel=9)
+        _write(cached, buffer.getvalue())
+    os.makedirs(output_dir, exist_ok=True)
+    target = os.path.join(output_dir, name)
+    shutil.copyfile(cached, target)
+    return target
+
+
+def lambda_code(path, s3_bucket=None, s3_prefix="", output_dir=None, limit=ZIPFILE_LIMIT):
+    """Return a troposphere ``Code`` for the handler at ``path``.
+
+    The minified source is inlined when it fits ``limit``. Larger handlers are
+    zipped into ``output_dir`` (default: where the template is written) and
+    referenced as ``s3_prefix + <zip name>`` in ``s3_bucket``, which must then
+    be given.
+    """
+    from troposphere.awslambda import Code
+
+    text, _ = minified(path)
+    size = len(text.encode())
+    if size <= limit:
+        return Code(ZipFile=text)
+    if s3_bucket is None:
+        raise ValueError(f"{path}: {size} bytes minified is over the {limit} byte "
+                         f"ZipFile limit; pass s3_bucket to deploy it as a zip")
+    if output_dir is None:
+        output_dir = os.environ.get("TEMPLATE_OUTPUT_DIR", "./")
+    archive = build_zip(path, output_dir)
+    return Code(S3Bucket=s3_bucket, S3Key=s3_prefix + os.path.basename(archive))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minify a Lambda handler and check the inline ZipFile limit")
+    parser.add_argument("handler", help="handler module, e.g. lambda/password/index.py")
+    parser.add_argument("--zip", action="store_true", help="also build the deterministic zip")
+    parser.add_argument("--output-dir", default="./", help="where the zip is written")
+    args = parser.parse_args()
+
+    text, digest = minified(args.handler)
+    size = len(text.encode())
+    status = "fits inline" if size <= ZIPFILE_LIMIT else "needs a zip"
+    print(f"{args.handler}: {os.path.getsize(args.handler)} bytes, {size} minified "
+          f"/ {ZIPFILE_LIMIT} ZipFile limit ({status}), sha256 {digest[:16]}")
+    if args.zip:
+        print(f"Wrote {build_zip(args.handler, args.output_dir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Partition a large template into nested stacks.
+
+CloudFormation allows 500 resources per stack. ``partition`` cuts the
+resource graph into child ``AWS::CloudFormation::Stack`` templates of at most
+``max_resources`` each and returns the parent that creates them:
+
+1. resources are put in a creation order that keeps each one close to the
+   resources it references;
+2. the order is cut into equal chunks, one per child; every edge then points
+   to the same or an earlier child, so the children can be created in order;
+3. one or two refinement passes move a resource to the child holding most of
+   its neighbours when that keeps the child order valid and the child fits.
+
+Troposphere refuses a 501st resource, so bulk generators build into a
+``LargeTemplate`` and write it with ``write_nested``.
+
+Ordering costs O(n log n) and each refinement pass is linear in resources
+plus edges. A cut edge becomes an output of
+the producing child and a parameter of the consuming one, wired through the
+parent with ``Fn::GetAtt <child>.Outputs.<name>``. Original parameters are
+passed down from the parent and original outputs are re-exposed by it.
+
+    python -m tools.partition build/waf-ip-list.json [--max-resources 450] [--output-dir build]
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+import sys
+
+from troposphere import Template
+
+from tools.graph import DependencyGraph
+from tools.layers import LIST_ATTRIBUTES, drop_depends_on, rewrite_references, used_sections
+from tools.output import write_template
+
+RESOURCE_LIMIT = 500
+# Room for the parameters and outputs that cut edges add.
+MAX_RESOURCES = 450
+PARAMETER_LIMIT = 200
+OUTPUT_LIMIT = 200
+REFINE_PASSES = 2
+TEMPLATE_BASE_URL = "TemplateBaseURL"
+
+
+def _locality_order(graph):
+    """Creation order that keeps each resource close to what it references.
+
+    A topological sort that always takes the ready resource whose oldest
+    dependency was placed earliest, so nothing drifts far from its inputs.
+    Resources without dependencies wait until nothing else is ready; among
+    those the ones with the most dependents go first, so shared resources
+    lead and each chain stays together.
+    """
+    deps = {name: [t for t in targets if t in graph.edges] for name, targets in graph.edges.items()}
+    waiting = {name: len(targets) for name, targets in deps.items()}
+    dependents = {name: [] for name in graph.edges}
+    for name, targets in deps.items():
+        for target in targets:
+            dependents[target].append(name)
+
+    ready = [(math.inf, -len(dependents[name]), name) for name, count in waiting.items() if not count]
+    heapq.heapify(ready)
+    position = {}
+    order = []
+    while ready:
+        _, _, name = heapq.heappop(ready)
+        position[name] = len(order)
+        order.append(name)
+        for dependent in dependents[name]:
+            waiting[dependent] -= 1
+            if not waiting[dependent]:
+                oldest = min(position[t] for t in deps[dependent])
+                heapq.heappush(ready, (oldest, -len(dependents[dependent]), dependent))
+    return order
+
+
+def assign(graph, max_resources=MAX_RESOURCES, passes=REFINE_PASSES):
+    """Return {resource: child index}; every edge points to the same or an earlier child."""
+    graph.order()  # raises on cycles, which no partition can satisfy
+    order = _locality_order(graph)
+    count = max(1, math.ceil(len(order) / max_resources))
+    size = math.ceil(len(order) / count) if order else 0
+    part = {name: i // size for i, name in enumerate(order)} if order else {}
+    sizes = [0] * count
+    for index in part.values():
+        sizes[index] += 1
+
+    deps = {name: [t for t in targets if t in part] for name, targets in graph.edges.items()}
+    dependents = {name: [] for name in part}
+    for name, targets in deps.items():
+        for target in targets:
+            dependents[target].append(name)
+
+    for _ in range(passes):
+        moved = 0
+        for name in order:
+            current = part[name]
+            # Stay after every dependency and before every dependent.
+            low = max((part[t] for t in deps[name]), default=0)
+            high = min((part[d] for d in dependents[name]), default=count - 1)
+            counts = {}
+            for neighbour in deps[name] + dependents[name]:
+                counts[part[neighbour]] = counts.get(part[neighbour], 0) + 1
+            best = current
+            for index, links in counts.items():
+                if low <= index <= high and sizes[index] < max_resources \
+                        and links > counts.get(best, 0):
+                    best = index
+            if best != current:
+                sizes[current] -= 1
+                sizes[best] += 1
+                part[name] = best
+                moved += 1
+        if not moved:
+            break
+    # Children left empty by refinement are dropped and the rest renumbered.
+    used = {index: i for i, index in enumerate(sorted(set(part.values())))}
+    return {name: used[index] for name, index in part.items()}
+
+
+def partition(t, max_resources=MAX_RESOURCES, base_name="child"):
+    """Return (parent template dict, [child template dicts]) for ``t``.
+
+    Child ``i`` is read from ``${TemplateBaseURL}/<base_name>-<i>.json``.
+    """
+    data = t if isinstance(t, dict) else t.to_dict()
+    resources = data.get("Resources", {})
+    graph = DependencyGraph(data)
+    missing = graph.missing()
+    if missing:
+        raise ValueError(f"DependsOn targets do not exist: {missing}")
+    part = assign(graph, max_resources)
+    count = max(part.values(), default=-1) + 1
+    stack_ids = [f"NestedStack{i + 1}" for i in range(count)]
+    children = [{"resources": {}, "outputs": {}, "inputs": {}, "after": set()}
+                for _ in range(count)]
+
+    def cut(target, attribute, consumer=None):
+        """Output ``target`` from its child; return what the consumer uses instead."""
+        producer = part[target]
+        name = re.sub(r"[^A-Za-z0-9]", "", target + (attribute or ""))
+        listed = (resources[target]["Type"], attribute) in LIST_ATTRIBUTES
+        if name not in children[producer]["outputs"]:
+            value = {"Fn::GetAtt": [target, attribute]} if attribute else {"Ref": target}
+            children[producer]["outputs"][name] = {
+                "Value": {"Fn::Join": [",", value]} if listed else value,
+            }
+        value = {"Fn::GetAtt": [stack_ids[producer], f"Outputs.{name}"]}
+        if consumer is None:
+            return {"Fn::Split": [",", value]} if listed else value
+        children[consumer]["inputs"][name] = (value, listed)
+        return {"Ref": name}
+
+    for name, resource in resources.items():
+        index = part[name]
+
+        def remote(target):
+            return target in part and part[target] != index
+
+        def replace(target, attribute):
+            return cut(target, attribute, index)
+
+        resource = rewrite_references(resource, remote, replace)
+        for target in drop_depends_on(resource, remote):
+            children[index]["after"].add(part[target])
+        children[index]["resources"][name] = resource
+
+    parent_outputs = {}
+    for name, output in data.get("Outputs", {}).items():
+        parent_outputs[name] = rewrite_references(
+            output, lambda target: target in part, lambda target, attribute: cut(target, attribute))
+
+    templates = []
+    parent_resources = {}
+    for index, child in enumerate(children):
+        body = {key: value for key, value in data.items()
+                if key in ("AWSTemplateFormatVersion", "Transform")}
+        body["Description"] = f"{data.get('Description', 'Nested stack')} (part {index + 1} of {count})"
+        body.update(used_sections(data, [child["resources"], child["outputs"]]))
+        # Nested stack parameter values must be strings: list parameters are
+        # joined here and parsed again by the child's list-typed parameter.
+        passed = {key: {"Fn::Join": [",", {"Ref": key}]} if _is_list(spec) else {"Ref": key}
+                  for key, spec in body.get("Parameters", {}).items()}
+        parameters = body.setdefault("Parameters", {})
+        for name, (value, listed) in sorted(child["inputs"].items()):
+            parameters[name] = {"Type": "CommaDelimitedList" if listed else "String"}
+            passed[name] = value
+        if not parameters:
+            del body["Parameters"]
+        body["Resources"] = child["resources"]
+        if child["outputs"]:
+            body["Outputs"] = child["outputs"]
+        if len(parameters) > PARAMETER_LIMIT or len(child["outputs"]) > OUTPUT_LIMIT:
+            raise ValueError(f"part {index + 1} needs {len(parameters)} parameters and "
+                             f"{len(child['outputs'])} outputs; lower max_resources")
+        templates.append(body)
+
+        stack = {
+            "Type": "AWS::CloudFormation::Stack",
+            "Properties": {
+                "TemplateURL": {"Fn::Sub": f"${{{TEMPLATE_BASE_URL}}}/{base_name}-{index + 1}.json"},
+            },
+        }
+        if passed:
+            stack["Properties"]["Parameters"] = passed
+        after = sorted(stack_ids[i] for i in child["after"])
+        if after:
+            stack["DependsOn"] = after
+        parent_resources[stack_ids[index]] = stack
+
+    parent = {key: value for key, value in data.items() if key not in ("Resources", "Outputs")}
+    parent.setdefault("Parameters", {})
+    parent["Parameters"] = dict(parent["Parameters"], **{TEMPLATE_BASE_URL: {
+        "Description": "URL of the S3 prefix the nested stack templates were uploaded to",
+        "Type": "String",
+    }})
+    parent["Resources"] = parent_resources
+    if parent_outputs:
+        parent["Outputs"] = parent_outputs
+    return parent, templates
+
+
+def _is_list(parameter):
+    """Return True for a parameter whose Ref is a list (CommaDelimitedList, List<...>)."""
+    kind = parameter.get("Type", "")
+    return kind == "CommaDelimitedList" or "List<" in kind
+
+
+class LargeTemplate(Template):
+    """A Template that may hold more than 500 resources until it is partitioned."""
+
+    def add_resource(self, resource):
+        return self._update(self.resources, resource)
+
+
+def write_nested(t, script, suffix="", max_resources=MAX_RESOURCES, **kwargs):
+    """Write the parent as ``<script><suffix>.json`` and child ``i`` as ``<script><suffix>-<i>.json``."""
+    base_name = os.path.splitext(os.path.basename(script))[0] + suffix
+    parent, children = partition(t, max_resources, base_name)
+    write_template(parent, script, suffix, **kwargs)
+    for index, child in enumerate(children):
+        write_template(child, script, f"{suffix}-{index + 1}", **kwargs)
+    return parent, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split a template into nested stacks")
+    parser.add_argument("template", help="template JSON file")
+    parser.add_argument("--max-resources", type=int, default=MAX_RESOURCES, help="resources per child")
+    parser.add_argument("--output-dir", default="./", help="where the parent and children are written")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        data = json.load(f1)
+    script = os.path.splitext(os.path.basename(args.template))[0]
+    parent, children = write_nested(data, script, "-nested", args.max_resources,
+                                    output_dir=args.output_dir, stdout=False)
+    cut = sum(len(child.get("Outputs", {})) for child in children)
+    print(f"{len(data.get('Resources', {}))} resources in {len(children)} nested stacks, "
+          f"{cut} values passed between them", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
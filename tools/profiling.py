@@ -0,0 +1,190 @@
+"""Startup profiler for the template scripts.
+
+Runs a script under ``python -X importtime`` and reports the slowest imports
+plus the time spent in each build phase: imports (until the Template is
+created), parameters, resources, outputs, serialization and everything else.
+Time between two ``add_*`` calls is charged to the later call, since that is
+where the objects being added were constructed.
+
+    python -m tools.profiling waf/waf-ip-list.py [--top 15] [-- script args]
+"""
+import argparse
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PHASES = {
+    "add_parameter": "parameters",
+    "add_resource": "resources",
+    "add_output": "outputs",
+    "add_condition": "conditions",
+    "add_mapping": "mappings",
+}
+
+
+MARKER = "# tools.profiling: script start"
+
+
+def _patch(troposphere, state, totals):
+    """Wrap Template methods so each call charges time to its phase."""
+
+    def charge(phase, now):
+        totals[phase] = totals.get(phase, 0.0) + now - state["last"]
+        state["last"] = now
+
+    def wrap_add(method, phase):
+        def wrapper(self, *args, **kwargs):
+            charge(phase, time.perf_counter())
+            result = method(self, *args, **kwargs)
+            charge(phase, time.perf_counter())
+            return result
+        return wrapper
+
+    def wrap_serialize(method):
+        def wrapper(self, *args, **kwargs):
+            if state["depth"]:
+                return method(self, *args, **kwargs)
+            charge("other", time.perf_counter())
+            state["depth"] += 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                state["depth"] -= 1
+                charge("serialization", time.perf_counter())
+        return wrapper
+
+    init = troposphere.Template.__init__
+
+    def wrap_init(self, *args, **kwargs):
+        if "imports" not in totals:
+            charge("imports", time.perf_counter())
+        init(self, *args, **kwargs)
+
+    troposphere.Template.__init__ = wrap_init
+    for name, phase in PHASES.items():
+        setattr(troposphere.Template, name, wrap_add(getattr(troposphere.Template, name), phase))
+    for name in ("to_json", "to_yaml", "to_dict"):
+        setattr(troposphere.Template, name, wrap_serialize(getattr(troposphere.Template, name)))
+    # write_template turns the dict into JSON text with serialize_sized, which
+    # tools.output imported by name; wrap both bindings.
+    for module in ("tools.budget", "tools.output"):
+        module = sys.modules.get(module)
+        if module is not None and hasattr(module, "serialize_sized"):
+            module.serialize_sized = wrap_serialize(module.serialize_sized)
+
+
+def _run_child(script, report, argv):
+    """Run ``script``, timing its phases once it has imported troposphere.
+
+    troposphere is not imported up front so the script's own import order
+    (and any lazy loading it sets up) is what gets measured.
+    """
+    import builtins
+    import pkgutil  # used by runpy.run_path; keep it out of the report
+
+    totals = {}
+    state = {"last": time.perf_counter(), "depth": 0}
+    real_import = builtins.__import__
+
+    def hooked_import(*args, **kwargs):
+        module = real_import(*args, **kwargs)
+        troposphere = sys.modules.get("troposphere")
+        if troposphere is not None and hasattr(troposphere, "Template") \
+                and builtins.__import__ is hooked_import:
+            builtins.__import__ = real_import
+            _patch(troposphere, state, totals)
+        return module
+
+    directory = os.path.dirname(os.path.abspath(script))
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    sys.argv = [script] + argv
+    print(MARKER, file=sys.stderr, flush=True)
+    state["last"] = time.perf_counter()
+    builtins.__import__ = hooked_import
+    try:
+        runpy.run_path(script, run_name="__main__")
+    finally:
+        builtins.__import__ = real_import
+        now = time.perf_counter()
+        totals["other"] = totals.get("other", 0.0) + now - state["last"]
+        with open(report, "w") as f1:
+            json.dump(totals, f1)
+
+
+def parse_importtime(stderr):
+    """Return [(cumulative us, self us, depth, module)] from -X importtime output."""
+    imports = []
+    for line in stderr.split(MARKER, 1)[-1].splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((int(cumulative), int(own), depth, name.strip()))
+    return imports
+
+
+def profile(script, argv=(), top=15):
+    """Profile ``script`` in a fresh interpreter and print the report."""
+    with tempfile.TemporaryDirectory() as scratch:
+        report = os.path.join(scratch, "phases.json")
+        env = dict(os.environ, TEMPLATE_QUIET="1", TEMPLATE_OUTPUT_DIR=scratch,
+                   PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "tools.profiling", "--child", report,
+             os.path.abspath(script), "--"] + list(argv),
+            capture_output=True, text=True, env=env,
+        )
+        wall = time.perf_counter() - start
+        if not os.path.exists(report):
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"{script} failed before the profile was written")
+        with open(report) as f1:
+            phases = json.load(f1)
+
+    imports = parse_importtime(proc.stderr)
+    top_level = [i for i in imports if i[2] == 0]
+    print(f"{os.path.relpath(os.path.abspath(script), ROOT)}: {wall:.3f}s wall "
+          f"(interpreter start-up included)")
+    print("Phases:")
+    for phase, seconds in sorted(phases.items(), key=lambda p: -p[1]):
+        print(f"  {phase:<16}{seconds * 1000:>10.1f} ms")
+    print(f"Slowest imports (cumulative, top level; "
+          f"{sum(i[0] for i in top_level) / 1000:.1f} ms total):")
+    for cumulative, own_us, _, name in sorted(top_level, reverse=True)[:top]:
+        print(f"  {name:<48}{cumulative / 1000:>10.1f} ms")
+    print("Slowest modules (self time):")
+    for cumulative, own_us, _, name in sorted(imports, key=lambda i: -i[1])[:top]:
+        print(f"  {name:<48}{own_us / 1000:>10.1f} ms")
+    if proc.returncode:
+        sys.stderr.write("\n".join(line for line in proc.stderr.splitlines()
+                                    if not line.startswith("import time:")))
+        raise SystemExit(proc.returncode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import and build phase timings for a template script")
+    parser.add_argument("script")
+    parser.add_argument("--top", type=int, default=15, help="imports to list")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    # Everything after "--" is passed to the script untouched.
+    argv = sys.argv[1:]
+    script_argv = []
+    if "--" in argv:
+        argv, script_argv = argv[:argv.index("--")], argv[argv.index("--") + 1:]
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _run_child(args.script, args.child, script_argv)
+    else:
+        profile(args.script, script_argv, args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Simulated stack deployment to estimate create / update wall time.
+
+Walks the resource graph from tools/graph.py the way CloudFormation does: a
+resource starts as soon as everything it depends on is complete (optionally
+limited to ``--concurrency`` resources in flight) and takes a duration drawn
+from a per-type latency table. Runs many trials and reports the expected
+wall time, the critical path and how many resources are in flight over time.
+
+Latencies are triangular distributions ``[low, typical, high]`` in seconds.
+Override or extend the table with a JSON file mapping resource types (or
+logical ids) to a number or a ``[low, typical, high]`` list.
+
+    python -m tools.simulate build/aws-client-vpn-split-tunnel-example.json \\
+        [--runs 1000] [--latencies latencies.json] [--changed ADDomain ...]
+"""
+import argparse
+import heapq
+import json
+import random
+import sys
+from collections import Counter
+
+from tools.graph import DependencyGraph
+
+# Rough creation times in seconds: (low, typical, high).
+LATENCIES = {
+    "AWS::AppStream::Fleet": (600, 900, 1500),
+    "AWS::AppStream::ImageBuilder": (900, 1200, 1800),
+    "AWS::AppStream::Stack": (10, 20, 60),
+    "AWS::AppStream::StackFleetAssociation": (10, 20, 60),
+    "AWS::AppStream::StackUserAssociation": (5, 10, 30),
+    "AWS::AppStream::User": (2, 5, 15),
+    "AWS::CertificateManager::Certificate": (120, 300, 1800),
+    "AWS::DirectoryService::SimpleAD": (600, 900, 1500),
+    "AWS::EC2::ClientVpnAuthorizationRule": (10, 20, 60),
+    "AWS::EC2::ClientVpnEndpoint": (30, 60, 180),
+    "AWS::EC2::ClientVpnRoute": (10, 30, 90),
+    "AWS::EC2::ClientVpnTargetNetworkAssociation": (300, 480, 900),
+    "AWS::EC2::SecurityGroup": (3, 5, 15),
+    "AWS::EC2::SecurityGroupEgress": (2, 3, 10),
+    "AWS::EC2::SecurityGroupIngress": (2, 3, 10),
+    "AWS::ECR::Repository": (2, 3, 10),
+    "AWS::IAM::Group": (5, 10, 20),
+    "AWS::IAM::ManagedPolicy": (5, 10, 20),
+    "AWS::IAM::Policy": (10, 15, 30),
+    "AWS::IAM::Role": (10, 20, 40),
+    "AWS::Lambda::Function": (5, 10, 30),
+    "AWS::Logs::LogGroup": (1, 2, 5),
+    "AWS::Logs::LogStream": (1, 2, 5),
+    "AWS::SSM::Parameter": (2, 4, 10),
+    "AWS::WAFRegional::IPSet": (10, 20, 60),
+    "AWS::WAFRegional::Rule": (10, 20, 60),
+    "AWS::WAFRegional::WebACL": (10, 20, 60),
+    "AWS::WAFRegional::WebACLAssociation": (10, 30, 90),
+    "AWS::WAFv2::IPSet": (5, 10, 30),
+    "AWS::WAFv2::WebACL": (5, 10, 30),
+    "AWS::WAFv2::WebACLAssociation": (10, 30, 90),
+    "Custom::DNSCertificate": (120, 300, 1800),
+    "Custom::Password": (5, 10, 30),
+}
+DEFAULT_LATENCY = (5, 15, 60)
+BUCKET = 60
+
+
+class Simulator:
+    """Samples deployments of one template."""
+
+    def __init__(self, template, latencies=None, concurrency=None, changed=None):
+        self.graph = DependencyGraph(template)
+        self.order = self.graph.order()
+        table = dict(LATENCIES, **(latencies or {}))
+        self.latency = {}
+        for name in self.order:
+            spec = table.get(name, table.get(self.graph.resources[name]["Type"], DEFAULT_LATENCY))
+            low, typical, high = (spec, spec, spec) if isinstance(spec, (int, float)) else spec
+            # An update only spends time on resources that change.
+            self.latency[name] = (0, 0, 0) if changed is not None and name not in changed \
+                else (low, typical, high)
+        self.deps = {name: [t for t in self.graph.edges[name] if t in self.latency]
+                     for name in self.order}
+        self.dependents = {name: [] for name in self.order}
+        for name in self.order:
+            for target in self.deps[name]:
+                self.dependents[target].append(name)
+        self.concurrency = concurrency
+
+    def durations(self, rng=None):
+        """Draw one duration per resource; the typical values when ``rng`` is None."""
+        if rng is None:
+            return {name: typical for name, (_, typical, _) in self.latency.items()}
+        return {name: rng.triangular(low, high, typical) if high > low else low
+                for name, (low, typical, high) in self.latency.items()}
+
+    def run(self, durations):
+        """Return {resource: (start, finish)} for one deployment."""
+        waiting = {name: len(deps) for name, deps in self.deps.items()}
+        position = {name: i for i, name in enumerate(self.order)}
+        ready = [(0.0, position[name], name) for name, count in waiting.items() if not count]
+        heapq.heapify(ready)
+        running = []
+        times = {}
+        now = 0.0
+        while ready or running:
+            while ready and (self.concurrency is None or len(running) < self.concurrency):
+                available, _, name = heapq.heappop(ready)
+                start = max(now, available)
+                times[name] = (start, start + durations[name])
+                heapq.heappush(running, (start + durations[name], name))
+            now, name = heapq.heappop(running)
+            for dependent in self.dependents[name]:
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    heapq.heappush(ready, (now, position[dependent], dependent))
+        return times
+
+    def critical_path(self, times):
+        """Walk back from the last resource to finish through what it waited for."""
+        if not times:
+            return []
+        name = max(times, key=lambda n: (times[n][1], n))
+        path = [name]
+        while self.deps[name]:
+            start = times[name][0]
+            name = max(self.deps[name], key=lambda n: (times[n][1], n))
+            if times[name][1] < start:
+                # Started late because of the concurrency limit, not a dependency.
+                break
+            path.append(name)
+        return path[::-1]
+
+    def simulate(self, runs=1000, seed=0):
+        """Return (sorted wall times, {resource: share of runs on the critical path})."""
+        rng = random.Random(seed)
+        walls = []
+        critical = Counter()
+        for _ in range(runs):
+            times = self.run(self.durations(rng))
+            walls.append(max((finish for _, finish in times.values()), default=0.0))
+            critical.update(self.critical_path(times))
+        return sorted(walls), {name: count / runs for name, count in critical.items()}
+
+
+def parallelism(times, bucket=BUCKET):
+    """Return the peak number of resources in flight for each ``bucket`` seconds.
+
+    A sweep over the start and finish times; a resource finishing when another
+    starts does not overlap it.
+    """
+    # Finishes (-1) sort before starts (+1) at the same time.
+    events = sorted([(start, 1) for start, finish in times.values() if finish > start]
+                    + [(finish, -1) for start, finish in times.values() if finish > start])
+    end = max((finish for _, finish in times.values()), default=0.0)
+    peaks = []
+    running = 0
+    position = 0
+    for i in range(int(end // bucket) + 1):
+        low, high = i * bucket, (i + 1) * bucket
+        while position < len(events) and events[position][0] <= low:
+            running += events[position][1]
+            position += 1
+        peak = running
+        while position < len(events) and events[position][0] < high:
+            running += events[position][1]
+            position += 1
+            peak = max(peak, running)
+        peaks.append(peak)
+    return peaks
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def _minutes(seconds):
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate stack deployment time from a template")
+    parser.add_argument("template", help="template JSON file")
+    parser.add_argument("--runs", type=int, default=1000, help="Monte Carlo trials")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, help="resources in flight at once (default: unlimited)")
+    parser.add_argument("--latencies", help="JSON file of per-type or per-resource latencies")
+    parser.add_argument("--changed", nargs="+", help="simulate an update of only these resources")
+    parser.add_argument("--bucket", type=int, default=BUCKET, help="seconds per parallelism row")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        template = json.load(f1)
+    latencies = None
+    if args.latencies:
+        with open(args.latencies) as f1:
+            latencies = json.load(f1)
+    sim = Simulator(template, latencies, args.concurrency, args.changed)
+    if sim.graph.missing():
+        sys.exit(f"DependsOn targets do not exist: {sim.graph.missing()}")
+
+    walls, critical = sim.simulate(args.runs, args.seed)
+    kind = "update" if args.changed else "create"
+    print(f"{args.runs} simulated {kind}s of {len(sim.order)} resources "
+          f"(concurrency {args.concurrency or 'unlimited'}):")
+    mean = sum(walls) / len(walls) if walls else 0.0
+    print(f"  wall time  mean {_minutes(mean)}  p50 {_minutes(_percentile(walls, 0.5))}  "
+          f"p90 {_minutes(_percentile(walls, 0.9))}  max {_minutes(_percentile(walls, 1))}")
+
+    times = sim.run(sim.durations())
+    path = sim.critical_path(times)
+    print(f"Critical path with typical latencies ({_minutes(max((f for _, f in times.values()), default=0))}):")
+    for name in path:
+        start, finish = times[name]
+        if args.changed and name not in args.changed:
+            continue
+        print(f"  {name:<40}{sim.graph.resources[name]['Type']:<46}"
+              f"{_minutes(start):>7} - {_minutes(finish):<7}{critical.get(name, 0):>6.0%} of runs")
+    print(f"In flight per {args.bucket}s with typical latencies:")
+    for i, count in enumerate(parallelism(times, args.bucket)):
+        print(f"  {_minutes(i * args.bucket):>7}  {'#' * count} {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Scale benchmark for the WAF whitelist template.
+
+Generates synthetic whitelist CSVs for every size / mix combination, builds
+the template from each one in a fresh interpreter and records wall time,
+peak RSS (and optionally the tracemalloc peak), descriptor and IPSet counts
+and the size of the JSON body.
+
+    python benchmark.py --sizes 1000 10000 --mixes random ipv6 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'waf-ip-list.py')
+
+SIZES = [1000, 10000, 100000, 1000000]
+MIXES = ["random", "overlapping", "ipv6", "mixed"]
+
+
+## -- Synthetic inputs
+def _ipv4(rng, overlapping):
+    if overlapping:
+        # A small pool of /16s with nested and adjacent prefixes.
+        base = (10 << 24) | (rng.randrange(64) << 16)
+        prefix = rng.randrange(16, 33)
+        network = base | (rng.getrandbits(16) >> (32 - prefix) << (32 - prefix))
+    else:
+        prefix = rng.choice((24, 32, 32, 32))
+        network = rng.getrandbits(32) >> (32 - prefix) << (32 - prefix)
+    return f"{network >> 24}.{network >> 16 & 255}.{network >> 8 & 255}.{network & 255}/{prefix}"
+
+
+def _ipv6(rng):
+    prefix = rng.choice((48, 56, 64, 128))
+    network = (0x2001 << 112) | (rng.getrandbits(96) >> (128 - prefix) << (128 - prefix))
+    groups = [f"{network >> shift & 0xFFFF:x}" for shift in range(112, -16, -16)]
+    return ":".join(groups) + f"/{prefix}"
+
+
+def generate_csv(path, size, mix, seed=0):
+    """Write a whitelist CSV of ``size`` rows in the given mix."""
+    rng = random.Random(f"{seed}:{size}:{mix}")
+    with open(path, 'w') as csv_file:
+        csv_file.write('"domain","Cidr","Description"\n')
+        for row in range(size):
+            if mix == "ipv6" or (mix == "mixed" and row % 2):
+                cidr = _ipv6(rng)
+            else:
+                cidr = _ipv4(rng, mix == "overlapping")
+            csv_file.write(f'AWSWAF,{cidr},"Synthetic {row}"\n')
+    return path
+
+
+## -- Single case
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if platform.system() == "Darwin" else peak
+
+
+def run_case(csv_path, trace=False, max_shards=None):
+    """Build the template from ``csv_path`` and return the measurements."""
+    build_template = runpy.run_path(SCRIPT)["build_template"]
+    kwargs = {"max_shards": max_shards} if max_shards else {}
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    t = build_template(csv_path, **kwargs)
+    body = t.to_json()
+    wall = time.perf_counter() - start
+    ipsets = [r for r in t.resources.values()
+              if r.resource_type == "AWS::WAFRegional::IPSet"]
+    result = {
+        "wall_seconds": round(wall, 4),
+        "peak_rss_kb": _peak_rss_kb(),
+        "ipsets": len(ipsets),
+        "descriptors": sum(len(r.properties.get("IPSetDescriptors", ())) for r in ipsets),
+        "json_bytes": len(body.encode()),
+    }
+    if trace:
+        result["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def _run_isolated(csv_path, trace, max_shards):
+    """Run one case in a fresh interpreter so RSS is not shared between cases."""
+    command = [sys.executable, os.path.abspath(__file__), "--case", os.path.abspath(csv_path),
+               "--max-shards", str(max_shards)]
+    if trace:
+        command.append("--tracemalloc")
+    proc = subprocess.run(command, capture_output=True, text=True,
+                          cwd=os.path.dirname(SCRIPT))
+    if proc.returncode:
+        return {"error": proc.stderr.strip().splitlines()[-1]}
+    return json.loads(proc.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the WAF template build at scale")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--mixes", nargs="+", choices=MIXES, default=MIXES)
+    parser.add_argument("--workdir", help="where generated CSVs are kept (default: temp dir)")
+    parser.add_argument("--output", default="benchmark-results.json", help="results JSON file")
+    parser.add_argument("--tracemalloc", action="store_true", help="also record the tracemalloc peak (slower)")
+    parser.add_argument("--max-shards", type=int, default=1000,
+                        help="IPSet shards allowed so large lists still build (WebACL limit is 10)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.tracemalloc, args.max_shards)))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="waf-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    print(f"{'mix':<12}{'rows':>10}{'descriptors':>13}{'ipsets':>8}{'seconds':>10}{'rss MB':>9}{'json MB':>9}")
+    for mix in args.mixes:
+        for size in args.sizes:
+            csv_path = os.path.join(workdir, f"whitelist-{mix}-{size}.csv")
+            if not os.path.exists(csv_path):
+                generate_csv(csv_path, size, mix, args.seed)
+            result = {"mix": mix, "rows": size}
+            result.update(_run_isolated(csv_path, args.tracemalloc, args.max_shards))
+            results.append(result)
+            if "error" in result:
+                print(f"{mix:<12}{size:>10}  error: {result['error']}")
+            else:
+                print(f"{mix:<12}{size:>10}{result['descriptors']:>13}{result['ipsets']:>8}"
+                      f"{result['wall_seconds']:>10.2f}{result['peak_rss_kb'] / 1024:>9.1f}"
+                      f"{result['json_bytes'] / 1048576:>9.2f}")
+
+    with open(args.output, 'w') as f1:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, f1, indent=1)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Evaluate a generated WAF Regional WebACL against ELB access logs offline.
+
+Loads the template JSON written by waf-ip-list.py, compiles every IPSet into
+a sorted interval index and replays the client address of each access log
+line through the WebACL rules in priority order. Reports how many requests
+each rule (and the default action) would have decided and which source IPs
+would be blocked most often.
+
+    python evaluate.py waf-ip-list.json logs/*.log.gz --workers 8 --top 25
+"""
+import argparse
+import gzip
+import ipaddress
+import json
+import sys
+from bisect import bisect_right
+from heapq import heappop, heappush
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from whitelist import merge_intervals
+
+# First field of an ALB log line; classic ELB lines start with the timestamp.
+ALB_TYPES = {"http", "https", "h2", "grpcs", "ws", "wss"}
+DEFAULT = "Default"
+
+
+## -- Compiling the WebACL
+class IntervalIndex:
+    """Sorted, merged address intervals of one IPSet for bisect lookups."""
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, networks):
+        merged = merge_intervals((int(n.network_address), int(n.broadcast_address))
+                                 for n in networks)
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def __contains__(self, address):
+        i = bisect_right(self.starts, address) - 1
+        return i >= 0 and address <= self.ends[i]
+
+
+def _ref(value):
+    return value["Ref"] if isinstance(value, dict) else value
+
+
+def compile_acl(template):
+    """Return (rules, default action) for the first WebACL in the template.
+
+    Each rule is (logical id, action, [({version: IntervalIndex}, negated)]).
+    """
+    resources = template["Resources"]
+    acl = next((r["Properties"] for r in resources.values()
+                if r["Type"] == "AWS::WAFRegional::WebACL"), None)
+    if acl is None:
+        raise ValueError("no AWS::WAFRegional::WebACL in the template")
+    ipsets = {}
+    rules = []
+    for entry in sorted(acl.get("Rules", []), key=lambda r: int(r["Priority"])):
+        rule_id = _ref(entry["RuleId"])
+        predicates = []
+        for predicate in resources[rule_id]["Properties"].get("Predicates", []):
+            if predicate["Type"] != "IPMatch":
+                raise ValueError(f"{rule_id}: {predicate['Type']} predicates are not supported")
+            set_id = _ref(predicate["DataId"])
+            if set_id not in ipsets:
+                networks = [ipaddress.ip_network(d["Value"], strict=False) for d in
+                            resources[set_id]["Properties"].get("IPSetDescriptors", [])]
+                ipsets[set_id] = {
+                    version: IntervalIndex(n for n in networks if n.version == version)
+                    for version in (4, 6)
+                }
+            negated = str(predicate["Negated"]).lower() == "true"
+            predicates.append((ipsets[set_id], negated))
+        rules.append((rule_id, entry["Action"]["Type"], predicates))
+    return rules, acl["DefaultAction"]["Type"]
+
+
+def flatten(rules, default):
+    """Compile single-IPSet rules into one decision table per IP version.
+
+    Returns {version: (boundaries, decisions)} where decisions[i] applies from
+    boundaries[i] up to the next boundary, so one bisect replaces a lookup per
+    rule. Returns None when a rule has several or negated predicates.
+    """
+    if any(len(predicates) != 1 or predicates[0][1] for _, _, predicates in rules):
+        return None
+    tables = {}
+    for version in (4, 6):
+        spans = []
+        for rank, (_, _, predicates) in enumerate(rules):
+            index = predicates[0][0][version]
+            spans.extend((start, end, rank) for start, end in zip(index.starts, index.ends))
+        spans.sort()
+        points = sorted({0}.union(*((start, end + 1) for start, end, _ in spans)))
+        boundaries, decisions, active, i = [], [], [], 0
+        for point in points:
+            while i < len(spans) and spans[i][0] <= point:
+                heappush(active, (spans[i][2], spans[i][1]))
+                i += 1
+            while active and active[0][1] < point:
+                heappop(active)
+            decision = rules[active[0][0]][:2] if active else (DEFAULT, default)
+            if not decisions or decisions[-1] != decision:
+                boundaries.append(point)
+                decisions.append(decision)
+        tables[version] = (boundaries, decisions)
+    return tables
+
+
+def decide(rules, default, address, version):
+    """Return (rule id, action) for a client address; predicates are ANDed."""
+    for rule_id, action, predicates in rules:
+        if all((address in index[version]) != negated for index, negated in predicates):
+            return rule_id, action
+    return DEFAULT, default
+
+
+## -- Streaming logs
+def client_ip(line):
+    """Return the client IP of a classic ELB or ALB access log line."""
+    fields = line.split(" ", 4)
+    client = fields[3] if fields[0] in ALB_TYPES else fields[2]
+    return client.rsplit(":", 1)[0].strip("[]")
+
+
+def parse_address(ip):
+    """Return (int, version) for an IP string, with a fast path for IPv4."""
+    if ":" in ip:
+        return int(ipaddress.IPv6Address(ip)), 6
+    a, b, c, d = map(int, ip.split("."))
+    if a > 255 or b > 255 or c > 255 or d > 255:
+        raise ValueError(ip)
+    return a << 24 | b << 16 | c << 8 | d, 4
+
+
+_acl = None
+
+
+def _init(acl):
+    global _acl
+    _acl = acl
+
+
+def evaluate_file(path):
+    """Count decisions per rule and blocked source IPs for one log file."""
+    rules, default, tables = _acl
+    decisions = Counter()
+    blocked = Counter()
+    cache = {}
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", errors="replace") as log:
+        for line in log:
+            try:
+                ip = client_ip(line)
+            except IndexError:
+                decisions["(unparsed)"] += 1
+                continue
+            result = cache.get(ip)
+            if result is None:
+                try:
+                    address, version = parse_address(ip)
+                except ValueError:
+                    decisions["(unparsed)"] += 1
+                    continue
+                if tables:
+                    boundaries, outcomes = tables[version]
+                    result = outcomes[bisect_right(boundaries, address) - 1]
+                else:
+                    result = decide(rules, default, address, version)
+                cache[ip] = result
+            decisions[result] += 1
+            if result[1] == "BLOCK":
+                blocked[ip] += 1
+    return decisions, blocked
+
+
+def evaluate(acl, paths, workers=None):
+    """Evaluate log files against a compiled WebACL, one process per file."""
+    acl = acl + (flatten(*acl),)
+    decisions = Counter()
+    blocked = Counter()
+
+    def merge(results):
+        for file_decisions, file_blocked in results:
+            decisions.update(file_decisions)
+            blocked.update(file_blocked)
+
+    if len(paths) < 2 or workers == 1:
+        _init(acl)
+        merge(map(evaluate_file, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init,
+                                 initargs=(acl,)) as pool:
+            merge(pool.map(evaluate_file, paths))
+    return decisions, blocked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay ELB access logs through a generated WAF WebACL")
+    parser.add_argument("template", help="template JSON from waf-ip-list.py")
+    parser.add_argument("logs", nargs="+", help="ELB / ALB access log files (.gz allowed)")
+    parser.add_argument("--workers", type=int, help="processes used for log files")
+    parser.add_argument("--top", type=int, default=20, help="blocked source IPs to list")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    with open(args.template) as f1:
+        template = json.load(f1)
+    try:
+        acl = compile_acl(template)
+    except ValueError as e:
+        sys.exit(f"{args.template}: {e}")
+    decisions, blocked = evaluate(acl, args.logs, args.workers)
+    unparsed = decisions.pop("(unparsed)", 0)
+    rules, default = acl
+    per_rule = [(rule_id, action, decisions[rule_id, action]) for rule_id, action, _ in rules]
+    per_rule.append((DEFAULT, default, decisions[DEFAULT, default]))
+    top = blocked.most_common(args.top)
+
+    if args.json:
+        json.dump({
+            "rules": [{"rule": r, "action": a, "requests": c} for r, a, c in per_rule],
+            "unparsed": unparsed,
+            "top_blocked": [{"ip": ip, "requests": c} for ip, c in top],
+        }, sys.stdout, indent=1)
+        print()
+        return
+
+    total = sum(count for _, _, count in per_rule)
+    print(f"{total} requests evaluated, {unparsed} unparsed lines")
+    for rule_id, action, count in per_rule:
+        print(f"  {rule_id:<20}{action:<7}{count:>12}")
+    print(f"Top {len(top)} blocked source IPs:")
+    for ip, count in top:
+        print(f"  {ip:<40}{count:>12}")
+
+
+if __name__ == "__main__":
+    main()
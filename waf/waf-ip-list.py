@@ -1,71 +1,229 @@
-from troposphere import Base64, Select, FindInMap, GetAtt, GetAZs, Join, Output, If, And, Not, Or, Equals, Condition
-from troposphere import Parameter, Ref, Tags, Template
-from troposphere.wafregional import WebACL
-from troposphere.wafregional import Rule
-from troposphere.wafregional import IPSet
-from troposphere.wafregional import WebACLAssociation
-from troposphere.wafregional import *
+import argparse
 import os
-import csv
+import sys
 
-t = Template()
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tools.lazy import defer_imports, lazy_module
+from tools.output import write_template
+defer_imports()
 
-t.set_version("2010-09-09")
+from tools.partition import LargeTemplate, write_nested
 
-t.set_description("""\
+from troposphere import GetAtt, Parameter, Ref, Template
+from troposphere.wafregional import (
+    Action,
+    IPSet,
+    Predicates,
+    Rule,
+    Rules,
+    WebACL,
+    WebACLAssociation,
+)
+
+# Only loaded when --wafv2 is used.
+wafv2 = lazy_module("troposphere.wafv2")
+
+from whitelist import (
+    RULE_LIMIT,
+    WAFV2_IPSET_QUOTA,
+    WAFV2_IPV4_PREFIXES,
+    WAFV2_IPV6_PREFIXES,
+    WAFV2_WCU_LIMIT,
+    aggregate,
+    read_cidrs,
+    render_shards,
+    shard_blocks,
+    webacl_capacity,
+)
+
+
+def build_template(csv_path='./WAF_IP_Whitelist.csv', shards=None, workers=None,
+                   max_shards=RULE_LIMIT, template_class=Template):
+    t = template_class()
+
+    t.set_version("2010-09-09")
+
+    t.set_description("""\
 Custom WAF using a list of IP addresses for access.""")
 
-## -- Parameters
-ELBARN = t.add_parameter(
-    Parameter(
-        "ELBARN",
-        Type="String",
-        Description="ARN of the ELB to associate with the WAF"
+    ## -- Parameters
+    ELBARN = t.add_parameter(
+        Parameter(
+            "ELBARN",
+            Type="String",
+            Description="ARN of the ELB to associate with the WAF"
+        )
     )
-)
 
-## -- Resources
-WAFWebACL = t.add_resource(
-    WebACL(
-        "WAFWebACL",
-        DefaultAction=Action(Type="BLOCK"),
-        Rules=[Rules(Action=Action(Type="ALLOW"),Priority=1,RuleId=Ref("WAFRule1"))],
-        Name="WAFWebACL",
-        MetricName="WAFWebACL",
+    ## -- Whitelist
+    # Rows are deduplicated and adjacent / overlapping ranges collapsed, then
+    # spread over shards by a stable hash so one new CIDR only changes one
+    # IPSet. Shard N is always Whitelist<N> / WAFRule<N> at priority N.
+    blocks, stats = aggregate(read_cidrs(csv_path))
+    buckets = shard_blocks(blocks, shards, max_shards=max_shards)
+    print(f"WAF whitelist: {stats.rows} rows in, {stats.duplicates} duplicates, "
+          f"{stats.descriptors} descriptors out in {len(buckets)} IPSet(s)",
+          file=sys.stderr)
+
+    ## -- Resources
+    rules = []
+    for index, descriptors in enumerate(render_shards(buckets, workers), start=1):
+        Whitelist = IPSet(
+            f"Whitelist{index}",
+            Name=f"Whitelist{index}",
+        )
+        # DescriptorArray serializes to the IPSetDescriptors list without a
+        # troposphere object per row, so it is set past property validation.
+        Whitelist.properties["IPSetDescriptors"] = descriptors
+        t.add_resource(Whitelist)
+
+        t.add_resource(
+            Rule(
+                f"WAFRule{index}",
+                Predicates=[Predicates(DataId=Ref(f"Whitelist{index}"),Type="IPMatch",Negated="false")],
+                Name=f"WAFRule{index}",
+                MetricName=f"WAFRule{index}",
+            )
+        )
+        rules.append(Rules(Action=Action(Type="ALLOW"),Priority=index,RuleId=Ref(f"WAFRule{index}")))
+
+    WAFWebACL = t.add_resource(
+        WebACL(
+            "WAFWebACL",
+            DefaultAction=Action(Type="BLOCK"),
+            Rules=rules,
+            Name="WAFWebACL",
+            MetricName="WAFWebACL",
+        )
     )
-)
 
-WAFRule1 = t.add_resource(
-    Rule(
-        "WAFRule1",
-        Predicates=[Predicates(DataId=Ref("Whitelist1"),Type="IPMatch",Negated="false")],
-        Name="WAFRule1",
-        MetricName="WAFRule1",
+    WAFELBAssociation = t.add_resource(WebACLAssociation(
+        "WAFELBAssociation",
+        ResourceArn=Ref("ELBARN"),
+        WebACLId=Ref("WAFWebACL")
+    ))
+
+    return t
+
+
+def build_wafv2_template(csv_path='./WAF_IP_Whitelist.csv', shards=None, workers=None,
+                         wcu_budget=WAFV2_WCU_LIMIT, template_class=Template):
+    t = template_class()
+
+    t.set_version("2010-09-09")
+
+    t.set_description("""\
+Custom WAFv2 WebACL using a list of IP addresses for access.""")
+
+    ## -- Parameters
+    ELBARN = t.add_parameter(
+        Parameter(
+            "ELBARN",
+            Type="String",
+            Description="ARN of the ELB to associate with the WAF"
+        )
     )
-)
 
-whitelist = []
-with open('./WAF_IP_Whitelist.csv', mode='r') as csv_file:
-    csv_reader = csv.DictReader(csv_file)
-    line_count = 0
-    for row in csv_reader:
-        TIPSetDescriptors=IPSetDescriptors(Type="IPV4", Value=row["Cidr"])
-        whitelist.append(TIPSetDescriptors)
-    #print(TIPSetDescriptors)
-
-Whitelist1 = t.add_resource(IPSet(
-    "Whitelist1",
-    Name="Whitelist1",
-    IPSetDescriptors=whitelist,
-))
-
-WAFELBAssociation = t.add_resource(WebACLAssociation(
-    "WAFELBAssociation",
-    ResourceArn=Ref("ELBARN"),
-    WebACLId=Ref("WAFWebACL")
-))
-
-# Print CloudFormation Template
-f1 = open('./' + (os.path.splitext(os.path.basename(__file__))[0]) + '.json', 'w+')
-print(t.to_json(), file=f1)
-print(t.to_json())
+    ## -- Whitelist
+    # IPv4 and IPv6 always go to separate IPSets, each sharded the same way as
+    # the regional template. IPv6 rules are numbered after the IPSet quota so
+    # IPv4 shard changes never renumber them.
+    blocks, stats = aggregate(read_cidrs(csv_path), WAFV2_IPV4_PREFIXES, WAFV2_IPV6_PREFIXES)
+    shard_sets = []
+    for version, offset in (("IPV4", 0), ("IPV6", WAFV2_IPSET_QUOTA)):
+        wanted = 4 if version == "IPV4" else 6
+        version_blocks = [block for block in blocks if block[0] == wanted]
+        if version_blocks:
+            buckets = shard_blocks(version_blocks, shards, max_shards=WAFV2_IPSET_QUOTA)
+            shard_sets.extend((f"Whitelist{version}Shard{index}", version, offset + index, bucket)
+                              for index, bucket in enumerate(buckets, start=1))
+    if len(shard_sets) > WAFV2_IPSET_QUOTA:
+        raise ValueError(f"{len(shard_sets)} IPSets exceed the quota of {WAFV2_IPSET_QUOTA}")
+
+    ## -- Resources
+    rules = []
+    render_shards([bucket for _, _, _, bucket in shard_sets], workers)
+    for name, version, priority, addresses in shard_sets:
+        t.add_resource(
+            wafv2.IPSet(
+                name,
+                Name=name,
+                Addresses=addresses.values,
+                IPAddressVersion=version,
+                Scope="REGIONAL",
+            )
+        )
+        rules.append(
+            wafv2.WebACLRule(
+                Name=f"Allow{name}",
+                Priority=priority,
+                Action=wafv2.RuleAction(Allow=wafv2.AllowAction()),
+                Statement=wafv2.Statement(
+                    IPSetReferenceStatement=wafv2.IPSetReferenceStatement(
+                        Arn=GetAtt(name, "Arn"),
+                    )
+                ),
+                VisibilityConfig=wafv2.VisibilityConfig(
+                    CloudWatchMetricsEnabled=True,
+                    MetricName=f"Allow{name}",
+                    SampledRequestsEnabled=True,
+                ),
+            )
+        )
+
+    # Fail before anything is serialized or deployed if the ACL is too big.
+    capacity = webacl_capacity([rule.to_dict() for rule in rules])
+    print(f"WAFv2 whitelist: {stats.rows} rows in, {stats.duplicates} duplicates, "
+          f"{stats.descriptors} addresses out in {len(shard_sets)} IPSet(s), "
+          f"{capacity}/{wcu_budget} WCU", file=sys.stderr)
+    if capacity > wcu_budget:
+        raise ValueError(f"WebACL needs {capacity} WCU, budget is {wcu_budget}")
+
+    WAFWebACL = t.add_resource(
+        wafv2.WebACL(
+            "WAFWebACL",
+            DefaultAction=wafv2.DefaultAction(Block=wafv2.BlockAction()),
+            Rules=rules,
+            Name="WAFWebACL",
+            Scope="REGIONAL",
+            VisibilityConfig=wafv2.VisibilityConfig(
+                CloudWatchMetricsEnabled=True,
+                MetricName="WAFWebACL",
+                SampledRequestsEnabled=True,
+            ),
+        )
+    )
+
+    WAFELBAssociation = t.add_resource(wafv2.WebACLAssociation(
+        "WAFELBAssociation",
+        ResourceArn=Ref("ELBARN"),
+        WebACLArn=GetAtt("WAFWebACL", "Arn")
+    ))
+
+    return t
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the WAF IP whitelist template")
+    parser.add_argument("--csv", default='./WAF_IP_Whitelist.csv', help="whitelist CSV with a Cidr column")
+    parser.add_argument("--shards", type=int, help="number of IPSet / Rule shards (default: as few as fit)")
+    parser.add_argument("--workers", type=int, help="processes used to build shards")
+    parser.add_argument("--wafv2", action="store_true", help="generate WAFv2 resources instead of WAF Regional")
+    parser.add_argument("--wcu-budget", type=int, default=WAFV2_WCU_LIMIT, help="WAFv2 WebACL capacity budget")
+    parser.add_argument("--nested", action="store_true",
+                        help="write a parent stack plus nested stacks of at most 450 resources")
+    args = parser.parse_args()
+
+    template_class = LargeTemplate if args.nested else Template
+    if args.wafv2:
+        t = build_wafv2_template(args.csv, args.shards, args.workers, args.wcu_budget, template_class)
+        suffix = '-wafv2'
+    else:
+        t = build_template(args.csv, args.shards, args.workers, template_class=template_class)
+        suffix = ''
+
+    # Print CloudFormation Template
+    if args.nested:
+        write_nested(t, __file__, suffix)
+    else:
+        write_template(t, __file__, suffix)
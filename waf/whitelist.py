@@ -0,0 +1,263 @@
+"""Streaming ingestion and aggregation of the WAF IP whitelist CSV.
+
+Rows are parsed one at a time, duplicates are dropped and adjacent or
+overlapping networks are collapsed into the smallest set of CIDRs that WAF
+Regional (or WAFv2) accepts for an IP set entry.
+"""
+import csv
+import ipaddress
+import zlib
+from bisect import bisect_left
+from array import array
+from collections import namedtuple
+
+# Prefix lengths accepted by WAF Regional IPSetDescriptors.
+IPV4_PREFIXES = (8,) + tuple(range(16, 33))
+IPV6_PREFIXES = (24, 32, 48, 56, 64, 128)
+
+# WAFv2 IPSets accept any prefix except /0.
+WAFV2_IPV4_PREFIXES = tuple(range(1, 33))
+WAFV2_IPV6_PREFIXES = tuple(range(1, 129))
+
+# Descriptors one row may expand to. A row whose prefix is not accepted is
+# split into blocks of the next longer accepted prefix; an IPv6 /112 would
+# otherwise become 65,536 /128 descriptors.
+ROW_EXPANSION_LIMIT = 256
+
+IngestStats = namedtuple("IngestStats", ["rows", "duplicates", "descriptors"])
+
+
+class read_cidrs:
+    """Iterate an ip_network for every row of the whitelist CSV.
+
+    ``location`` is the ``path:line`` of the row last read, for errors raised
+    while the rows are consumed.
+    """
+
+    def __init__(self, path, column="Cidr"):
+        self.path = path
+        self.column = column
+        self.location = None
+
+    def __iter__(self):
+        with open(self.path, mode='r', newline='') as csv_file:
+            csv_reader = csv.DictReader(csv_file)
+            for row in csv_reader:
+                self.location = f"{self.path}:{csv_reader.line_num}"
+                value = (row.get(self.column) or "").strip()
+                try:
+                    yield ipaddress.ip_network(value, strict=False)
+                except ValueError as e:
+                    raise ValueError(f"{self.location}: invalid {self.column} {value!r}") from e
+
+
+def merge_intervals(networks):
+    """Merge (start, end) intervals that overlap or touch."""
+    merged = []
+    for start, end in sorted(networks):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _cover(start, end, bits, prefixes):
+    """Split [start, end] into the fewest aligned blocks with allowed prefixes."""
+    blocks = []
+    while start <= end:
+        align = (start & -start).bit_length() - 1 if start else bits
+        fit = (end - start + 1).bit_length() - 1
+        prefix = prefixes[bisect_left(prefixes, bits - min(align, fit))]
+        blocks.append((start, prefix))
+        start += 1 << (bits - prefix)
+    return blocks
+
+
+def aggregate(networks, ipv4_prefixes=IPV4_PREFIXES, ipv6_prefixes=IPV6_PREFIXES):
+    """Collapse networks into (version, network int, prefix) tuples.
+
+    Only the given prefix lengths are emitted. Returns the aggregated blocks,
+    IPv4 first, plus an IngestStats. Raises ValueError for a row that would
+    expand to more than ROW_EXPANSION_LIMIT descriptors.
+    """
+    seen = {4: set(), 6: set()}
+    allowed = {4: ipv4_prefixes, 6: ipv6_prefixes}
+    rows = duplicates = 0
+    for network in networks:
+        rows += 1
+        prefixes = allowed[network.version]
+        longer = prefixes[bisect_left(prefixes, network.prefixlen)]
+        if 1 << (longer - network.prefixlen) > ROW_EXPANSION_LIMIT:
+            where = getattr(networks, "location", None) or f"row {rows}"
+            raise ValueError(
+                f"{where}: {network} would be split into {1 << (longer - network.prefixlen):,} "
+                f"/{longer} descriptors; accepted IPv{network.version} prefixes are "
+                f"{', '.join(f'/{p}' for p in prefixes)}"
+            )
+        first = int(network.network_address)
+        key = (first, first + network.num_addresses - 1)
+        bucket = seen[network.version]
+        if key in bucket:
+            duplicates += 1
+        else:
+            bucket.add(key)
+
+    blocks = []
+    for version, bits, prefixes in ((4, 32, ipv4_prefixes), (6, 128, ipv6_prefixes)):
+        for start, end in merge_intervals(seen[version]):
+            blocks.extend((version, network, prefix)
+                          for network, prefix in _cover(start, end, bits, prefixes))
+    return blocks, IngestStats(rows, duplicates, len(blocks))
+
+
+## -- Compact descriptors
+class DescriptorArray:
+    """Packed IPSetDescriptors for one IPSet.
+
+    Networks and prefix lengths live in flat arrays rather than one
+    troposphere IPSetDescriptors object per row. ``to_dict`` renders the same
+    JSON shape, so the object can be dropped straight into an IPSet.
+    """
+    __slots__ = ("ipv4", "ipv4_prefixes", "ipv6_high", "ipv6_low",
+                 "ipv6_prefixes", "values")
+
+    def __init__(self, blocks=()):
+        self.ipv4 = array("L")
+        self.ipv4_prefixes = array("B")
+        self.ipv6_high = array("Q")
+        self.ipv6_low = array("Q")
+        self.ipv6_prefixes = array("B")
+        self.values = None
+        for block in blocks:
+            self.append(*block)
+
+    def append(self, version, network, prefix):
+        if version == 4:
+            self.ipv4.append(network)
+            self.ipv4_prefixes.append(prefix)
+        else:
+            self.ipv6_high.append(network >> 64)
+            self.ipv6_low.append(network & 0xFFFFFFFFFFFFFFFF)
+            self.ipv6_prefixes.append(prefix)
+        self.values = None
+
+    def __len__(self):
+        return len(self.ipv4) + len(self.ipv6_low)
+
+    def __iter__(self):
+        """Yield (version, network int, prefix) blocks, IPv4 first."""
+        for network, prefix in zip(self.ipv4, self.ipv4_prefixes):
+            yield 4, network, prefix
+        for high, low, prefix in zip(self.ipv6_high, self.ipv6_low, self.ipv6_prefixes):
+            yield 6, high << 64 | low, prefix
+
+    def render(self):
+        """Return the descriptor Value strings in order."""
+        values = [f"{n >> 24}.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}/{p}"
+                  for n, p in zip(self.ipv4, self.ipv4_prefixes)]
+        values.extend(f"{ipaddress.IPv6Address(high << 64 | low)}/{p}"
+                      for high, low, p in zip(self.ipv6_high, self.ipv6_low,
+                                              self.ipv6_prefixes))
+        return values
+
+    def to_dict(self):
+        if self.values is None:
+            self.values = self.render()
+        ipv4 = len(self.ipv4)
+        return [{"Type": "IPV4" if i < ipv4 else "IPV6", "Value": value}
+                for i, value in enumerate(self.values)]
+
+
+## -- Sharding
+# WAF Regional limits: descriptors per IPSet and rules per WebACL. Predicates
+# inside one rule are ANDed, so every shard needs its own rule.
+IPSET_LIMIT = 10000
+RULE_LIMIT = 10
+PARALLEL_THRESHOLD = 20000
+
+
+def _shard_key(block):
+    version, network, prefix = block
+    return zlib.crc32(f"{version}:{network}:{prefix}".encode())
+
+
+def shard_blocks(blocks, shards=None, limit=IPSET_LIMIT, max_shards=RULE_LIMIT):
+    """Distribute blocks over DescriptorArray shards by a stable hash.
+
+    A block always lands in the same shard for a given shard count, so adding
+    or removing one CIDR only touches one shard. Without an explicit count the
+    smallest count that keeps every shard under ``limit`` is used. An explicit
+    count must not exceed ``max_shards`` or leave a shard empty.
+    """
+    keys = [_shard_key(block) for block in blocks]
+    if shards:
+        if shards > max_shards:
+            raise ValueError(f"{shards} shards exceed the limit of {max_shards}")
+        counts = [shards]
+    else:
+        counts = range(max(1, -(-len(blocks) // limit)), max_shards + 1)
+    for count in counts:
+        sizes = [0] * count
+        for key in keys:
+            sizes[key % count] += 1
+        if shards and blocks and not min(sizes):
+            raise ValueError(f"{shards} shards leave {sizes.count(0)} of them empty for "
+                             f"{len(blocks)} descriptors; use fewer shards")
+        if max(sizes) <= limit:
+            buckets = [DescriptorArray() for _ in range(count)]
+            for block, key in zip(blocks, keys):
+                buckets[key % count].append(*block)
+            return buckets
+    raise ValueError(
+        f"{len(blocks)} descriptors do not fit in {shards or max_shards} IPSets of "
+        f"{limit} descriptors each"
+    )
+
+
+def _render(shard):
+    return shard.render()
+
+
+def render_shards(buckets, workers=None):
+    """Render every shard's descriptor values, in parallel for big lists."""
+    if len(buckets) < 2 or sum(map(len, buckets)) < PARALLEL_THRESHOLD:
+        rendered = map(_render, buckets)
+    else:
+        # Imported here: multiprocessing is slow to import and most lists
+        # never need it.
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rendered = list(pool.map(_render, buckets))
+    for shard, values in zip(buckets, rendered):
+        shard.values = values
+    return buckets
+
+
+## -- WAFv2 capacity
+# Web ACL Capacity Units per statement; And / Or / Not cost their children.
+WAFV2_WCU_LIMIT = 1500
+WAFV2_IPSET_QUOTA = 100
+WCU_COSTS = {
+    "IPSetReferenceStatement": 1,
+    "GeoMatchStatement": 1,
+    "LabelMatchStatement": 1,
+}
+
+
+def statement_capacity(statement):
+    """Return the WCU cost of a serialized WAFv2 Statement dict."""
+    (kind, body), = statement.items()
+    if kind in ("AndStatement", "OrStatement"):
+        return sum(statement_capacity(child) for child in body["Statements"])
+    if kind == "NotStatement":
+        return statement_capacity(body["Statement"])
+    if kind not in WCU_COSTS:
+        raise ValueError(f"no WCU cost known for {kind}")
+    return WCU_COSTS[kind]
+
+
+def webacl_capacity(rules):
+    """Return the total WCU cost of serialized WAFv2 WebACL rules."""
+    return sum(statement_capacity(rule["Statement"]) for rule in rules)